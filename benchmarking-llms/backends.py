@@ -0,0 +1,179 @@
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+
+
+@dataclass
+class Completion:
+    text: str
+    ttft: float           # seconds until the first generated text arrived
+    latency: float        # seconds until the response was complete
+    prompt_tokens: int
+    completion_tokens: int
+
+
+class MockBackend:
+    """
+    Deterministic stand-in for a model server: answers with the reference
+    text, after a time-to-first-token and a per-token delay derived from the
+    prompt id. Used to check the harness and as a zero-cost baseline.
+    """
+
+    def __init__(self, ttft_ms=150, tokens_per_sec=40, jitter=0.2, seed=0, **_):
+        self.ttft = ttft_ms / 1000
+        self.tokens_per_sec = tokens_per_sec
+        self.jitter = jitter
+        self.seed = seed
+
+    async def generate(self, item, prompt, max_tokens):
+        rng = random.Random(f"{self.seed}:{item['id']}")
+        factor = 1 + rng.uniform(-self.jitter, self.jitter)
+        words = (item.get('reference') or 'ok').split()[:max_tokens]
+        start = time.perf_counter()
+        await asyncio.sleep(self.ttft * factor)
+        ttft = time.perf_counter() - start
+        await asyncio.sleep(len(words) / self.tokens_per_sec * factor)
+        return Completion(' '.join(words), ttft, time.perf_counter() - start, len(prompt.split()), len(words))
+
+    async def close(self):
+        pass
+
+
+class OpenAIHTTPBackend:
+    """
+    Any OpenAI-compatible /chat/completions endpoint (OpenAI, vLLM, TGI,
+    llama.cpp server). Responses are streamed so time-to-first-token can be
+    measured; token counts come from the usage block when the server sends
+    one, otherwise every streamed delta counts as one token.
+    """
+
+    def __init__(self, model, base_url='https://api.openai.com/v1', api_key_env='OPENAI_API_KEY',
+                 temperature=0.0, timeout=300, **_):
+        import httpx
+
+        self.model = model
+        self.temperature = temperature
+        headers = {}
+        if os.getenv(api_key_env or ''):
+            headers['Authorization'] = f'Bearer {os.getenv(api_key_env)}'
+        self.client = httpx.AsyncClient(base_url=base_url.rstrip('/'), headers=headers, timeout=timeout,
+                                        limits=httpx.Limits(max_connections=None, max_keepalive_connections=100))
+
+    async def generate(self, item, prompt, max_tokens):
+        payload = {
+            'model': self.model,
+            'messages': [{'role': 'user', 'content': prompt}],
+            'max_tokens': max_tokens,
+            'temperature': self.temperature,
+            'stream': True,
+            'stream_options': {'include_usage': True},
+        }
+        chunks = []
+        usage = None
+        ttft = None
+        start = time.perf_counter()
+        async with self.client.stream('POST', '/chat/completions', json=payload) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith('data:'):
+                    continue
+                data = line[5:].strip()
+                if data == '[DONE]':
+                    break
+                event = json.loads(data)
+                usage = event.get('usage') or usage
+                for choice in event.get('choices') or []:
+                    content = (choice.get('delta') or {}).get('content')
+                    if content:
+                        if ttft is None:
+                            ttft = time.perf_counter() - start
+                        chunks.append(content)
+        latency = time.perf_counter() - start
+        usage = usage or {}
+        return Completion(
+            ''.join(chunks),
+            ttft if ttft is not None else latency,
+            latency,
+            usage.get('prompt_tokens', 0),
+            usage.get('completion_tokens', len(chunks)),
+        )
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class HFBackend:
+    """
+    A Hugging Face model loaded in this process (e.g. the merged Llama-2
+    fine-tune). generate() runs on a worker thread with a streamer for
+    time-to-first-token. Requests are served one at a time, so latency at
+    higher concurrency includes queueing, as it would behind a single
+    in-process model.
+    """
+
+    def __init__(self, model, dtype='fp32', chat_format='llama2', **_):
+        import torch
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
+        self.torch = torch
+        self.tokenizer = AutoTokenizer.from_pretrained(model)
+        torch_dtype = {'bf16': torch.bfloat16, 'fp16': torch.float16}.get(dtype, torch.float32)
+        self.model = AutoModelForCausalLM.from_pretrained(model, torch_dtype=torch_dtype)
+        if dtype == 'int8':
+            self.model = torch.ao.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.model.eval()
+        self.chat_format = chat_format
+        self.lock = threading.Lock()
+
+    def _generate(self, prompt, max_tokens):
+        from transformers import TextIteratorStreamer
+
+        text = f'[INST] {prompt.strip()} [/INST]' if self.chat_format == 'llama2' else prompt
+        inputs = self.tokenizer(text, return_tensors='pt').to(self.model.device)
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        with self.lock:
+            start = time.perf_counter()
+            worker = threading.Thread(target=self._run_generate, args=(inputs, streamer, max_tokens))
+            worker.start()
+            ttft = None
+            pieces = []
+            for piece in streamer:
+                if ttft is None and piece:
+                    ttft = time.perf_counter() - start
+                pieces.append(piece)
+            worker.join()
+            latency = time.perf_counter() - start
+        output = ''.join(pieces).strip()
+        return Completion(
+            output,
+            ttft if ttft is not None else latency,
+            latency,
+            int(inputs['input_ids'].shape[1]),
+            len(self.tokenizer(output, add_special_tokens=False)['input_ids']),
+        )
+
+    def _run_generate(self, inputs, streamer, max_tokens):
+        with self.torch.inference_mode():
+            self.model.generate(**inputs, max_new_tokens=max_tokens, do_sample=False, streamer=streamer,
+                                pad_token_id=self.tokenizer.eos_token_id)
+
+    async def generate(self, item, prompt, max_tokens):
+        return await asyncio.to_thread(self._generate, prompt, max_tokens)
+
+    async def close(self):
+        pass
+
+
+BACKENDS = {'mock': MockBackend, 'openai': OpenAIHTTPBackend, 'hf': HFBackend}
+
+
+def build_backend(config):
+    options = dict(config)
+    kind = options.pop('backend')
+    if kind not in BACKENDS:
+        raise ValueError(f"Unknown backend '{kind}', expected one of {sorted(BACKENDS)}")
+    return BACKENDS[kind](**options)
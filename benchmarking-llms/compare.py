@@ -0,0 +1,59 @@
+import argparse
+import glob
+import json
+
+# Print benchmark results side by side:
+#   python compare.py results/*.json
+#   python compare.py results/gpt-4o-*.json results/llama2-finetune-*.json --concurrency 4
+
+COLUMNS = [
+    ('run', 22, lambda run, level: run['name']),
+    ('date', 10, lambda run, level: run['timestamp'][:10]),
+    ('conc', 4, lambda run, level: level['concurrency']),
+    ('req/s', 7, lambda run, level: f"{level['requests_per_sec']:.2f}"),
+    ('ttft p50', 8, lambda run, level: _seconds(level['ttft']['p50'])),
+    ('ttft p95', 8, lambda run, level: _seconds(level['ttft']['p95'])),
+    ('lat p50', 8, lambda run, level: _seconds(level['latency']['p50'])),
+    ('lat p95', 8, lambda run, level: _seconds(level['latency']['p95'])),
+    ('lat p99', 8, lambda run, level: _seconds(level['latency']['p99'])),
+    ('tok/s', 7, lambda run, level: f"{level['output_tokens_per_sec']:.0f}"),
+    ('err', 4, lambda run, level: level['errors']),
+    ('$/1k req', 9, lambda run, level: f"{level['cost_usd_per_1k_requests']:.3f}" if level['cost_usd_per_1k_requests'] is not None else '-'),
+    ('qa F1', 6, lambda run, level: _quality(level, 'qa', 'token_f1')),
+    ('qa RL', 6, lambda run, level: _quality(level, 'qa', 'rouge_l')),
+    ('ho RL', 6, lambda run, level: _quality(level, 'handout', 'rouge_l')),
+]
+
+
+def _seconds(value):
+    return f'{value:.2f}s' if value is not None else '-'
+
+
+def _quality(level, task, metric):
+    scores = level['quality'].get(task)
+    return f'{scores[metric]:.3f}' if scores else '-'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare benchmark result files')
+    parser.add_argument('results', nargs='+', help='result json files or globs')
+    parser.add_argument('--concurrency', type=int, default=None, help='only show this concurrency level')
+    args = parser.parse_args()
+
+    paths = sorted({path for pattern in args.results for path in glob.glob(pattern)})
+    rows = []
+    for path in paths:
+        with open(path) as f:
+            result = json.load(f)
+        for level in result['levels']:
+            if args.concurrency is None or level['concurrency'] == args.concurrency:
+                rows.append((result['run'], level))
+
+    rows.sort(key=lambda row: (row[1]['concurrency'], row[0]['name'], row[0]['timestamp']))
+    print('  '.join(name.ljust(width) for name, width, _ in COLUMNS))
+    for run, level in rows:
+        print('  '.join(str(value(run, level)).ljust(width) for _, width, value in COLUMNS))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+import re
+from collections import Counter
+
+
+def tokens(text):
+    return re.findall(r'\w+', (text or '').lower())
+
+
+def token_f1(prediction, reference):
+    """SQuAD-style overlap F1 between bag-of-words of prediction and reference."""
+    pred, ref = tokens(prediction), tokens(reference)
+    common = sum((Counter(pred) & Counter(ref)).values())
+    if not pred or not ref or not common:
+        return 0.0
+    precision = common / len(pred)
+    recall = common / len(ref)
+    return 2 * precision * recall / (precision + recall)
+
+
+def rouge_l(prediction, reference):
+    """ROUGE-L F-measure: longest common subsequence of words."""
+    pred, ref = tokens(prediction), tokens(reference)
+    if not pred or not ref:
+        return 0.0
+    previous = [0] * (len(ref) + 1)
+    for p in pred:
+        current = [0]
+        for j, r in enumerate(ref, 1):
+            current.append(previous[j - 1] + 1 if p == r else max(previous[j], current[j - 1]))
+        previous = current
+    lcs = previous[-1]
+    if not lcs:
+        return 0.0
+    precision = lcs / len(pred)
+    recall = lcs / len(ref)
+    return 2 * precision * recall / (precision + recall)
+
+
+def percentiles(values):
+    if not values:
+        return {'p50': None, 'p95': None, 'p99': None, 'mean': None}
+    values = sorted(values)
+
+    def pick(q):
+        return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+    return {'p50': pick(0.50), 'p95': pick(0.95), 'p99': pick(0.99), 'mean': sum(values) / len(values)}
@@ -0,0 +1,185 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import time
+from datetime import datetime, timezone
+import yaml
+from backends import build_backend
+from quality import percentiles, rouge_l, token_f1
+
+# Same prompts as the RAG API (public-health-rag+llm), with the retrieved
+# context given inline so every backend answers from the same material.
+QA_TEMPLATE = """Use the following pieces of context to answer the question at the end.
+If you don't know the answer, just say Sorry, I am unable to give you that information. Don't try to make up an answer.
+
+{context}
+
+Question: {question}
+Provide a concise answer in 1-4 sentences:"""
+
+HANDOUT_TEMPLATE = """You are a highly skilled trainer tasked with creating a well-structured and detailed teaching handout based on Malawian Technical Guidelines for Integrated Disease Surveliance and Response that are used to train Public Health Surveliance Assintants on the following Topic: {topic}.
+The handout should contain an introduction, key points, detailed concepts, examples and a conclusion.
+Use "\\n\\n---\\n\\n" to separate slides."""
+
+RUN_KEYS = {'name', 'pricing', 'max_tokens'}
+
+
+def load_items(paths):
+    items = []
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            items.extend(json.loads(line) for line in f if line.strip())
+    return items
+
+
+def render(item):
+    if item['task'] == 'handout':
+        return HANDOUT_TEMPLATE.format(topic=item['topic'])
+    return QA_TEMPLATE.format(context=item.get('context', ''), question=item['question'])
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_level(backend, items, concurrency, repeat, max_tokens):
+    """Closed loop: `concurrency` requests are in flight until every item has run `repeat` times."""
+    semaphore = asyncio.Semaphore(concurrency)
+    samples = []
+
+    async def one(item, attempt):
+        async with semaphore:
+            sample = {'id': item['id'], 'task': item['task'], 'attempt': attempt}
+            try:
+                completion = await backend.generate(item, render(item), max_tokens[item['task']])
+            except Exception as e:
+                sample['error'] = f'{type(e).__name__}: {e}'
+            else:
+                sample.update(
+                    ttft=completion.ttft,
+                    latency=completion.latency,
+                    prompt_tokens=completion.prompt_tokens,
+                    completion_tokens=completion.completion_tokens,
+                    # decode speed after the first token
+                    tokens_per_sec=(completion.completion_tokens - 1) / (completion.latency - completion.ttft)
+                    if completion.completion_tokens > 1 and completion.latency > completion.ttft else None,
+                    token_f1=token_f1(completion.text, item.get('reference')),
+                    rouge_l=rouge_l(completion.text, item.get('reference')),
+                    output=completion.text,
+                )
+            samples.append(sample)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(item, attempt) for attempt in range(repeat) for item in items))
+    return samples, time.perf_counter() - start
+
+
+def summarize(samples, wall_seconds, concurrency, pricing):
+    ok = [s for s in samples if 'error' not in s]
+    prompt_tokens = sum(s['prompt_tokens'] for s in ok)
+    completion_tokens = sum(s['completion_tokens'] for s in ok)
+    cost = (prompt_tokens * pricing.get('input_per_million', 0) + completion_tokens * pricing.get('output_per_million', 0)) / 1e6
+    cost += wall_seconds * pricing.get('per_hour', 0) / 3600
+
+    quality = {}
+    for task in sorted({s['task'] for s in ok}):
+        task_samples = [s for s in ok if s['task'] == task]
+        quality[task] = {
+            'token_f1': sum(s['token_f1'] for s in task_samples) / len(task_samples),
+            'rouge_l': sum(s['rouge_l'] for s in task_samples) / len(task_samples),
+        }
+
+    return {
+        'concurrency': concurrency,
+        'requests': len(samples),
+        'errors': len(samples) - len(ok),
+        'wall_seconds': wall_seconds,
+        'requests_per_sec': len(ok) / wall_seconds,
+        'output_tokens_per_sec': completion_tokens / wall_seconds,
+        'ttft': percentiles([s['ttft'] for s in ok]),
+        'latency': percentiles([s['latency'] for s in ok]),
+        'tokens_per_sec_per_request': percentiles([s['tokens_per_sec'] for s in ok if s['tokens_per_sec']]),
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': completion_tokens,
+        'cost_usd': cost,
+        'cost_usd_per_1k_requests': cost / len(ok) * 1000 if ok else None,
+        'quality': quality,
+    }
+
+
+async def main_async(args, config):
+    backend_config = {key: value for key, value in config.items() if key not in RUN_KEYS}
+    pricing = config.get('pricing', {})
+    max_tokens = {'qa': 256, 'handout': 1024, **config.get('max_tokens', {})}
+    items = load_items(args.prompts)
+    if args.limit:
+        items = items[:args.limit]
+
+    backend = build_backend(backend_config)
+    try:
+        # warm-up requests (connection setup, lazy model init) are not measured
+        for item in items[:args.warmup]:
+            await backend.generate(item, render(item), max_tokens[item['task']])
+
+        levels = []
+        all_samples = []
+        for concurrency in args.concurrency:
+            samples, wall_seconds = await run_level(backend, items, concurrency, args.repeat, max_tokens)
+            summary = summarize(samples, wall_seconds, concurrency, pricing)
+            levels.append(summary)
+            all_samples.extend(dict(sample, concurrency=concurrency) for sample in samples)
+            print(f"{config['name']} c={concurrency}: {summary['requests_per_sec']:.2f} req/s, "
+                  f"TTFT p50 {summary['ttft']['p50'] or 0:.2f}s, latency p95 {summary['latency']['p95'] or 0:.2f}s, "
+                  f"{summary['output_tokens_per_sec']:.0f} tok/s, errors {summary['errors']}, ${summary['cost_usd']:.4f}")
+    finally:
+        await backend.close()
+
+    return {
+        'run': {
+            'name': config['name'],
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'config': config,
+            'prompts': args.prompts,
+            'items': len(items),
+            'repeat': args.repeat,
+            'git_commit': git_commit(),
+            'host': platform.node(),
+        },
+        'levels': levels,
+        'samples': all_samples,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark an LLM backend on the IDSR QA and handout prompts')
+    parser.add_argument('--config', required=True, help='backend config, e.g. configs/mock.yaml')
+    parser.add_argument('--prompts', nargs='+', default=['prompts/idsr_qa.jsonl', 'prompts/handouts.jsonl'])
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 4, 16])
+    parser.add_argument('--repeat', type=int, default=3, help='times each prompt is sent per concurrency level')
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--limit', type=int, default=None)
+    parser.add_argument('--output-dir', default='results')
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        config = yaml.safe_load(f)
+    config.setdefault('name', os.path.splitext(os.path.basename(args.config))[0])
+
+    result = asyncio.run(main_async(args, config))
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    path = os.path.join(args.output_dir, f"{config['name']}-{stamp}.json")
+    with open(path, 'w') as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+    print(f'Results written to {path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+import hashlib
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+# function to map a url to its file in the on-disk cache
+def cache_path(cache_dir, url):
+    return os.path.join(cache_dir, hashlib.sha1(url.encode()).hexdigest() + '.html')
+
+
+class RateLimiter:
+    """Allows at most `rate` requests per second to each host, shared by all threads."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.next_slot = {}
+        self.lock = threading.Lock()
+
+    def wait(self, host):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class Fetcher:
+    """
+    Fetches pages through one pooled requests.Session with retries and
+    exponential backoff (429/5xx, honouring Retry-After), a per-host rate
+    limit, and an on-disk cache: a url that was fetched once is never
+    requested again, so an interrupted run resumes where it stopped.
+    """
+
+    def __init__(self, cache_dir='.cache/html', rate=4, retries=5, backoff=0.5, timeout=30, pool_size=16):
+        self.cache_dir = cache_dir
+        self.timeout = timeout
+        self.limiter = RateLimiter(rate)
+        os.makedirs(cache_dir, exist_ok=True)
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=['GET'],
+            respect_retry_after_header=True,
+        )
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers['User-Agent'] = 'chichewa-corpus-scraper (+https://github.com/sambanankhu)'
+
+    def fetch(self, url):
+        path = cache_path(self.cache_dir, url)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                return f.read()
+
+        self.limiter.wait(urlsplit(url).netloc)
+        r = self.session.get(url, timeout=self.timeout)
+        r.raise_for_status()
+
+        # write to a temporary file first so an interrupted run never leaves a partial page
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(r.content)
+        os.replace(tmp_path, path)
+        return r.content
@@ -1,58 +1,146 @@
+import csv
+import json
+import os
 import pandas as pd
-import requests
 from bs4 import BeautifulSoup as soup
-from time import sleep
-from tqdm import tqdm
+from concurrent.futures import ThreadPoolExecutor
+from assets.fetcher import Fetcher
+
+# shared fetcher: one HTTP session, rate limit and cache for the whole run
+fetcher = None
+
+
+# function to set up the shared fetcher (cache location, rate limit, retries)
+def configure_fetcher(**kwargs):
+    global fetcher
+    fetcher = Fetcher(**kwargs)
+    return fetcher
+
 
 # function to get url and beautify it
 def get_url(url):
-    r = requests.get(url)
-    s = soup(r.content, 'html.parser')
-    return s
+    if fetcher is None:
+        configure_fetcher()
+    return soup(fetcher.fetch(url), 'html.parser')
 
 
-# function to extract links, news, author and dates
-def get_links_title(s):
+# function to extract titles, links, dates and authors from a listing page
+def parse_listing(s):
     links = []
-    news = []
     author =[]
     date =[]
     for u in s.find_all('div',class_='qt-item-header'):
         if 'NEWSLETTER' not in str(u):
             author.append(u.find('p', class_='qt-author').a.get_text(strip=True))
             date.append(u.find('p', class_='qt-date').get_text(strip=True))
-            
-            
+
     news_url  = s.find_all("div", class_="qt-header-bottom")
     titles =[title.get_text(strip=True) for title in s.find_all('h3',class_="qt-title") if 'NEWSLETTER' not in title.get_text(strip=True)]
     for new in news_url:
         extracted_links = [link['href'] for link in new.find_all('a', href=True) if 'author' not in link['href'] if 'newsletter' not in link['href']]
         if extracted_links:
             links.append(extracted_links[0])
-            news_link = get_url(extracted_links[0])
-            paragraphs = news_link.select_one('.qt-the-content').find_all('p')
-            merged_text = ' '.join([p.get_text() for p in paragraphs])
-            news.append(merged_text.strip())
-            sleep(.05)
-            
+
+    return titles, links, date, author
+
+
+# function to fetch an article and merge its paragraphs
+def get_news(link):
+    paragraphs = get_url(link).select_one('.qt-the-content').find_all('p')
+    merged_text = ' '.join([p.get_text() for p in paragraphs])
+    return merged_text.strip()
+
+
+# function to extract links, news, author and dates
+def get_links_title(s, executor=None):
+    titles, links, date, author = parse_listing(s)
+    # articles are fetched concurrently; the rate limiter keeps the site load polite
+    if executor is None:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            news = list(executor.map(get_news, links))
+    else:
+        news = list(executor.map(get_news, links))
+
     return titles, news, links, date, author
 
 
-# a repo-dictionary for tempral data storage
-news_dict = {
-    "title":[],
-    'news':[],
-    'links':[],
-    'date':[],
-    "author":[]
-}
-
-# function to convert the repo-dict to a pandas DataFrame
-def create_csv(title, news, link, date, author):
-    news_dict['title'].extend(title)
-    news_dict['news'].extend(news)
-    news_dict['links'].extend(link)
-    news_dict['date'].extend(date)
-    news_dict['author'].extend(author)
-    
-    return pd.DataFrame(news_dict)
\ No newline at end of file
+COLUMNS = ['title', 'news', 'links', 'date', 'author']
+
+
+class NewsWriter:
+    """
+    Appends scraped rows to disk as they arrive instead of keeping the corpus
+    in memory.
+
+    - csv: rows are appended to a single file, flushed after every page.
+    - parquet: every page becomes a part file inside the output directory.
+
+    Rows whose link is already in the output are skipped, and finished
+    listing pages are recorded in `<output>.progress.json`, so a restarted
+    run continues where the last one stopped without duplicating articles.
+    """
+
+    def __init__(self, path, format='csv'):
+        self.path = path
+        self.format = format
+        self.progress_path = f'{path}.progress.json'
+        self.seen_links = self._existing_links()
+        self.done_pages = set()
+        if os.path.exists(self.progress_path):
+            with open(self.progress_path) as f:
+                self.done_pages = set(json.load(f)['done_pages'])
+        if format == 'csv':
+            new_file = not os.path.exists(path)
+            self.file = open(path, 'a', newline='', encoding='utf-8')
+            self.csv = csv.writer(self.file)
+            if new_file:
+                self.csv.writerow(COLUMNS)
+        elif format == 'parquet':
+            os.makedirs(path, exist_ok=True)
+        else:
+            raise ValueError(f"Unsupported format '{format}', expected csv or parquet")
+
+    def _existing_links(self):
+        if self.format == 'csv' and os.path.exists(self.path):
+            return set(pd.read_csv(self.path, usecols=['links'])['links'])
+        if self.format == 'parquet' and os.path.isdir(self.path) and os.listdir(self.path):
+            return set(pd.read_parquet(self.path, columns=['links'])['links'])
+        return set()
+
+    def write(self, title, news, link, date, author, page=None):
+        if not len(title) == len(news) == len(link) == len(date) == len(author):
+            raise ValueError(f'Mismatched fields: {len(title)} titles, {len(news)} news, {len(link)} links, {len(date)} dates, {len(author)} authors')
+
+        rows = []
+        for row in zip(title, news, link, date, author):
+            if row[2] not in self.seen_links:
+                self.seen_links.add(row[2])
+                rows.append(row)
+
+        if rows and self.format == 'csv':
+            self.csv.writerows(rows)
+            self.file.flush()
+        elif rows:
+            part = os.path.join(self.path, f'part-{len(os.listdir(self.path)):05d}.parquet')
+            pd.DataFrame(rows, columns=COLUMNS).to_parquet(part, index=False)
+
+        if page is not None:
+            self.mark_done(page)
+        return len(rows)
+
+    def mark_done(self, page):
+        self.done_pages.add(page)
+        tmp_path = f'{self.progress_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'done_pages': sorted(self.done_pages)}, f)
+        os.replace(tmp_path, self.progress_path)
+
+    def close(self):
+        if self.format == 'csv':
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,70 @@
+import argparse
+import os
+import threading
+from collections import Counter
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from fetcher import cache_path
+
+# Serves pages saved in the scraper's cache as if it were the news site, so
+# the scraper can be run offline: python scraper.py --base-url http://localhost:8765/news/ --cache-dir .cache/stub
+
+
+def make_handler(fixtures_dir, origin, failures=None, retry_after=1):
+    # failures: path -> statuses (e.g. [429, 503]) answered with Retry-After before the page is served
+    failures = {path: list(statuses) for path, statuses in (failures or {}).items()}
+    lock = threading.Lock()
+
+    class StubHandler(BaseHTTPRequestHandler):
+        # requests received per path, including failed ones
+        hits = Counter()
+
+        def do_GET(self):
+            with lock:
+                self.hits[self.path] += 1
+                status = failures[self.path].pop(0) if failures.get(self.path) else None
+            if status:
+                self.send_response(status)
+                self.send_header('Retry-After', str(retry_after))
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+            path = cache_path(fixtures_dir, origin + self.path)
+            if not os.path.exists(path):
+                self.send_error(404)
+                return
+            with open(path, 'rb') as f:
+                body = f.read()
+            # links inside the saved pages must point back at the stub
+            body = body.replace(origin.encode(), f'http://{self.headers["Host"]}'.encode())
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubHandler
+
+
+# function to parse --fail /news/page/2/=429,503
+def parse_failure(value):
+    path, _, statuses = value.partition('=')
+    return path, [int(status) for status in statuses.split(',')]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve cached pages of the news site locally')
+    parser.add_argument('--fixtures', default='.cache/html', help='cache directory of a previous real run')
+    parser.add_argument('--origin', default='https://www.radiomaria.mw')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--fail', type=parse_failure, action='append', default=[], metavar='PATH=STATUS,...',
+                        help='answer PATH with these statuses first, e.g. /news/page/2/=429,503 to exercise retries')
+    parser.add_argument('--retry-after', type=int, default=1, help='Retry-After seconds sent with --fail statuses')
+    args = parser.parse_args()
+
+    server = HTTPServer(('localhost', args.port), make_handler(args.fixtures, args.origin, dict(args.fail), args.retry_after))
+    print(f'Serving {args.fixtures} as {args.origin} on http://localhost:{args.port}')
+    server.serve_forever()
@@ -1,21 +1,58 @@
+import argparse
+from tqdm import tqdm
 from assets.functions import *
 
-base_url = 'https://www.radiomaria.mw/news/'
-for i in tqdm(range(1, 228), desc='Progress', unit='#', ncols=80):
-    try:
-        if i == 1:
-            url = base_url
-        else:
-            url = f'{base_url}page/{str(i)}/'
-            
-        s = get_url(url)
-        titles, news, links, date, author = get_links_title(s)
-        print(len(titles), len(news), len(links), len(date), len(author))
-        df = create_csv(titles, news, links, date, author)
-    except Exception as e:
-        # Print the error message or handle it as needed
-        print(f"An error occurred at iteration {i}: {str(e)}")
-        continue
-
-
-df.to_csv("final_radio_maria_chichewa_lang_news.csv",index = False)
\ No newline at end of file
+parser = argparse.ArgumentParser(description='Scrape Radio Maria Malawi Chichewa news')
+parser.add_argument('--base-url', default='https://www.radiomaria.mw/news/', help='listing root; point at assets/stub_server.py for offline runs')
+parser.add_argument('--pages', type=int, default=227, help='number of listing pages')
+parser.add_argument('--workers', type=int, default=8, help='concurrent article downloads')
+parser.add_argument('--page-workers', type=int, default=4, help='listing pages processed at once')
+parser.add_argument('--rate', type=float, default=4, help='max requests per second per host')
+parser.add_argument('--cache-dir', default='.cache/html', help='fetched pages are stored here and never fetched again')
+parser.add_argument('--output', default=None, help='csv file, or directory for parquet (default final_radio_maria_chichewa_lang_news.csv/.parquet)')
+parser.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+args = parser.parse_args()
+
+base_url = args.base_url
+output = args.output or f'final_radio_maria_chichewa_lang_news.{args.format}'
+configure_fetcher(cache_dir=args.cache_dir, rate=args.rate, pool_size=args.workers + args.page_workers)
+
+
+def scrape_page(i, article_pool):
+    if i == 1:
+        url = base_url
+    else:
+        url = f'{base_url}page/{str(i)}/'
+
+    s = get_url(url)
+    return get_links_title(s, article_pool)
+
+
+failed = []
+with NewsWriter(output, format=args.format) as writer:
+    # pages finished in an earlier run are skipped
+    pages = [i for i in range(1, args.pages + 1) if i not in writer.done_pages]
+    if len(pages) < args.pages:
+        print(f"Resuming: {args.pages - len(pages)} pages already in {output}")
+
+    with ThreadPoolExecutor(max_workers=args.workers) as article_pool, ThreadPoolExecutor(max_workers=args.page_workers) as page_pool:
+        # only a few pages are in flight at once, so memory does not grow with the corpus
+        window = args.page_workers * 2
+        futures = [page_pool.submit(scrape_page, i, article_pool) for i in pages[:window]]
+        # rows are written in page order as soon as each page is complete
+        for n, i in enumerate(tqdm(pages, desc='Progress', unit='#', ncols=80)):
+            if n + window < len(pages):
+                futures.append(page_pool.submit(scrape_page, pages[n + window], article_pool))
+            future, futures[n] = futures[n], None
+            try:
+                titles, news, links, date, author = future.result()
+                writer.write(titles, news, links, date, author, page=i)
+            except Exception as e:
+                # Print the error message or handle it as needed
+                print(f"An error occurred at iteration {i}: {str(e)}")
+                failed.append(i)
+                continue
+
+if failed:
+    # finished pages and cached downloads are kept, so a rerun only retries what failed
+    print(f"{len(failed)} pages failed: {failed}. Rerun to retry them.")
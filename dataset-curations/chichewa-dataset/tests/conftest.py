@@ -0,0 +1,6 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# the scraper imports assets.*; stub_server.py imports fetcher as a script would
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'assets')]
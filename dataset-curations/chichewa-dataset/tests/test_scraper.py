@@ -0,0 +1,144 @@
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from http.server import HTTPServer
+
+import pandas as pd
+import pytest
+
+from assets import functions
+from assets.fetcher import cache_path
+from stub_server import make_handler
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ORIGIN = 'https://www.radiomaria.mw'
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+# site path -> fixture file
+PAGES = {
+    '/news/': 'news.html',
+    '/news/mvula-yayamba/': 'mvula_yayamba.html',
+    '/news/alimi-alandira-feteleza/': 'alimi_alandira_feteleza.html',
+    '/news/katemera-wa-ana/': 'katemera_wa_ana.html',
+}
+PAGE_2 = {'/news/page/2/': 'news_page_2.html'}
+
+PAGE_1_TITLES = ["Mvula yayamba m'madera ambiri", 'Alimi alandira feteleza']
+PAGE_2_TITLES = ['Katemera wa ana ayamba']
+
+
+def add_pages(site_dir, pages):
+    for path, name in pages.items():
+        shutil.copy(os.path.join(FIXTURES, name), cache_path(site_dir, ORIGIN + path))
+
+
+@pytest.fixture
+def stub(tmp_path):
+    """Starts the stub server on the fixture pages; returns a function that (re)starts it with failures."""
+    site_dir = tmp_path / 'site'
+    site_dir.mkdir()
+    add_pages(str(site_dir), {**PAGES, **PAGE_2})
+    servers = []
+
+    def start(failures=None, pages_dir=None):
+        handler = make_handler(pages_dir or str(site_dir), ORIGIN, failures, retry_after=1)
+        server = HTTPServer(('localhost', 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        server.url = f'http://localhost:{server.server_port}'
+        server.hits = handler.hits
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    path = str(tmp_path / 'cache')
+    functions.configure_fetcher(cache_dir=path, rate=0, backoff=0)
+    yield path
+    functions.fetcher = None
+
+
+def test_listing_is_parsed_in_page_order(stub, cache_dir):
+    server = stub()
+
+    titles, news, links, dates, authors = functions.get_links_title(functions.get_url(f'{server.url}/news/'))
+
+    assert titles == PAGE_1_TITLES
+    assert links == [f'{server.url}/news/mvula-yayamba/', f'{server.url}/news/alimi-alandira-feteleza/']
+    assert dates == ['12 March 2024', '10 March 2024']
+    assert authors == ['Chisomo Banda', 'Tiyamike Phiri']
+    assert news == [
+        "Mvula yayamba kugwa m'madera ambiri a dziko lino. Alimi akulangizidwa kubzala msanga.",
+        "Alimi a m'boma la Dedza alandira feteleza. Boma lati ndondomekoyi ipitilira.",
+    ]
+
+
+def test_rerun_is_served_from_the_cache(stub, cache_dir):
+    server = stub()
+    first = functions.get_links_title(functions.get_url(f'{server.url}/news/'))
+    hits = dict(server.hits)
+
+    second = functions.get_links_title(functions.get_url(f'{server.url}/news/'))
+
+    assert second == first
+    assert dict(server.hits) == hits
+    assert all(count == 1 for count in hits.values())
+
+
+@pytest.mark.parametrize('failures', [[429], [503], [429, 503]])
+def test_throttled_requests_are_retried_after_retry_after(stub, cache_dir, failures):
+    server = stub(failures={'/news/page/2/': failures})
+
+    started = time.monotonic()
+    titles, _, _, _ = functions.parse_listing(functions.get_url(f'{server.url}/news/page/2/'))
+
+    assert titles == PAGE_2_TITLES
+    assert server.hits['/news/page/2/'] == len(failures) + 1
+    # one Retry-After (1 s) per failure, with no backoff of its own
+    assert time.monotonic() - started >= len(failures) * 0.9
+    assert os.path.exists(cache_path(cache_dir, f'{server.url}/news/page/2/'))
+
+
+def run_scraper(server, output, cache, format):
+    return subprocess.run(
+        [sys.executable, 'scraper.py', '--base-url', f'{server.url}/news/', '--pages', '2',
+         '--rate', '0', '--cache-dir', cache, '--output', output, '--format', format],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+
+
+def read_output(output, format):
+    return pd.read_csv(output) if format == 'csv' else pd.read_parquet(output)
+
+
+@pytest.mark.parametrize('format', ['csv', 'parquet'])
+def test_interrupted_run_resumes_through_news_writer(stub, tmp_path, format):
+    site_dir = tmp_path / 'partial'
+    site_dir.mkdir()
+    add_pages(str(site_dir), PAGES)  # page 2 is missing, so the first run fails on it
+    server = stub(pages_dir=str(site_dir))
+    output = str(tmp_path / f'news.{format}')
+
+    first = run_scraper(server, output, str(tmp_path / 'cache1'), format)
+    assert 'pages failed: [2]' in first.stdout
+    assert list(read_output(output, format)['title']) == PAGE_1_TITLES
+
+    add_pages(str(site_dir), PAGE_2)
+    hits = dict(server.hits)
+    # a fresh cache, so only NewsWriter's progress file can keep page 1 from being fetched again
+    second = run_scraper(server, output, str(tmp_path / 'cache2'), format)
+
+    assert 'Resuming: 1 pages already' in second.stdout
+    assert server.hits['/news/'] == hits['/news/']
+    assert server.hits['/news/mvula-yayamba/'] == hits['/news/mvula-yayamba/']
+    rows = read_output(output, format)
+    assert list(rows['title']) == PAGE_1_TITLES + PAGE_2_TITLES
+    assert rows['links'].is_unique
@@ -0,0 +1,234 @@
+import argparse
+import csv
+import glob
+import json
+import os
+import re
+import sys
+from collections import Counter
+from itertools import islice
+from multiprocessing import Pool
+
+# Token length statistics and schema checks for the fine-tuning data.
+#
+#   python dataset_stats.py umuntu-ai-dataset/*.jsonl chichewa-dataset/*.csv --output stats.json
+#
+# Files are streamed in batches to a pool of workers; each worker tokenizes
+# with the target Llama tokenizer (fast tokenizer, batched) and checks the
+# records. Only a length -> count table is kept per file, so memory does not
+# depend on file size.
+
+DEFAULT_TOKENIZER = 'NousResearch/Llama-2-7b-chat-hf'
+MAX_SEQ_LENGTHS = [256, 512, 1024, 2048, 4096]
+HISTOGRAM_EDGES = [0, 64, 128, 256, 512, 1024, 2048, 4096]
+MAX_EXAMPLES = 5
+
+# replacement characters, common utf-8 read as latin-1/cp1252 sequences, control characters,
+# and '?' inside a word (a character lost when the file was saved in a legacy encoding)
+ENCODING_PROBLEMS = re.compile('\ufffd|' r'Ã[\x80-\xbf]|â€|[\x00-\x08\x0b\x0c\x0e-\x1f]|(?<=[a-zA-Z])\?(?=[a-zA-Z])')
+
+tokenizer = None
+
+
+def init_worker(tokenizer_name):
+    global tokenizer
+    from transformers import AutoTokenizer
+    tokenizer = AutoTokenizer.from_pretrained(tokenizer_name, use_fast=True)
+
+
+# function to render a conversation the way train.py sees it (Llama-2 chat format)
+def render_messages(messages):
+    system = ''
+    text = ''
+    for m in messages:
+        if m.get('role') == 'system':
+            system = f"<<SYS>>\n{m.get('content', '')}\n<</SYS>>\n\n"
+        elif m.get('role') == 'user':
+            text += f"<s>[INST] {system}{m.get('content', '')} [/INST]"
+            system = ''
+        else:
+            text += f" {m.get('content', '')} </s>"
+    return text
+
+
+# function to check a chat record; returns a list of problems
+def check_messages(record):
+    messages = record.get('messages')
+    if not isinstance(messages, list) or not messages:
+        return ['missing messages']
+    problems = []
+    turns = [m for m in messages if m.get('role') != 'system']
+    if any(m.get('role') not in ('system', 'user', 'assistant') for m in messages):
+        problems.append('unknown role')
+    if any(m.get('role') == 'system' for m in messages[1:]):
+        problems.append('system message not first')
+    if any(turn.get('role') != ('user' if i % 2 == 0 else 'assistant') for i, turn in enumerate(turns)):
+        problems.append('roles out of order')
+    if not turns or turns[-1].get('role') != 'assistant':
+        problems.append('ends without an answer')
+    if any(not str(m.get('content') or '').strip() for m in messages):
+        problems.append('empty turn')
+    if any(ENCODING_PROBLEMS.search(str(m.get('content') or '')) for m in messages):
+        problems.append('encoding')
+    return problems
+
+
+# function to check a news csv row; returns a list of problems
+def check_news(row):
+    problems = [f'empty {field}' for field in ('title', 'news', 'links') if not (row.get(field) or '').strip()]
+    if ENCODING_PROBLEMS.search((row.get('title') or '') + (row.get('news') or '')):
+        problems.append('encoding')
+    return problems
+
+
+def process_batch(batch):
+    """Tokenize and check one batch of (line_number, kind, record); runs in a worker."""
+    texts = []
+    problems = []
+    for line_number, kind, record in batch:
+        if kind == 'bad json':
+            problems.append((line_number, ['bad json']))
+            continue
+        if kind == 'jsonl':
+            found = check_messages(record)
+            texts.append(render_messages(record.get('messages') or []))
+        else:
+            found = check_news(record)
+            texts.append(f"{record.get('title') or ''}\n\n{record.get('news') or ''}")
+        if found:
+            problems.append((line_number, found))
+    lengths = [len(ids) for ids in tokenizer(texts, add_special_tokens=False)['input_ids']] if texts else []
+    return lengths, problems
+
+
+# function to stream (line_number, kind, record) tuples out of a jsonl or csv file
+def read_records(path):
+    if path.endswith('.csv'):
+        csv.field_size_limit(sys.maxsize)
+        with open(path, newline='', encoding='utf-8', errors='replace') as f:
+            reader = csv.DictReader(f)
+            # rows can span several lines; report the line the row ends on
+            for row in reader:
+                yield reader.line_num, 'csv', row
+        return
+    with open(path, encoding='utf-8', errors='replace') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield line_number, 'jsonl', json.loads(line)
+            except json.JSONDecodeError:
+                yield line_number, 'bad json', None
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+# function to turn a length -> count table into the report for one file
+def summarize(length_counts, problem_counts, examples):
+    total = sum(length_counts.values())
+    lengths = sorted(length_counts)
+
+    def percentile(q):
+        target = q * (total - 1)
+        seen = 0
+        for length in lengths:
+            seen += length_counts[length]
+            if seen > target:
+                return length
+        return lengths[-1] if lengths else 0
+
+    total_tokens = sum(length * count for length, count in length_counts.items())
+    histogram = {}
+    for low, high in zip(HISTOGRAM_EDGES, HISTOGRAM_EDGES[1:] + [None]):
+        label = f'{low}-{high}' if high else f'{low}+'
+        histogram[label] = sum(count for length, count in length_counts.items() if length >= low and (high is None or length < high))
+
+    truncation = {}
+    for max_length in MAX_SEQ_LENGTHS:
+        over = sum(count for length, count in length_counts.items() if length > max_length)
+        lost = sum((length - max_length) * count for length, count in length_counts.items() if length > max_length)
+        truncation[max_length] = {
+            'truncated_examples': over / total if total else 0.0,
+            'lost_tokens': lost / total_tokens if total_tokens else 0.0,
+        }
+
+    return {
+        'examples': total,
+        'tokens': total_tokens,
+        'length': {
+            'mean': total_tokens / total if total else 0,
+            'p50': percentile(0.50), 'p90': percentile(0.90), 'p95': percentile(0.95), 'p99': percentile(0.99),
+            'max': lengths[-1] if lengths else 0,
+        },
+        'histogram': histogram,
+        'truncation': truncation,
+        'problems': dict(problem_counts),
+        'problem_examples': examples,
+    }
+
+
+def file_stats(pool, path, batch_size):
+    length_counts = Counter()
+    problem_counts = Counter()
+    examples = []
+    for lengths, problems in pool.imap(process_batch, batched(read_records(path), batch_size)):
+        length_counts.update(lengths)
+        for line_number, found in problems:
+            problem_counts.update(found)
+            if len(examples) < MAX_EXAMPLES:
+                examples.append({'line': line_number, 'problems': found})
+    return summarize(length_counts, problem_counts, examples)
+
+
+def print_report(path, stats):
+    length = stats['length']
+    print(f"\n{path}: {stats['examples']} examples, {stats['tokens']} tokens")
+    print(f"  length mean {length['mean']:.0f}  p50 {length['p50']}  p90 {length['p90']}  "
+          f"p95 {length['p95']}  p99 {length['p99']}  max {length['max']}")
+    print('  histogram  ' + '  '.join(f'{label}: {count}' for label, count in stats['histogram'].items()))
+    print('  truncated  ' + '  '.join(
+        f"@{max_length}: {t['truncated_examples']:.1%} ({t['lost_tokens']:.1%} tokens)" for max_length, t in stats['truncation'].items()
+    ))
+    if stats['problems']:
+        print('  problems   ' + ', '.join(f'{name}: {count}' for name, count in stats['problems'].items()))
+        for example in stats['problem_examples']:
+            print(f"    line {example['line']}: {', '.join(example['problems'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Token length statistics and schema checks for jsonl chat data and the news csv')
+    parser.add_argument('inputs', nargs='+', help='jsonl/csv files or globs')
+    parser.add_argument('--tokenizer', default=DEFAULT_TOKENIZER)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--batch-size', type=int, default=512, help='records per tokenizer call')
+    parser.add_argument('--output', default=None, help='write the full report as json')
+    parser.add_argument('--strict', action='store_true', help='exit with status 1 if any file has problems')
+    args = parser.parse_args()
+
+    paths = sorted({path for pattern in args.inputs for path in glob.glob(pattern)})
+    if not paths:
+        raise SystemExit('no input files found')
+
+    report = {'tokenizer': args.tokenizer, 'files': {}}
+    with Pool(args.workers, initializer=init_worker, initargs=(args.tokenizer,)) as pool:
+        for path in paths:
+            report['files'][path] = file_stats(pool, path, args.batch_size)
+            print_report(path, report['files'][path])
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if args.strict and any(stats['problems'] for stats in report['files'].values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,307 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import struct
+import unicodedata
+import numpy as np
+
+# Build one clean dataset out of the overlapping jsonl variants in this folder.
+#
+#   python build_dataset.py                       # all *.jsonl here -> build/
+#   python build_dataset.py data/*.jsonl --output-dir build --test-percent 10
+#
+# Every record is streamed once: normalized to {"id", "messages", "source"},
+# dropped if it is an exact or near duplicate (MinHash LSH) of a record seen
+# before, and assigned to train/validation/test from a hash of its content.
+# The duplicate index lives in sqlite on disk, so memory does not grow with
+# the number of rows.
+
+ROLE_ALIASES = {
+    'system': 'system',
+    'user': 'user', 'human': 'user', 'prompt': 'user',
+    'assistant': 'assistant', 'gpt': 'assistant', 'bot': 'assistant', 'model': 'assistant',
+}
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+
+# function to clean one message text
+def clean_text(text):
+    text = unicodedata.normalize('NFC', text or '')
+    return text.replace('\u00a0', ' ').strip()
+
+
+# function to turn any of the supported record layouts into a list of messages
+def to_messages(record):
+    if 'messages' in record:
+        turns = [(m.get('role'), m.get('content')) for m in record['messages']]
+    elif 'conversations' in record:
+        turns = [(m.get('from') or m.get('role'), m.get('value') or m.get('content')) for m in record['conversations']]
+    elif 'text' in record:
+        turns = parse_llama_text(record['text'])
+    else:
+        prompt = record.get('instruction') or record.get('prompt') or record.get('question')
+        if record.get('input'):
+            prompt = f"{prompt}\n\n{record['input']}"
+        answer = record.get('output') or record.get('response') or record.get('completion') or record.get('answer')
+        turns = [('system', record['system'])] if record.get('system') else []
+        turns += [('user', prompt), ('assistant', answer)]
+
+    messages = []
+    for role, content in turns:
+        role = ROLE_ALIASES.get(str(role).lower())
+        if role is None:
+            raise ValueError(f'unknown role {role!r}')
+        messages.append({'role': role, 'content': clean_text(content)})
+    return messages
+
+
+# function to split a Llama-2 chat string into messages
+def parse_llama_text(text):
+    turns = []
+    for chunk in re.split(r'<s>|</s>', text):
+        if '[INST]' not in chunk:
+            continue
+        prompt, _, answer = chunk.partition('[/INST]')
+        prompt = prompt.replace('[INST]', '')
+        system = re.search(r'<<SYS>>(.*?)<</SYS>>', prompt, flags=re.S)
+        if system:
+            turns.append(('system', system.group(1)))
+            prompt = prompt[system.end():]
+        turns += [('user', prompt), ('assistant', answer)]
+    return turns
+
+
+# function to check the normalized messages; returns a reason or None
+def validate(messages):
+    turns = [m for m in messages if m['role'] != 'system']
+    if not turns:
+        return 'no user/assistant turns'
+    if any(not m['content'] for m in turns):
+        return 'empty turn'
+    for i, m in enumerate(turns):
+        if m['role'] != ('user' if i % 2 == 0 else 'assistant'):
+            return 'roles out of order'
+    if turns[-1]['role'] != 'assistant':
+        return 'ends without an answer'
+    return None
+
+
+# function to build the text duplicates are detected on
+def dedup_text(messages, dedup_on):
+    roles = ('user',) if dedup_on == 'prompt' else ('user', 'assistant')
+    text = ' '.join(m['content'] for m in messages if m['role'] in roles).lower()
+    text = re.sub(r'[^\w\s]', ' ', text)
+    return ' '.join(text.split())
+
+
+class MinHasher:
+    """MinHash signatures over character shingles, split into LSH bands."""
+
+    def __init__(self, num_perm=128, bands=16, shingle_size=5, seed=1):
+        if num_perm % bands:
+            raise ValueError('num_perm must be divisible by bands')
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text):
+        n = self.shingle_size
+        shingles = {text[i:i + n] for i in range(max(1, len(text) - n + 1))}
+        hashes = np.fromiter(
+            (struct.unpack('<I', hashlib.blake2b(s.encode(), digest_size=4).digest())[0] for s in shingles),
+            dtype=np.uint64, count=len(shingles),
+        )
+        permuted = ((hashes[:, None] * self.a + self.b) % np.uint64(MERSENNE_PRIME)) & np.uint64(MAX_HASH)
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def band_keys(self, signature):
+        return [
+            bytes([band]) + hashlib.blake2b(signature[band * self.rows:(band + 1) * self.rows].tobytes(), digest_size=8).digest()
+            for band in range(self.bands)
+        ]
+
+
+class DuplicateIndex:
+    """sqlite-backed exact-hash set and LSH buckets of the records kept so far."""
+
+    def __init__(self, path):
+        if os.path.exists(path):
+            os.remove(path)
+        self.db = sqlite3.connect(path)
+        self.db.executescript('''
+            PRAGMA journal_mode = OFF;
+            PRAGMA synchronous = OFF;
+            CREATE TABLE exact (hash BLOB PRIMARY KEY);
+            CREATE TABLE signatures (id INTEGER PRIMARY KEY, signature BLOB);
+            CREATE TABLE buckets (key BLOB, id INTEGER);
+            CREATE INDEX buckets_key ON buckets (key);
+        ''')
+
+    def seen_exact(self, digest):
+        return self.db.execute('SELECT 1 FROM exact WHERE hash = ?', (digest,)).fetchone() is not None
+
+    def near_duplicate(self, signature, keys, threshold):
+        placeholders = ','.join('?' * len(keys))
+        candidates = self.db.execute(
+            f'SELECT DISTINCT s.signature FROM buckets b JOIN signatures s ON s.id = b.id WHERE b.key IN ({placeholders})',
+            keys,
+        )
+        for (other,) in candidates:
+            # share of equal minhashes estimates the Jaccard similarity
+            if np.mean(np.frombuffer(other, dtype=np.uint32) == signature) >= threshold:
+                return True
+        return False
+
+    def add(self, digest, signature, keys):
+        self.db.execute('INSERT INTO exact (hash) VALUES (?)', (digest,))
+        row_id = self.db.execute('INSERT INTO signatures (signature) VALUES (?)', (signature.tobytes(),)).lastrowid
+        self.db.executemany('INSERT INTO buckets (key, id) VALUES (?, ?)', [(key, row_id) for key in keys])
+
+    def commit(self):
+        self.db.commit()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
+class ShardWriter:
+    """Writes <split>/<split>-00000.jsonl files of at most shard_size rows."""
+
+    def __init__(self, output_dir, split, shard_size):
+        self.dir = os.path.join(output_dir, split)
+        self.split = split
+        self.shard_size = shard_size
+        self.rows = 0
+        self.file = None
+
+    def write(self, record):
+        if self.rows % self.shard_size == 0:
+            if self.file:
+                self.file.close()
+            os.makedirs(self.dir, exist_ok=True)
+            shard = self.rows // self.shard_size
+            self.file = open(os.path.join(self.dir, f'{self.split}-{shard:05d}.jsonl'), 'w', encoding='utf-8')
+        self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.rows += 1
+
+    def close(self):
+        if self.file:
+            self.file.close()
+
+
+# function to pick a split from a content hash; stable across runs and input order
+def assign_split(digest, test_percent, validation_percent):
+    bucket = int.from_bytes(digest[:8], 'big') % 10000 / 100
+    if bucket < test_percent:
+        return 'test'
+    if bucket < test_percent + validation_percent:
+        return 'validation'
+    return 'train'
+
+
+# function to stream records out of the input files in a fixed order
+def read_records(paths, stats):
+    for path in paths:
+        source = os.path.basename(path)
+        with open(path, encoding='utf-8', errors='replace') as f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield source, json.loads(line)
+                except json.JSONDecodeError:
+                    stats['invalid']['bad json'] = stats['invalid'].get('bad json', 0) + 1
+                    print(f'{source}:{line_number}: bad json, skipped')
+
+
+def build(paths, output_dir, test_percent=10, validation_percent=0, shard_size=100000,
+          dedup_on='prompt', threshold=0.8, num_perm=128, bands=16):
+    os.makedirs(output_dir, exist_ok=True)
+    hasher = MinHasher(num_perm=num_perm, bands=bands)
+    index_path = os.path.join(output_dir, 'dedup_index.sqlite')
+    index = DuplicateIndex(index_path)
+    writers = {split: ShardWriter(output_dir, split, shard_size) for split in ('train', 'validation', 'test')}
+    stats = {'read': 0, 'kept': 0, 'exact_duplicates': 0, 'near_duplicates': 0, 'invalid': {}, 'sources': {}, 'splits': {}}
+
+    for source, record in read_records(paths, stats):
+        stats['read'] += 1
+        try:
+            messages = to_messages(record)
+            problem = validate(messages)
+        except (ValueError, TypeError, AttributeError) as e:
+            problem = str(e)
+        if problem:
+            stats['invalid'][problem] = stats['invalid'].get(problem, 0) + 1
+            continue
+
+        text = dedup_text(messages, dedup_on)
+        digest = hashlib.sha256(text.encode()).digest()
+        if index.seen_exact(digest):
+            stats['exact_duplicates'] += 1
+            continue
+        signature = hasher.signature(text)
+        keys = hasher.band_keys(signature)
+        if index.near_duplicate(signature, keys, threshold):
+            stats['near_duplicates'] += 1
+            continue
+        index.add(digest, signature, keys)
+
+        split = assign_split(digest, test_percent, validation_percent)
+        writers[split].write({'id': digest[:8].hex(), 'messages': messages, 'source': source})
+        stats['kept'] += 1
+        stats['sources'][source] = stats['sources'].get(source, 0) + 1
+        stats['splits'][split] = stats['splits'].get(split, 0) + 1
+        if stats['kept'] % 10000 == 0:
+            index.commit()
+
+    for writer in writers.values():
+        writer.close()
+    index.close()
+    os.remove(index_path)
+
+    stats['config'] = {
+        'inputs': [os.path.basename(path) for path in paths], 'test_percent': test_percent,
+        'validation_percent': validation_percent, 'dedup_on': dedup_on, 'threshold': threshold,
+        'num_perm': num_perm, 'bands': bands, 'shard_size': shard_size,
+    }
+    with open(os.path.join(output_dir, 'manifest.json'), 'w') as f:
+        json.dump(stats, f, indent=2)
+    return stats
+
+
+if __name__ == '__main__':
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description='Normalize, deduplicate and split the umuntu-ai jsonl files')
+    parser.add_argument('inputs', nargs='*', help='jsonl files or globs (default: every *.jsonl next to this script)')
+    parser.add_argument('--output-dir', default=os.path.join(here, 'build'))
+    parser.add_argument('--test-percent', type=float, default=10)
+    parser.add_argument('--validation-percent', type=float, default=0)
+    parser.add_argument('--shard-size', type=int, default=100000, help='rows per output file')
+    parser.add_argument('--dedup-on', choices=['prompt', 'conversation'], default='prompt',
+                        help='compare user turns only (catches the same question with reworded answers) or whole conversations')
+    parser.add_argument('--threshold', type=float, default=0.8, help='estimated Jaccard similarity above which rows are near duplicates')
+    parser.add_argument('--num-perm', type=int, default=128)
+    parser.add_argument('--bands', type=int, default=16)
+    args = parser.parse_args()
+
+    patterns = args.inputs or [os.path.join(here, '*.jsonl')]
+    # sorted so the same inputs always give the same output
+    paths = sorted({path for pattern in patterns for path in glob.glob(pattern)})
+    if not paths:
+        raise SystemExit('no input files found')
+
+    stats = build(paths, args.output_dir, args.test_percent, args.validation_percent, args.shard_size,
+                  args.dedup_on, args.threshold, args.num_perm, args.bands)
+    print(f"read {stats['read']}, kept {stats['kept']} {stats['splits']}, "
+          f"exact duplicates {stats['exact_duplicates']}, near duplicates {stats['near_duplicates']}, "
+          f"invalid {sum(stats['invalid'].values())}")
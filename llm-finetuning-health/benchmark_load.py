@@ -0,0 +1,78 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import torch
+from utils import DTYPES, load_model, load_tokenizer
+
+
+def directory_size_mb(path):
+    if not os.path.isdir(path):
+        return None
+    return sum(
+        os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files
+    ) / 2 ** 20
+
+
+def measure(model_path, dtype, prompt):
+    """Load once in this process and time the load and the first generated token."""
+    start = time.perf_counter()
+    tokenizer = load_tokenizer(model_path)
+    model = load_model(model_path, dtype=dtype)
+    load_seconds = time.perf_counter() - start
+
+    inputs = tokenizer(prompt, return_tensors="pt")
+    start = time.perf_counter()
+    with torch.inference_mode():
+        model.generate(**inputs, max_new_tokens=1, pad_token_id=tokenizer.pad_token_id)
+    first_token_seconds = time.perf_counter() - start
+
+    return {
+        "model": model_path,
+        "dtype": dtype,
+        "load_s": load_seconds,
+        "first_token_s": first_token_seconds,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "size_on_disk_mb": directory_size_mb(model_path),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare load time and memory of adapter, merged and int8 exports")
+    parser.add_argument("models", nargs="+", help="Model directories, optionally as path:dtype (e.g. merged:int8)")
+    parser.add_argument("--prompt", default="<s>[INST] What are the signs of cholera? [/INST]")
+    parser.add_argument("--output", default="results/load_benchmark.json")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        # One measurement per process, so peak RSS and imports are not shared between models
+        model_path, _, dtype = args.models[0].rpartition(":")
+        print(json.dumps(measure(model_path, dtype, args.prompt)))
+        return
+
+    results = []
+    for spec in args.models:
+        model_path, _, dtype = spec.partition(":")
+        dtype = dtype or "fp32"
+        if dtype not in DTYPES:
+            raise SystemExit(f"Unsupported dtype '{dtype}', expected one of {DTYPES}")
+        completed = subprocess.run(
+            [sys.executable, __file__, "--worker", "--prompt", args.prompt, f"{model_path}:{dtype}"],
+            check=True, capture_output=True, text=True,
+        )
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        results.append(result)
+        print(f"{model_path} ({dtype}): load {result['load_s']:.1f}s, first token {result['first_token_s']:.2f}s, "
+              f"peak RSS {result['peak_rss_mb']:.0f} MB")
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
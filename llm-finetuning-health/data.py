@@ -0,0 +1,166 @@
+import hashlib
+import os
+import random
+import torch
+from datasets import load_from_disk
+
+# HF's LengthGroupedSampler sorts within mega-batches of this many batches
+MEGABATCH_MULT = 50
+
+
+def _cache_path(cache_dir, *parts):
+    key = hashlib.sha1("|".join(str(part) for part in parts).encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, key)
+
+
+def tokenize_dataset(dataset, tokenizer, max_seq_length, cache_dir, text_field="text", num_proc=None):
+    """
+    Tokenize once and cache the result as Arrow on disk. Later runs load the
+    memory-mapped cache instead of tokenizing again.
+    """
+    path = _cache_path(cache_dir, "tokenized", dataset._fingerprint, tokenizer.name_or_path, max_seq_length)
+    if os.path.exists(path):
+        return load_from_disk(path)
+
+    def tokenize(batch):
+        encodings = tokenizer(batch[text_field], truncation=True, max_length=max_seq_length - 1, add_special_tokens=False)
+        # Close every example with EOS so packed examples stay separable
+        input_ids = [ids + [tokenizer.eos_token_id] for ids in encodings["input_ids"]]
+        return {"input_ids": input_ids, "length": [len(ids) for ids in input_ids]}
+
+    tokenized = dataset.map(tokenize, batched=True, remove_columns=dataset.column_names, num_proc=num_proc)
+    tokenized.save_to_disk(path)
+    return load_from_disk(path)
+
+
+def pack_dataset(tokenized, max_seq_length, cache_dir, num_proc=None):
+    """
+    Pack tokenized examples into sequences of at most max_seq_length tokens.
+
+    Examples are never split: an example that does not fit starts a new
+    sequence. position_ids restart at 0 for each example, which is what the
+    collator uses to rebuild the attention boundaries.
+    """
+    path = _cache_path(cache_dir, "packed", tokenized._fingerprint, max_seq_length)
+    if os.path.exists(path):
+        return load_from_disk(path)
+
+    def pack(batch):
+        packed_ids, packed_positions = [], []
+        current_ids, current_positions = [], []
+        for ids in batch["input_ids"]:
+            if current_ids and len(current_ids) + len(ids) > max_seq_length:
+                packed_ids.append(current_ids)
+                packed_positions.append(current_positions)
+                current_ids, current_positions = [], []
+            current_ids.extend(ids)
+            current_positions.extend(range(len(ids)))
+        if current_ids:
+            packed_ids.append(current_ids)
+            packed_positions.append(current_positions)
+        return {
+            "input_ids": packed_ids,
+            "position_ids": packed_positions,
+            "length": [len(ids) for ids in packed_ids],
+        }
+
+    packed = tokenized.map(pack, batched=True, batch_size=1000, remove_columns=tokenized.column_names, num_proc=num_proc)
+    packed.save_to_disk(path)
+    return load_from_disk(path)
+
+
+class PaddingCollator:
+    """Right-pads a batch of examples; padded positions get label -100."""
+
+    def __init__(self, pad_token_id):
+        self.pad_token_id = pad_token_id
+
+    def __call__(self, features):
+        longest = max(len(feature["input_ids"]) for feature in features)
+        input_ids = torch.full((len(features), longest), self.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(features), longest), dtype=torch.long)
+        for row, feature in enumerate(features):
+            ids = torch.tensor(feature["input_ids"], dtype=torch.long)
+            input_ids[row, :len(ids)] = ids
+            attention_mask[row, :len(ids)] = 1
+        labels = input_ids.masked_fill(attention_mask == 0, -100)
+        return {"input_ids": input_ids, "attention_mask": attention_mask, "labels": labels}
+
+
+class PackedCollator:
+    """
+    Collates packed sequences so tokens only attend within their own example.
+
+    position_ids restart for each example and the first token of every
+    example is not trained on (it would be predicted from the previous
+    example). With use_4d_mask, a block-diagonal causal mask in additive
+    form is passed as attention_mask (transformers>=4.40, eager/sdpa
+    attention). Without it, only position_ids mark the boundaries, which is
+    what flash_attention_2 expects.
+    """
+
+    def __init__(self, pad_token_id, use_4d_mask=True, mask_dtype=torch.float32):
+        self.pad_token_id = pad_token_id
+        self.use_4d_mask = use_4d_mask
+        self.mask_dtype = mask_dtype
+
+    def __call__(self, features):
+        longest = max(len(feature["input_ids"]) for feature in features)
+        batch_size = len(features)
+        input_ids = torch.full((batch_size, longest), self.pad_token_id, dtype=torch.long)
+        position_ids = torch.zeros((batch_size, longest), dtype=torch.long)
+        labels = torch.full((batch_size, longest), -100, dtype=torch.long)
+        segment_ids = torch.full((batch_size, longest), -1, dtype=torch.long)
+
+        for row, feature in enumerate(features):
+            ids = torch.tensor(feature["input_ids"], dtype=torch.long)
+            positions = torch.tensor(feature["position_ids"], dtype=torch.long)
+            length = len(ids)
+            input_ids[row, :length] = ids
+            position_ids[row, :length] = positions
+            labels[row, :length] = ids.masked_fill(positions == 0, -100)
+            segment_ids[row, :length] = torch.cumsum((positions == 0).long(), dim=0)
+            # Padding continues the positions so rotary embeddings stay in range
+            position_ids[row, length:] = torch.arange(longest - length)
+
+        batch = {"input_ids": input_ids, "position_ids": position_ids, "labels": labels}
+        if self.use_4d_mask:
+            same_segment = (segment_ids[:, :, None] == segment_ids[:, None, :]) & (segment_ids[:, :, None] >= 0)
+            causal = torch.tril(torch.ones((longest, longest), dtype=torch.bool))
+            allowed = same_segment & causal
+            # Padding rows attend to themselves only, so softmax stays finite
+            allowed |= torch.eye(longest, dtype=torch.bool)
+            mask = torch.zeros((batch_size, 1, longest, longest), dtype=self.mask_dtype)
+            mask.masked_fill_(~allowed[:, None, :, :], torch.finfo(self.mask_dtype).min)
+            batch["attention_mask"] = mask
+        return batch
+
+
+def padding_stats(lengths, per_device_batch_size, packing, seed=42):
+    """
+    Fraction of the tokens fed to the model that are padding, given the
+    lengths of the training sequences (packed sequences when packing).
+
+    For packed runs batches are taken in order, so this is exact. For
+    unpacked runs it simulates group_by_length batching, which sorts
+    examples by length within random mega-batches.
+    """
+    if packing:
+        batches = [lengths[i:i + per_device_batch_size] for i in range(0, len(lengths), per_device_batch_size)]
+    else:
+        order = list(range(len(lengths)))
+        random.Random(seed).shuffle(order)
+        megabatch = per_device_batch_size * MEGABATCH_MULT
+        batches = []
+        for start in range(0, len(order), megabatch):
+            chunk = sorted(order[start:start + megabatch], key=lambda i: lengths[i], reverse=True)
+            for i in range(0, len(chunk), per_device_batch_size):
+                batches.append([lengths[j] for j in chunk[i:i + per_device_batch_size]])
+
+    real = sum(lengths)
+    total = sum(max(batch) * len(batch) for batch in batches)
+    return {
+        "real_tokens": real,
+        "padded_tokens": total - real,
+        "padding_ratio": (total - real) / total if total else 0.0,
+    }
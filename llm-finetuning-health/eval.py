@@ -1,27 +1,111 @@
-from transformers import AutoModelForCausalLM, AutoTokenizer
-from datasets import load_dataset
+import argparse
+import json
+import math
+import os
+import time
+import torch
+import torch.nn.functional as F
+from tqdm import tqdm
+from utils import DTYPES, length_bucketed_batches, load_model, load_test_split, load_tokenizer
 
 # Configuration
 new_model = "Llama-2-7b-public-health-chat-finetune"
 dataset_name = "sambanankhu/public-health-QA-handouts-instruct-Llama-2k"
 
-# Load fine-tuned model and tokenizer
-model = AutoModelForCausalLM.from_pretrained(new_model)
-tokenizer = AutoTokenizer.from_pretrained(new_model)
-
-# Load test dataset
-dataset = load_dataset(dataset_name)
-train_test_split = dataset["train"].train_test_split(test_size=0.1)
-test_dataset = train_test_split["test"]
-
-# Generate Predictions
-for example in test_dataset:
-    inputs = tokenizer(example["text"], return_tensors="pt", truncation=True, padding=True)
-    inputs = {k: v.to(model.device) for k, v in inputs.items()}
-
-    with torch.no_grad():
-        outputs = model.generate(**inputs, max_length=50)
-        generated_text = tokenizer.decode(outputs[0], skip_special_tokens=True)
-        print(f"Generated: {generated_text}")
-        print(f"Ground Truth: {example['text']}")
-        print("-" * 50)
\ No newline at end of file
+
+def evaluate(model, tokenizer, texts, batch_size=8, max_length=1024):
+    """
+    Compute perplexity and next-token accuracy over texts.
+
+    Texts are tokenized once, grouped into length buckets, and each batch
+    gets a single forward pass. Loss and accuracy only count real tokens:
+    padded positions are excluded through the attention mask.
+    """
+    encodings = tokenizer(texts, truncation=True, max_length=max_length)
+    lengths = [len(ids) for ids in encodings["input_ids"]]
+
+    total_nll = 0.0
+    total_correct = 0
+    total_tokens = 0
+
+    for batch_indices in tqdm(length_bucketed_batches(lengths, batch_size)):
+        batch = tokenizer.pad(
+            {
+                "input_ids": [encodings["input_ids"][i] for i in batch_indices],
+                "attention_mask": [encodings["attention_mask"][i] for i in batch_indices],
+            },
+            return_tensors="pt",
+        )
+        input_ids = batch["input_ids"].to(model.device)
+        attention_mask = batch["attention_mask"].to(model.device)
+
+        with torch.inference_mode():
+            logits = model(input_ids=input_ids, attention_mask=attention_mask).logits
+
+        # Position t predicts token t + 1
+        shift_logits = logits[:, :-1, :].float()
+        shift_labels = input_ids[:, 1:]
+        mask = attention_mask[:, 1:].bool()
+
+        nll = F.cross_entropy(shift_logits.transpose(1, 2), shift_labels, reduction="none")
+        total_nll += nll[mask].sum().item()
+        total_correct += ((shift_logits.argmax(dim=-1) == shift_labels) & mask).sum().item()
+        total_tokens += mask.sum().item()
+
+    return {
+        "perplexity": math.exp(total_nll / total_tokens),
+        "token_accuracy": total_correct / total_tokens,
+        "tokens": total_tokens,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate fine-tuned checkpoints on the held-out split")
+    parser.add_argument("--checkpoints", nargs="+", default=[new_model], help="Model directories or hub ids to evaluate")
+    parser.add_argument("--dataset", default=dataset_name)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--max-length", type=int, default=1024)
+    parser.add_argument("--dtype", choices=DTYPES, default="fp32")
+    parser.add_argument("--limit", type=int, default=None, help="Only evaluate the first N test examples")
+    parser.add_argument("--seed", type=int, default=42, help="Seed of the train/test split")
+    parser.add_argument("--output-dir", default="eval_results")
+    args = parser.parse_args()
+
+    test_dataset = load_test_split(args.dataset, seed=args.seed, limit=args.limit)
+    texts = test_dataset["text"]
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    for checkpoint in args.checkpoints:
+        tokenizer = load_tokenizer(checkpoint)
+        model = load_model(checkpoint, dtype=args.dtype)
+
+        start = time.perf_counter()
+        results = evaluate(model, tokenizer, texts, batch_size=args.batch_size, max_length=args.max_length)
+        elapsed = time.perf_counter() - start
+
+        results.update({
+            "checkpoint": checkpoint,
+            "dataset": args.dataset,
+            "examples": len(texts),
+            "dtype": args.dtype,
+            "batch_size": args.batch_size,
+            "max_length": args.max_length,
+            "seconds": elapsed,
+            "examples_per_sec": len(texts) / elapsed,
+            "tokens_per_sec": results["tokens"] / elapsed,
+        })
+
+        print(f"{checkpoint}: perplexity={results['perplexity']:.3f} "
+              f"token_accuracy={results['token_accuracy']:.4f} "
+              f"examples/sec={results['examples_per_sec']:.2f}")
+
+        # Save evaluation results
+        output_path = os.path.join(args.output_dir, f"{os.path.basename(os.path.normpath(checkpoint))}.json")
+        with open(output_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+        del model
+
+
+if __name__ == "__main__":
+    main()
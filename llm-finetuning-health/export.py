@@ -0,0 +1,90 @@
+import argparse
+import json
+import os
+import torch
+from transformers import AutoModelForCausalLM
+from utils import INT8_WEIGHTS_NAME, adapter_base_model, is_adapter, load_tokenizer
+
+# Configuration
+new_model = "Llama-2-7b-public-health-chat-finetune"
+TORCH_DTYPES = {"fp32": torch.float32, "bf16": torch.bfloat16, "fp16": torch.float16}
+
+
+def merge_adapter(adapter_path, torch_dtype=torch.float16):
+    """Load the base model in full precision (no bitsandbytes) and fold the LoRA weights into it."""
+    from peft import PeftModel
+
+    base_model = AutoModelForCausalLM.from_pretrained(adapter_base_model(adapter_path), torch_dtype=torch_dtype)
+    return PeftModel.from_pretrained(base_model, adapter_path).merge_and_unload()
+
+
+def quantize_int8(model):
+    """
+    Symmetric per-output-channel int8 quantization of every Linear weight.
+
+    Returns the tensors to save and the names of the quantized modules. Other
+    parameters are kept in fp32. A tied lm_head stays unquantized so it can
+    keep sharing the embedding matrix.
+    """
+    skip = {"lm_head"} if model.config.tie_word_embeddings else set()
+    tensors = {}
+    quantized = []
+    for name, module in model.named_modules():
+        if isinstance(module, torch.nn.Linear) and name not in skip:
+            weight = module.weight.detach().float()
+            scale = weight.abs().amax(dim=1).clamp(min=1e-8) / 127
+            tensors[f"{name}.weight"] = torch.round(weight / scale[:, None]).clamp(-127, 127).to(torch.int8)
+            tensors[f"{name}.weight_scale"] = scale
+            if module.bias is not None:
+                tensors[f"{name}.bias"] = module.bias.detach().float()
+            quantized.append(name)
+
+    quantized_set = set(quantized)
+    for key, value in model.state_dict().items():
+        module_name = key.rsplit(".", 1)[0]
+        if module_name in quantized_set or module_name in skip:
+            continue
+        # clone() so no two saved tensors share storage
+        tensors[key] = value.detach().float().contiguous().clone()
+    return tensors, quantized
+
+
+def save_int8(model, tokenizer, output_dir):
+    from safetensors.torch import save_file
+
+    os.makedirs(output_dir, exist_ok=True)
+    tensors, quantized = quantize_int8(model)
+    save_file(
+        tensors,
+        os.path.join(output_dir, INT8_WEIGHTS_NAME),
+        metadata={"format": "pt", "quantization": "int8-per-channel", "quantized_modules": json.dumps(quantized)},
+    )
+    model.config.save_pretrained(output_dir)
+    tokenizer.save_pretrained(output_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge a LoRA adapter into its base model and export it for serving")
+    parser.add_argument("--adapter", default=new_model, help="Adapter directory written by train.py")
+    parser.add_argument("--output", default=f"{new_model}-merged", help="Directory for the merged model")
+    parser.add_argument("--dtype", choices=list(TORCH_DTYPES), default="fp16", help="Precision of the merged weights")
+    parser.add_argument("--int8-output", default=None, help="Also write an int8 artifact for fast CPU loading here")
+    args = parser.parse_args()
+
+    if not is_adapter(args.adapter):
+        raise SystemExit(f"{args.adapter} is not a LoRA adapter directory (no adapter_config.json)")
+
+    tokenizer = load_tokenizer(args.adapter)
+    model = merge_adapter(args.adapter, TORCH_DTYPES[args.dtype])
+
+    model.save_pretrained(args.output, safe_serialization=True)
+    tokenizer.save_pretrained(args.output)
+    print(f"Merged model saved to {args.output}")
+
+    if args.int8_output:
+        save_int8(model, tokenizer, args.int8_output)
+        print(f"int8 model saved to {args.int8_output}")
+
+
+if __name__ == "__main__":
+    main()
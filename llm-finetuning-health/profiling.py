@@ -0,0 +1,132 @@
+import json
+import os
+import resource
+import statistics
+import time
+import torch
+from transformers import Trainer, TrainerCallback
+
+PHASES = ["data", "forward", "backward", "optimizer"]
+
+
+def _now():
+    # CUDA kernels run asynchronously; wait for them so timings are attributed correctly
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+    return time.perf_counter()
+
+
+def _peak_memory_mb():
+    memory = {"cpu_peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+    if torch.cuda.is_available():
+        memory["cuda_peak_allocated_mb"] = torch.cuda.max_memory_allocated() / 2 ** 20
+        memory["cuda_peak_reserved_mb"] = torch.cuda.max_memory_reserved() / 2 ** 20
+    return memory
+
+
+class StepProfiler(TrainerCallback):
+    """
+    Records per optimizer step how long was spent waiting for data, in the
+    forward pass, in the backward pass and in the optimizer (clipping, step,
+    scheduler, zero_grad), plus memory high-water marks. The report is
+    written as JSON when training ends.
+    """
+
+    def __init__(self, report_path):
+        self.report_path = report_path
+        self.steps = []
+        self._current = dict.fromkeys(PHASES, 0.0)
+        self._last_backward_end = None
+
+    def add(self, phase, seconds):
+        self._current[phase] += seconds
+
+    def mark_backward_end(self):
+        self._last_backward_end = _now()
+
+    def on_step_end(self, args, state, control, **kwargs):
+        if self._last_backward_end is not None:
+            self._current["optimizer"] += _now() - self._last_backward_end
+        step = {"step": state.global_step, **self._current}
+        step["total"] = sum(self._current[phase] for phase in PHASES)
+        self.steps.append(step)
+        self._current = dict.fromkeys(PHASES, 0.0)
+        self._last_backward_end = None
+
+    def on_train_end(self, args, state, control, **kwargs):
+        if not state.is_world_process_zero:
+            return
+        os.makedirs(os.path.dirname(self.report_path) or ".", exist_ok=True)
+        with open(self.report_path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+
+    def report(self):
+        # The first step includes warm-up (allocations, lazy init); keep it out of the summary
+        measured = self.steps[1:] or self.steps
+        summary = {}
+        for phase in PHASES + ["total"]:
+            values = sorted(step[phase] for step in measured)
+            if not values:
+                continue
+            summary[phase] = {
+                "mean_s": statistics.fmean(values),
+                "p50_s": values[len(values) // 2],
+                "p95_s": values[min(len(values) - 1, int(len(values) * 0.95))],
+                "share": sum(values) / max(sum(step["total"] for step in measured), 1e-12),
+            }
+        return {"steps": len(self.steps), "summary": summary, "memory": _peak_memory_mb(), "per_step": self.steps}
+
+
+class TimedDataLoader:
+    """Wraps a DataLoader and charges the time spent producing each batch to the data phase."""
+
+    def __init__(self, dataloader, profiler):
+        self.dataloader = dataloader
+        self.profiler = profiler
+
+    def __len__(self):
+        return len(self.dataloader)
+
+    def __getattr__(self, name):
+        return getattr(self.dataloader, name)
+
+    def __iter__(self):
+        iterator = iter(self.dataloader)
+        while True:
+            start = _now()
+            try:
+                batch = next(iterator)
+            except StopIteration:
+                return
+            self.profiler.add("data", _now() - start)
+            yield batch
+
+
+class ProfilingTrainer(Trainer):
+    """Trainer that reports forward, backward and data-loading time to a StepProfiler."""
+
+    def __init__(self, *args, step_profiler, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.step_profiler = step_profiler
+        self.add_callback(step_profiler)
+        self._forward_seconds = 0.0
+
+    def get_train_dataloader(self):
+        return TimedDataLoader(super().get_train_dataloader(), self.step_profiler)
+
+    def compute_loss(self, model, inputs, *args, **kwargs):
+        start = _now()
+        result = super().compute_loss(model, inputs, *args, **kwargs)
+        self._forward_seconds += _now() - start
+        return result
+
+    def training_step(self, model, inputs, *args, **kwargs):
+        self._forward_seconds = 0.0
+        start = _now()
+        loss = super().training_step(model, inputs, *args, **kwargs)
+        total = _now() - start
+        # training_step = forward (compute_loss) + backward
+        self.step_profiler.add("forward", self._forward_seconds)
+        self.step_profiler.add("backward", total - self._forward_seconds)
+        self.step_profiler.mark_backward_end()
+        return loss
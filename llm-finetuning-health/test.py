@@ -1,57 +1,164 @@
+import argparse
+import json
+import time
 import torch
-from datasets import load_dataset
-from transformers import AutoModelForCausalLM, AutoTokenizer
+import transformers
+from packaging import version
 from tqdm import tqdm
+from utils import DTYPES, length_bucketed_batches, load_model, load_test_split, load_tokenizer
 
 # Configuration
 new_model = "Llama-2-7b-public-health-chat-finetune"
 dataset_name = "sambanankhu/public-health-QA-handouts-instruct-Llama-2k"
 
-# Load fine-tuned model and tokenizer
-model = AutoModelForCausalLM.from_pretrained(new_model)
-tokenizer = AutoTokenizer.from_pretrained(new_model)
-
-# Load test dataset
-dataset = load_dataset(dataset_name)
-train_test_split = dataset["train"].train_test_split(test_size=0.1)
-test_dataset = train_test_split["test"]
-
-# Perplexity Calculation
-model.eval()
-total_loss = 0
-total_samples = 0
-
-for example in tqdm(test_dataset):
-    inputs = tokenizer(example["text"], return_tensors="pt", truncation=True, padding=True)
-    inputs = {k: v.to(model.device) for k, v in inputs.items()}
-
-    with torch.no_grad():
-        outputs = model(**inputs, labels=inputs["input_ids"])
-        loss = outputs.loss
-        total_loss += loss.item()
-        total_samples += 1
-
-perplexity = torch.exp(torch.tensor(total_loss / total_samples))
-print(f"Perplexity: {perplexity}")
-
-# Accuracy Calculation
-correct = 0
-total = 0
-
-for example in tqdm(test_dataset):
-    inputs = tokenizer(example["text"], return_tensors="pt", truncation=True, padding=True)
-    inputs = {k: v.to(model.device) for k, v in inputs.items()}
-
-    with torch.no_grad():
-        outputs = model(**inputs)
-        predictions = torch.argmax(outputs.logits, dim=-1)
-        correct += (predictions == inputs["input_ids"]).sum().item()
-        total += inputs["input_ids"].numel()
-
-accuracy = correct / total
-print(f"Accuracy: {accuracy}")
-
-# Save evaluation results
-with open("evaluation_results.txt", "w") as f:
-    f.write(f"Perplexity: {perplexity}\n")
-    f.write(f"Accuracy: {accuracy}\n")
\ No newline at end of file
+# Passing a pre-filled cache with several uncached prompt tokens to generate()
+# needs the cache-aware input slicing added in transformers 4.38
+PREFIX_CACHE_MIN_VERSION = "4.38.0"
+
+
+def split_prompt(text, marker="[/INST]"):
+    """Split a Llama-2 chat example into the prompt and the reference answer."""
+    idx = text.find(marker)
+    if idx == -1:
+        return text, ""
+    cut = idx + len(marker)
+    return text[:cut], text[cut:].replace("</s>", "").strip()
+
+
+def common_prefix_length(sequences):
+    shortest = min(len(seq) for seq in sequences)
+    length = 0
+    while length < shortest and all(seq[length] == sequences[0][length] for seq in sequences):
+        length += 1
+    # Keep at least one uncached token per prompt for generate() to consume
+    return min(length, shortest - 1)
+
+
+def build_prefix_cache(model, prefix_ids):
+    """Run the shared prefix (e.g. the system prompt) once and keep its KV cache."""
+    with torch.inference_mode():
+        outputs = model(input_ids=torch.tensor([prefix_ids], device=model.device), use_cache=True)
+    cache = outputs.past_key_values
+    return cache.to_legacy_cache() if hasattr(cache, "to_legacy_cache") else cache
+
+
+def expand_prefix_cache(legacy_cache, batch_size):
+    # generate() extends the cache in place, so each batch gets its own copy
+    from transformers import DynamicCache
+    return DynamicCache.from_legacy_cache(tuple(
+        (key.expand(batch_size, -1, -1, -1).contiguous(), value.expand(batch_size, -1, -1, -1).contiguous())
+        for key, value in legacy_cache
+    ))
+
+
+def generate_batch(model, tokenizer, prompt_ids, generation_kwargs, prefix_ids=None, prefix_cache=None):
+    """
+    Generate for a batch of tokenized prompts using left padding. When a
+    prefix cache is given, only the part of each prompt after the shared
+    prefix is run through the model; padding sits between the prefix and
+    the rest of the prompt and is masked out.
+    """
+    prefix_length = len(prefix_ids) if prefix_ids else 0
+    batch = tokenizer.pad(
+        {"input_ids": [ids[prefix_length:] for ids in prompt_ids]},
+        padding=True,
+        return_tensors="pt",
+    )
+    input_ids = batch["input_ids"]
+    attention_mask = batch["attention_mask"]
+
+    if prefix_cache is not None:
+        batch_size = input_ids.shape[0]
+        prefix = torch.tensor([prefix_ids] * batch_size)
+        input_ids = torch.cat([prefix, input_ids], dim=1)
+        attention_mask = torch.cat([torch.ones_like(prefix), attention_mask], dim=1)
+        generation_kwargs = dict(generation_kwargs, past_key_values=expand_prefix_cache(prefix_cache, batch_size))
+
+    input_ids = input_ids.to(model.device)
+    attention_mask = attention_mask.to(model.device)
+    with torch.inference_mode():
+        outputs = model.generate(input_ids=input_ids, attention_mask=attention_mask, **generation_kwargs)
+    return outputs[:, input_ids.shape[1]:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batched generation over the held-out split")
+    parser.add_argument("--model", default=new_model)
+    parser.add_argument("--dataset", default=dataset_name)
+    parser.add_argument("--dtype", choices=DTYPES, default="fp32")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--max-batch-tokens", type=int, default=4096, help="Cap on batch_size * longest prompt")
+    parser.add_argument("--max-new-tokens", type=int, default=128)
+    parser.add_argument("--decoding", choices=["greedy", "sample"], default="greedy")
+    parser.add_argument("--temperature", type=float, default=0.7)
+    parser.add_argument("--top-p", type=float, default=0.9)
+    parser.add_argument("--no-prefix-cache", action="store_true", help="Do not reuse the KV cache of the shared prompt prefix")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=42, help="Seed of the train/test split")
+    parser.add_argument("--output", default="generations.jsonl")
+    args = parser.parse_args()
+
+    tokenizer = load_tokenizer(args.model, padding_side="left")
+    model = load_model(args.model, dtype=args.dtype)
+    test_dataset = load_test_split(args.dataset, seed=args.seed, limit=args.limit)
+
+    examples = [split_prompt(text) for text in test_dataset["text"]]
+    # The dataset text already starts with <s>, so no extra special tokens
+    prompt_ids = tokenizer([prompt for prompt, _ in examples], add_special_tokens=False)["input_ids"]
+
+    generation_kwargs = {
+        "max_new_tokens": args.max_new_tokens,
+        "pad_token_id": tokenizer.pad_token_id,
+        "do_sample": args.decoding == "sample",
+    }
+    if args.decoding == "sample":
+        generation_kwargs.update(temperature=args.temperature, top_p=args.top_p)
+
+    prefix_ids = None
+    prefix_cache = None
+    if not args.no_prefix_cache:
+        if version.parse(transformers.__version__) < version.parse(PREFIX_CACHE_MIN_VERSION):
+            print(f"Prefix caching needs transformers>={PREFIX_CACHE_MIN_VERSION}, running without it")
+        else:
+            prefix_length = common_prefix_length(prompt_ids)
+            if prefix_length > 0:
+                prefix_ids = prompt_ids[0][:prefix_length]
+                prefix_cache = build_prefix_cache(model, prefix_ids)
+                print(f"Reusing KV cache for a {prefix_length}-token shared prefix")
+            else:
+                prefix_ids = None
+
+    batches = length_bucketed_batches([len(ids) for ids in prompt_ids], args.batch_size, args.max_batch_tokens)
+    total_new_tokens = 0
+    total_seconds = 0.0
+
+    with open(args.output, "w") as f:
+        for batch_indices in tqdm(batches):
+            start = time.perf_counter()
+            generated = generate_batch(
+                model, tokenizer, [prompt_ids[i] for i in batch_indices], generation_kwargs,
+                prefix_ids=prefix_ids, prefix_cache=prefix_cache
+            )
+            latency = time.perf_counter() - start
+            total_seconds += latency
+
+            for row, i in enumerate(batch_indices):
+                new_tokens = int((generated[row] != tokenizer.pad_token_id).sum())
+                total_new_tokens += new_tokens
+                prompt, reference = examples[i]
+                # Every example in a batch waits for the whole batch
+                f.write(json.dumps({
+                    "prompt": prompt,
+                    "reference": reference,
+                    "generated": tokenizer.decode(generated[row], skip_special_tokens=True).strip(),
+                    "new_tokens": new_tokens,
+                    "latency_s": latency,
+                    "batch_size": len(batch_indices),
+                }, ensure_ascii=False) + "\n")
+
+    print(f"Generated {total_new_tokens} tokens for {len(examples)} prompts in {total_seconds:.1f}s "
+          f"({total_new_tokens / total_seconds:.1f} tokens/sec)")
+
+
+if __name__ == "__main__":
+    main()
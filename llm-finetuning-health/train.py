@@ -1,117 +1,237 @@
+import argparse
+import json
 import os
 import torch
-from datasets import load_dataset
+import transformers
+import yaml
+from packaging import version
 from transformers import (
     AutoModelForCausalLM,
     AutoTokenizer,
     BitsAndBytesConfig,
+    Trainer,
     TrainingArguments,
 )
-from peft import LoraConfig
-from trl import SFTTrainer
-
-# Configuration
-model_name = "NousResearch/Llama-2-7b-chat-hf"
-dataset_name = "sambanankhu/public-health-QA-handouts-instruct-Llama-2k"
-new_model = "Llama-2-7b-public-health-chat-finetune"
-
-# QLoRA parameters
-lora_r = 64
-lora_alpha = 16
-lora_dropout = 0.1
-
-# bitsandbytes parameters
-use_4bit = True
-bnb_4bit_compute_dtype = "float16"
-bnb_4bit_quant_type = "nf4"
-use_nested_quant = False
-
-# Training parameters
-output_dir = "./results"
-num_train_epochs = 1
-per_device_train_batch_size = 4
-gradient_accumulation_steps = 1
-gradient_checkpointing = True
-max_grad_norm = 0.3
-learning_rate = 2e-4
-weight_decay = 0.001
-optim = "paged_adamw_32bit"
-lr_scheduler_type = "cosine"
-warmup_ratio = 0.03
-group_by_length = True
-save_steps = 0
-logging_steps = 25
-max_seq_length = None
-packing = False
-device_map = {"": 0}
-
-# Load dataset
-dataset = load_dataset(dataset_name, split="train")
-
-# Load tokenizer and model with QLoRA configuration
-compute_dtype = getattr(torch, bnb_4bit_compute_dtype)
-bnb_config = BitsAndBytesConfig(
-    load_in_4bit=use_4bit,
-    bnb_4bit_quant_type=bnb_4bit_quant_type,
-    bnb_4bit_compute_dtype=compute_dtype,
-    bnb_4bit_use_double_quant=use_nested_quant,
-)
+from transformers.trainer_utils import get_last_checkpoint
+from peft import LoraConfig, get_peft_model, prepare_model_for_kbit_training
+from data import PackedCollator, PaddingCollator, pack_dataset, padding_stats, tokenize_dataset
+from profiling import ProfilingTrainer, StepProfiler
+from utils import load_train_split
 
-model = AutoModelForCausalLM.from_pretrained(
-    model_name,
-    quantization_config=bnb_config,
-    device_map=device_map
-)
-model.config.use_cache = False
-model.config.pretraining_tp = 1
-
-tokenizer = AutoTokenizer.from_pretrained(model_name, trust_remote_code=True)
-tokenizer.pad_token = tokenizer.eos_token
-tokenizer.padding_side = "right"
-
-# Load LoRA configuration
-peft_config = LoraConfig(
-    lora_alpha=lora_alpha,
-    lora_dropout=lora_dropout,
-    r=lora_r,
-    bias="none",
-    task_type="CAUSAL_LM",
-)
+# Default configuration (QLoRA on a single CUDA GPU). Any key can be
+# overridden from a YAML file passed with --config, see configs/.
+DEFAULTS = {
+    # Model and data
+    "model_name": "NousResearch/Llama-2-7b-chat-hf",
+    "dataset_name": "sambanankhu/public-health-QA-handouts-instruct-Llama-2k",
+    "dataset_limit": None,
+    # Rows held out for eval.py and test.py (their --seed must match split_seed)
+    "test_size": 0.1,
+    "split_seed": 42,
+    "new_model": "Llama-2-7b-public-health-chat-finetune",
 
-# Set training parameters
-training_arguments = TrainingArguments(
-    output_dir=output_dir,
-    num_train_epochs=num_train_epochs,
-    per_device_train_batch_size=per_device_train_batch_size,
-    gradient_accumulation_steps=gradient_accumulation_steps,
-    optim=optim,
-    save_steps=save_steps,
-    logging_steps=logging_steps,
-    learning_rate=learning_rate,
-    weight_decay=weight_decay,
-    fp16=False,
-    bf16=False,
-    max_grad_norm=max_grad_norm,
-    warmup_ratio=warmup_ratio,
-    group_by_length=group_by_length,
-    lr_scheduler_type=lr_scheduler_type,
-    report_to="tensorboard"
-)
+    # QLoRA parameters
+    "lora_r": 64,
+    "lora_alpha": 16,
+    "lora_dropout": 0.1,
 
-# Set supervised fine-tuning parameters
-trainer = SFTTrainer(
-    model=model,
-    train_dataset=dataset,
-    peft_config=peft_config,
-    dataset_text_field="text",
-    max_seq_length=max_seq_length,
-    tokenizer=tokenizer,
-    args=training_arguments,
-    packing=packing,
-)
+    # bitsandbytes parameters
+    "use_4bit": True,
+    "bnb_4bit_compute_dtype": "float16",
+    "bnb_4bit_quant_type": "nf4",
+    "use_nested_quant": False,
+
+    # Training parameters
+    "output_dir": "./results",
+    "num_train_epochs": 1,
+    "max_steps": -1,
+    "per_device_train_batch_size": 4,
+    "gradient_accumulation_steps": 1,
+    "gradient_checkpointing": True,
+    "max_grad_norm": 0.3,
+    "learning_rate": 2e-4,
+    "weight_decay": 0.001,
+    "optim": "paged_adamw_32bit",
+    "lr_scheduler_type": "cosine",
+    "warmup_ratio": 0.03,
+    "group_by_length": True,
+    # Checkpoint every save_steps optimizer steps, keeping the newest save_total_limit
+    "save_steps": 200,
+    "save_total_limit": 3,
+    # Continue from the newest checkpoint in output_dir if there is one
+    "resume": True,
+    "logging_steps": 25,
+    "fp16": False,
+    "bf16": False,
+    "report_to": "tensorboard",
+    "max_seq_length": 1024,
+    "packing": True,
+    "dataset_cache_dir": "./cache",
+    "device_map": {"": 0},
+
+    # Write a per-step timing and memory report to <output_dir>/profile.json
+    "profile": False,
+}
+
+
+def load_config(path=None):
+    config = dict(DEFAULTS)
+    if path:
+        with open(path) as f:
+            overrides = yaml.safe_load(f) or {}
+        unknown = set(overrides) - set(DEFAULTS)
+        if unknown:
+            raise ValueError(f"Unknown config keys: {sorted(unknown)}")
+        config.update(overrides)
+    return config
+
+
+def build_model(config):
+    """Load the base model (4-bit when use_4bit) and wrap it with LoRA adapters."""
+    quantization_config = None
+    if config["use_4bit"]:
+        quantization_config = BitsAndBytesConfig(
+            load_in_4bit=True,
+            bnb_4bit_quant_type=config["bnb_4bit_quant_type"],
+            bnb_4bit_compute_dtype=getattr(torch, config["bnb_4bit_compute_dtype"]),
+            bnb_4bit_use_double_quant=config["use_nested_quant"],
+        )
+
+    model = AutoModelForCausalLM.from_pretrained(
+        config["model_name"],
+        quantization_config=quantization_config,
+        device_map=config["device_map"]
+    )
+    model.config.use_cache = False
+    model.config.pretraining_tp = 1
+
+    if config["use_4bit"]:
+        model = prepare_model_for_kbit_training(model, use_gradient_checkpointing=config["gradient_checkpointing"])
+    elif config["gradient_checkpointing"]:
+        model.gradient_checkpointing_enable()
+        model.enable_input_require_grads()
+
+    # Load LoRA configuration
+    peft_config = LoraConfig(
+        lora_alpha=config["lora_alpha"],
+        lora_dropout=config["lora_dropout"],
+        r=config["lora_r"],
+        bias="none",
+        task_type="CAUSAL_LM",
+    )
+    return get_peft_model(model, peft_config)
+
+
+def build_train_dataset(config, tokenizer, model):
+    """Tokenize once (cached on disk) and optionally pack into fixed-length sequences."""
+    dataset = load_train_split(config["dataset_name"], config["test_size"], config["split_seed"])
+    if config["dataset_limit"]:
+        dataset = dataset.select(range(min(config["dataset_limit"], len(dataset))))
+
+    tokenized_dataset = tokenize_dataset(dataset, tokenizer, config["max_seq_length"], config["dataset_cache_dir"])
+    if config["packing"]:
+        train_dataset = pack_dataset(tokenized_dataset, config["max_seq_length"], config["dataset_cache_dir"])
+        data_collator = PackedCollator(
+            tokenizer.pad_token_id,
+            use_4d_mask=getattr(model.config, "_attn_implementation", "eager") != "flash_attention_2",
+        )
+    else:
+        train_dataset = tokenized_dataset
+        data_collator = PaddingCollator(tokenizer.pad_token_id)
+    return train_dataset, data_collator
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fine-tune Llama-2 on the public health QA dataset")
+    parser.add_argument("--config", help="YAML file overriding the defaults in train.py, e.g. configs/cpu_smoke.yaml")
+    args = parser.parse_args()
+    config = load_config(args.config)
+
+    # Packed batches need custom 4D attention masks (or flash_attention_2)
+    if config["packing"] and version.parse(transformers.__version__) < version.parse("4.40.0"):
+        raise RuntimeError("packing needs transformers>=4.40; set packing: false for older versions")
+
+    tokenizer = AutoTokenizer.from_pretrained(config["model_name"], trust_remote_code=True)
+    tokenizer.pad_token = tokenizer.eos_token
+    tokenizer.padding_side = "right"
+
+    model = build_model(config)
+    train_dataset, data_collator = build_train_dataset(config, tokenizer, model)
+
+    padding = padding_stats(train_dataset["length"], config["per_device_train_batch_size"], config["packing"])
+    print(f"{len(train_dataset)} training sequences, padding ratio {padding['padding_ratio']:.1%}")
+
+    # Set training parameters
+    training_arguments = TrainingArguments(
+        output_dir=config["output_dir"],
+        num_train_epochs=config["num_train_epochs"],
+        max_steps=config["max_steps"],
+        per_device_train_batch_size=config["per_device_train_batch_size"],
+        gradient_accumulation_steps=config["gradient_accumulation_steps"],
+        optim=config["optim"],
+        save_strategy="steps" if config["save_steps"] else "no",
+        save_steps=config["save_steps"],
+        save_total_limit=config["save_total_limit"],
+        logging_steps=config["logging_steps"],
+        learning_rate=config["learning_rate"],
+        weight_decay=config["weight_decay"],
+        fp16=config["fp16"],
+        bf16=config["bf16"],
+        max_grad_norm=config["max_grad_norm"],
+        warmup_ratio=config["warmup_ratio"],
+        # Packed sequences all have (nearly) the same length
+        group_by_length=config["group_by_length"] and not config["packing"],
+        lr_scheduler_type=config["lr_scheduler_type"],
+        report_to=config["report_to"],
+        use_cpu=config["device_map"] == "cpu",
+    )
+
+    trainer_kwargs = dict(
+        model=model,
+        train_dataset=train_dataset,
+        data_collator=data_collator,
+        tokenizer=tokenizer,
+        args=training_arguments,
+    )
+    if config["profile"]:
+        profiler = StepProfiler(os.path.join(config["output_dir"], "profile.json"))
+        trainer = ProfilingTrainer(step_profiler=profiler, **trainer_kwargs)
+    else:
+        trainer = Trainer(**trainer_kwargs)
+
+    # Resume after a crash or preemption; the tokenized/packed dataset comes
+    # from the same cache, so the data order is identical
+    last_checkpoint = None
+    if config["resume"] and os.path.isdir(config["output_dir"]):
+        last_checkpoint = get_last_checkpoint(config["output_dir"])
+    resumed_step = 0
+    if last_checkpoint:
+        resumed_step = int(last_checkpoint.rsplit("-", 1)[-1])
+        print(f"Resuming from {last_checkpoint}")
+
+    # Train model
+    train_result = trainer.train(resume_from_checkpoint=last_checkpoint)
+
+    # Report effective throughput: real (non-padding) tokens per second
+    runtime = train_result.metrics["train_runtime"]
+    sequences_seen = (train_result.global_step - resumed_step) * config["per_device_train_batch_size"] * config["gradient_accumulation_steps"]
+    real_tokens_per_sequence = padding["real_tokens"] / len(train_dataset)
+    throughput = {
+        "packing": config["packing"],
+        "max_seq_length": config["max_seq_length"],
+        "train_runtime": runtime,
+        "effective_tokens_per_sec": sequences_seen * real_tokens_per_sequence / runtime,
+        **padding,
+    }
+    print(f"Effective tokens/sec: {throughput['effective_tokens_per_sec']:.1f}, padding ratio: {padding['padding_ratio']:.1%}")
+    os.makedirs(config["output_dir"], exist_ok=True)
+    with open(os.path.join(config["output_dir"], "throughput.json"), "w") as f:
+        json.dump(throughput, f, indent=2)
+
+    # Save the LoRA adapter with its tokenizer; export.py merges it into the base model
+    trainer.model.save_pretrained(config["new_model"])
+    tokenizer.save_pretrained(config["new_model"])
 
-# Train model
-trainer.train()
 
-# Save trained model
-trainer.model.save_pretrained(new_model)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import json
+import os
+import torch
+from datasets import load_dataset
+from transformers import AutoConfig, AutoModelForCausalLM, AutoTokenizer
+
+# Supported --dtype values for inference
+DTYPES = ["fp32", "bf16", "fp16", "int8"]
+
+# Written by export.py --int8-output
+INT8_WEIGHTS_NAME = "model.int8.safetensors"
+
+
+def is_adapter(model_path):
+    return os.path.isfile(os.path.join(model_path, "adapter_config.json"))
+
+
+def is_int8_artifact(model_path):
+    return os.path.isfile(os.path.join(model_path, INT8_WEIGHTS_NAME))
+
+
+def adapter_base_model(adapter_path):
+    with open(os.path.join(adapter_path, "adapter_config.json")) as f:
+        return json.load(f)["base_model_name_or_path"]
+
+
+def load_tokenizer(model_path, padding_side="right"):
+    # Adapters saved before the tokenizer was stored alongside them use the base model's
+    if is_adapter(model_path) and not os.path.isfile(os.path.join(model_path, "tokenizer_config.json")):
+        model_path = adapter_base_model(model_path)
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    tokenizer.padding_side = padding_side
+    return tokenizer
+
+
+def load_model(model_path, dtype="fp32"):
+    """
+    Load a causal LM for inference.
+
+    bf16/fp16 load the weights in that precision. int8 applies dynamic int8
+    quantization to the Linear layers, which is the fast path on CPU.
+
+    model_path can be a full model, an int8 artifact written by export.py
+    (always loaded as int8), or a LoRA adapter directory. Adapters are merged
+    into their base model on load, which needs peft; export.py does the merge
+    once so serving does not.
+    """
+    if dtype not in DTYPES:
+        raise ValueError(f"Unsupported dtype '{dtype}', expected one of {DTYPES}")
+
+    if is_int8_artifact(model_path):
+        return load_int8_model(model_path)
+
+    torch_dtype = {"bf16": torch.bfloat16, "fp16": torch.float16}.get(dtype, torch.float32)
+    if is_adapter(model_path):
+        from peft import PeftModel
+        base_model = AutoModelForCausalLM.from_pretrained(adapter_base_model(model_path), torch_dtype=torch_dtype)
+        model = PeftModel.from_pretrained(base_model, model_path).merge_and_unload()
+    else:
+        model = AutoModelForCausalLM.from_pretrained(model_path, torch_dtype=torch_dtype)
+
+    if dtype == "int8":
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    model.eval()
+    return model
+
+
+def load_int8_model(model_path):
+    """
+    Load an int8 artifact written by export.py. Linear weights are stored as
+    int8 with one fp32 scale per output channel and become dynamically
+    quantized Linear layers directly, without materializing fp32 weights.
+    """
+    from safetensors import safe_open
+    from transformers.modeling_utils import no_init_weights
+
+    config = AutoConfig.from_pretrained(model_path)
+    # Parameters are allocated but not initialized; everything is overwritten below
+    with no_init_weights():
+        model = AutoModelForCausalLM.from_config(config, torch_dtype=torch.float32)
+
+    with safe_open(os.path.join(model_path, INT8_WEIGHTS_NAME), framework="pt") as f:
+        quantized = set(json.loads(f.metadata()["quantized_modules"]))
+        modules = dict(model.named_modules())
+        for name in quantized:
+            parent_name, _, child_name = name.rpartition(".")
+            linear = modules[name]
+            weight = torch._make_per_channel_quantized_tensor(
+                f.get_tensor(f"{name}.weight"),
+                f.get_tensor(f"{name}.weight_scale").double(),
+                torch.zeros(linear.out_features, dtype=torch.long),
+                0,
+            )
+            qlinear = torch.ao.nn.quantized.dynamic.Linear(linear.in_features, linear.out_features, dtype=torch.qint8)
+            bias = f.get_tensor(f"{name}.bias") if linear.bias is not None else None
+            qlinear.set_weight_bias(weight, bias)
+            setattr(modules[parent_name] if parent_name else model, child_name, qlinear)
+
+        state_dict = {
+            key: f.get_tensor(key) for key in f.keys()
+            if key.rsplit(".", 1)[0] not in quantized
+        }
+    model.load_state_dict(state_dict, strict=False)
+    model.tie_weights()
+    model.eval()
+    return model
+
+
+def split_dataset(dataset_name, test_size=0.1, seed=42):
+    """Train/test split of the dataset's train split, identical across scripts for the same seed."""
+    return load_dataset(dataset_name, split="train").train_test_split(test_size=test_size, seed=seed)
+
+
+def load_train_split(dataset_name, test_size=0.1, seed=42):
+    """The training data without the held-out rows of load_test_split."""
+    return split_dataset(dataset_name, test_size, seed)["train"]
+
+
+def load_test_split(dataset_name, test_size=0.1, seed=42, limit=None):
+    """Held-out split: train.py leaves these rows out for the same test_size and seed."""
+    test_dataset = split_dataset(dataset_name, test_size, seed)["test"]
+    if limit:
+        test_dataset = test_dataset.select(range(min(limit, len(test_dataset))))
+    return test_dataset
+
+
+def length_bucketed_batches(lengths, batch_size, max_tokens=None):
+    """
+    Group example indices into batches of similar length so little compute
+    is spent on padding. With max_tokens, a batch is also closed once
+    batch_size * longest_length would exceed it.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    batches = []
+    batch = []
+    longest = 0
+    for i in order:
+        candidate_longest = max(longest, lengths[i])
+        too_many_tokens = max_tokens and batch and candidate_longest * (len(batch) + 1) > max_tokens
+        if len(batch) == batch_size or too_many_tokens:
+            batches.append(batch)
+            batch = []
+            candidate_longest = lengths[i]
+        batch.append(i)
+        longest = candidate_longest
+    if batch:
+        batches.append(batch)
+    return batches
@@ -0,0 +1,323 @@
+"""
+Question-trend analytics: which IDSR topics HSAs ask about, per district and week.
+
+Each question gets a topic from a keyword model (the priority disease it
+mentions, else the surveillance activity, else "other"), assigned a batch
+at a time. Questions are counted per week, district of the asking HSA's
+facility, section and topic into a Parquet dataset with one directory per
+week, which the /reports trend and heatmap endpoints load into memory:
+
+    <ANALYTICS_DIR>/question_topics/week=2024-09-16/part-<run>.parquet
+    <ANALYTICS_DIR>/question_topics/_state.json
+
+Runs are incremental: _state.json holds the (timestamp, id) of the last
+chat processed and a run only reads the chats after it, so a nightly run
+touches the day's new chats only:
+
+    python -m app.analytics
+    python -m app.analytics --rebuild   # reprocess every chat
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import uuid
+from collections import Counter
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Optional
+import pandas as pd
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import Session
+from app.api.v1.models import ChatHistory, Facility, User
+from app.config import settings
+
+# Bump when the keywords change; the next run then reprocesses every chat
+TOPIC_MODEL_VERSION = 1
+
+# IDSR priority diseases and conditions. Keywords are regular expressions
+# matched at the start of a word, lower case; Chichewa names are included
+DISEASE_TOPICS = {
+    "cholera": [r"cholera", r"kolera", r"rice[- ]water"],
+    "measles": [r"measles", r"chikuku", r"rubella"],
+    "malaria": [r"malaria", r"malungo", r"plasmodium", r"mrdt", r"artemether"],
+    "polio_afp": [r"polio", r"afp\b", r"acute flaccid", r"flaccid paralysis"],
+    "viral_haemorrhagic_fever": [r"ebola", r"marburg", r"lassa", r"h(a)?emorrhagic", r"vhf\b", r"crimean"],
+    "covid_19": [r"covid", r"corona", r"sars-cov"],
+    "influenza_sari": [r"influenza", r"\bflu\b", r"sari\b", r"\bili\b", r"severe acute respiratory"],
+    "tuberculosis": [r"tuberculosis", r"\btb\b", r"mdr-tb", r"xdr-tb"],
+    "meningitis": [r"meningitis", r"meningococcal", r"stiff neck"],
+    "typhoid": [r"typhoid", r"enteric fever"],
+    "diarrhoea_dysentery": [r"diarr?h(o)?ea", r"dysentery", r"bloody stool", r"shigell", r"ors\b"],
+    "anthrax": [r"anthrax"],
+    "rabies": [r"rabies", r"dog bite", r"animal bite"],
+    "plague": [r"plague", r"bubonic", r"pneumonic"],
+    "yellow_fever": [r"yellow fever"],
+    "mpox": [r"mpox", r"monkeypox", r"monkey pox"],
+    "neonatal_tetanus": [r"tetanus"],
+    "maternal_perinatal_death": [r"maternal death", r"perinatal death", r"neonatal death", r"stillbirth", r"died during (pregnancy|delivery)"],
+    "malnutrition": [r"malnutrition", r"malnourish", r"kwashiorkor", r"marasmus", r"muac\b", r"wasting"],
+    "hiv_sti": [r"hiv\b", r"aids\b", r"sexually transmitted", r"sti\b", r"syphilis", r"gonorrh"],
+}
+
+# What about surveillance the question asks, when it names no disease
+ACTIVITY_TOPICS = {
+    "case_definition": [r"case definition", r"suspected case", r"probable case", r"confirmed case", r"symptom", r"signs?\b"],
+    "reporting": [r"report", r"notif", r"weekly", r"immediate", r"within 24", r"forms?\b", r"register"],
+    "outbreak_response": [r"outbreak", r"epidemic", r"alert", r"threshold", r"respon", r"investigat", r"contact tracing", r"isolat", r"quarantin"],
+    "data_analysis": [r"analy", r"trend", r"graph", r"chart", r"attack rate", r"case fatality", r"incidence", r"line list"],
+    "risk_communication": [r"risk communication", r"community", r"awareness", r"health education", r"rumou?r", r"message"],
+    "eidsr": [r"eidsr", r"electronic", r"dhis", r"sms\b", r"mobile", r"tablet", r"phone"],
+    "specimens": [r"specimen", r"sample", r"laborator", r"\blab\b", r"rdt\b", r"test kit", r"swab"],
+}
+
+OTHER_TOPIC = "other"
+TOPICS = list(DISEASE_TOPICS) + list(ACTIVITY_TOPICS) + [OTHER_TOPIC]
+
+DATASET = "question_topics"
+COLUMNS = ["week", "district_id", "section_id", "topic", "question_count"]
+
+
+def _compile(topics: dict) -> dict:
+    return {topic: re.compile(r"\b(?:" + "|".join(keywords) + ")") for topic, keywords in topics.items()}
+
+
+_DISEASE_PATTERNS = _compile(DISEASE_TOPICS)
+_ACTIVITY_PATTERNS = _compile(ACTIVITY_TOPICS)
+
+
+def classify(questions: pd.Series) -> pd.Series:
+    """Topic of each question: the disease named most often, else the activity, else "other"."""
+    text = questions.fillna("").str.lower()
+    topics = pd.Series(OTHER_TOPIC, index=questions.index, dtype=object)
+    if text.empty:
+        return topics
+    for patterns in (_DISEASE_PATTERNS, _ACTIVITY_PATTERNS):
+        undecided = topics == OTHER_TOPIC
+        if not undecided.any():
+            break
+        scores = pd.DataFrame({topic: text[undecided].str.count(pattern) for topic, pattern in patterns.items()})
+        # idxmax takes the first of equal scores, i.e. the earlier topic
+        matched = scores.max(axis=1) > 0
+        topics[matched[matched].index] = scores[matched].idxmax(axis=1)
+    return topics
+
+
+def week_of(day: date) -> date:
+    """Monday of the day's ISO week."""
+    return day - timedelta(days=day.weekday())
+
+
+def dataset_path(root) -> Path:
+    return Path(root) / DATASET
+
+
+# Incremental processing
+
+def _read_state(path: Path) -> dict:
+    try:
+        with open(path / "_state.json") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _write_json(file: Path, data: dict):
+    tmp = file.with_name("." + file.name + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, file)
+
+
+def _new_chats(db: Session, watermark: Optional[dict], cutoff: datetime, batch_size: int):
+    """Chats after the watermark and before the cutoff, in (timestamp, id) order, a batch at a time."""
+    after = (datetime.fromisoformat(watermark["timestamp"]), uuid.UUID(watermark["id"])) if watermark else None
+    while True:
+        query = (
+            select(ChatHistory.id, ChatHistory.timestamp, ChatHistory.question, ChatHistory.section_id, Facility.district_id)
+            .outerjoin(User, User.id == ChatHistory.user_id)
+            .outerjoin(Facility, Facility.id == User.facility_id)
+            .where(ChatHistory.timestamp < cutoff)
+            .order_by(ChatHistory.timestamp, ChatHistory.id)
+            .limit(batch_size)
+        )
+        if after:
+            query = query.where(tuple_(ChatHistory.timestamp, ChatHistory.id) > after)
+        batch = pd.DataFrame(db.execute(query).all(), columns=["id", "timestamp", "question", "section_id", "district_id"])
+        if batch.empty:
+            return
+        yield batch
+        last = batch.iloc[-1]
+        after = (last["timestamp"].to_pydatetime(), last["id"])
+        if len(batch) < batch_size:
+            return
+
+
+def _id(value) -> Optional[str]:
+    return None if value is None or pd.isna(value) else str(value)
+
+
+def _count(batch: pd.DataFrame) -> Counter:
+    topics = classify(batch["question"])
+    weeks = batch["timestamp"].dt.date.map(week_of)
+    return Counter(zip(weeks, batch["district_id"].map(_id), batch["section_id"].map(_id), topics))
+
+
+def _write_parts(path: Path, run: str, counts: Counter) -> int:
+    """Write this run's counts, one part per week, replacing what an interrupted attempt left."""
+    for stale in path.glob(f"week=*/part-{run}.parquet"):
+        stale.unlink()
+    frame = pd.DataFrame(
+        [(week, district, section, topic, count) for (week, district, section, topic), count in counts.items()],
+        columns=COLUMNS
+    )
+    for week, rows in frame.groupby("week"):
+        directory = path / f"week={week.isoformat()}"
+        directory.mkdir(parents=True, exist_ok=True)
+        tmp = directory / f".part-{run}.parquet.tmp"
+        rows.astype({"question_count": "int64"}).to_parquet(tmp, index=False)
+        os.replace(tmp, directory / f"part-{run}.parquet")
+    return frame["week"].nunique()
+
+
+def process_new_questions(db: Session, root, batch_size: int, settle: timedelta, rebuild: bool = False) -> dict:
+    """
+    Classify and count the chats added since the last run. A run that fails
+    part way leaves the state untouched and is simply repeated: its parts
+    are named after the watermark it started from, so they are overwritten.
+    """
+    path = dataset_path(root)
+    state = _read_state(path)
+    if state and state.get("model_version") != TOPIC_MODEL_VERSION:
+        rebuild = True
+    if rebuild:
+        # Start over next to the current dataset, which stays readable until the swap
+        target = path.with_name(DATASET + ".rebuild")
+        shutil.rmtree(target, ignore_errors=True)
+        watermark, questions = None, 0
+    else:
+        target = path
+        watermark, questions = state.get("watermark"), state.get("questions", 0)
+    target.mkdir(parents=True, exist_ok=True)
+
+    run = hashlib.sha1(json.dumps(watermark, sort_keys=True).encode()).hexdigest()[:16]
+    cutoff = datetime.now() - settle
+    counts = Counter()
+    processed = 0
+    for batch in _new_chats(db, watermark, cutoff, batch_size):
+        counts.update(_count(batch))
+        processed += len(batch)
+        last = batch.iloc[-1]
+        watermark = {"timestamp": last["timestamp"].isoformat(), "id": str(last["id"])}
+    weeks = _write_parts(target, run, counts) if counts else 0
+
+    state = {
+        "model_version": TOPIC_MODEL_VERSION,
+        "watermark": watermark,
+        "questions": questions + processed,
+        "processed_through": cutoff.isoformat(),
+    }
+    _write_json(target / "_state.json", state)
+    if rebuild:
+        previous = path.with_name(DATASET + ".previous")
+        shutil.rmtree(previous, ignore_errors=True)
+        if path.exists():
+            os.replace(path, previous)
+        os.replace(target, path)
+        shutil.rmtree(previous, ignore_errors=True)
+    return {"processed": processed, "weeks": weeks, "rebuilt": rebuild, **state}
+
+
+# Queries
+
+class QuestionTopics:
+    """
+    The dataset held in memory for the report endpoints, collapsed to one
+    row per group. It is re-read when a run has written a new state file.
+    """
+
+    def __init__(self, root):
+        self.path = dataset_path(root)
+        self._lock = threading.Lock()
+        self._loaded_version = None
+        self._frame = pd.DataFrame(columns=COLUMNS)
+        self._state = {}
+
+    def _current(self):
+        try:
+            version = (self.path / "_state.json").stat().st_mtime_ns
+        except FileNotFoundError:
+            # Not built yet, or a rebuild is swapping directories
+            return self._frame, self._state
+        with self._lock:
+            if version != self._loaded_version:
+                parts = [pd.read_parquet(part) for part in sorted(self.path.glob("week=*/part-*.parquet"))]
+                frame = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=COLUMNS)
+                frame = frame.groupby(COLUMNS[:-1], dropna=False, as_index=False)["question_count"].sum()
+                frame["week"] = pd.to_datetime(frame["week"]).dt.date
+                self._frame, self._state = frame, _read_state(self.path)
+                self._loaded_version = version
+            return self._frame, self._state
+
+    def processed_through(self) -> Optional[datetime]:
+        value = self._current()[1].get("processed_through")
+        return datetime.fromisoformat(value) if value else None
+
+    def _select(self, start: date, end: date, district_id=None, section_id=None, topic=None) -> pd.DataFrame:
+        frame = self._current()[0]
+        rows = frame[(frame["week"] >= start) & (frame["week"] <= end)]
+        if district_id:
+            rows = rows[rows["district_id"] == str(district_id)]
+        if section_id:
+            rows = rows[rows["section_id"] == str(section_id)]
+        if topic:
+            rows = rows[rows["topic"] == topic]
+        return rows
+
+    def trends(self, start: date, end: date, district_id=None, section_id=None, topic=None) -> list:
+        """(week, topic, count) for every week and topic with questions, by week."""
+        rows = self._select(start, end, district_id, section_id, topic)
+        totals = rows.groupby(["week", "topic"], as_index=False)["question_count"].sum()
+        totals["order"] = totals["topic"].map(TOPICS.index)
+        totals = totals.sort_values(["week", "order"])
+        return [(week, topic, int(count)) for week, topic, count in zip(totals["week"], totals["topic"], totals["question_count"])]
+
+    def heatmap(self, start: date, end: date, section_id=None) -> tuple:
+        """Topics with questions, and per district (None: HSAs without one) the count of each."""
+        rows = self._select(start, end, section_id=section_id)
+        table = rows.pivot_table(
+            index=rows["district_id"].fillna(""), columns="topic", values="question_count", aggfunc="sum", fill_value=0
+        )
+        topics = [topic for topic in TOPICS if topic in table.columns]
+        table = table[topics]
+        return topics, [(district or None, [int(count) for count in counts]) for district, counts in table.iterrows()]
+
+
+question_topics = QuestionTopics(settings.ANALYTICS_DIR)
+
+
+def main():
+    from app.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Classify new HSA questions by topic and count them per district and week")
+    parser.add_argument("--rebuild", action="store_true", help="reprocess every chat, e.g. after chats were deleted")
+    parser.add_argument("--batch-size", type=int, default=settings.ANALYTICS_BATCH_SIZE)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        result = process_new_questions(
+            db, settings.ANALYTICS_DIR, args.batch_size, timedelta(minutes=settings.ANALYTICS_SETTLE_MINUTES), args.rebuild
+        )
+    finally:
+        db.close()
+    action = "Rebuilt" if result["rebuilt"] else "Updated"
+    print(f"{action} {dataset_path(settings.ANALYTICS_DIR)}: {result['processed']} new questions in {result['weeks']} weeks, "
+          f"{result['questions']} in total, processed through {result['processed_through']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""
+Async counterparts of the operations in crud.py, for `async def` endpoints
+using get_async_db. Same names, arguments and results, except that every
+function is a coroutine taking an AsyncSession.
+
+AsyncSession cannot lazy load, so relationships the callers read (User.role,
+Handout.created_by, Handout.section) are loaded eagerly here.
+"""
+from datetime import datetime, timedelta
+from fastapi import HTTPException, status
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from app.api.v1.models import (
+    Handout, User, Role, ChatHistory, FAQ, District, Facility, Section
+)
+from app.api.v1.schemas import (
+    HSACreateRequest, HandoutCreate, SectionCreate, UserCreate, ChatHistoryCreate, DistrictCreate,
+    FacilityCreate, UserRole
+)
+from uuid import uuid4
+from pydantic import UUID4
+from app.security import hash_password_async, verify_password_async
+
+
+async def _first(db: AsyncSession, statement):
+    return (await db.execute(statement)).scalars().first()
+
+
+async def _role_id(db: AsyncSession, name: str):
+    return await db.scalar(select(Role.id).where(Role.name == name))
+
+
+def _user_query():
+    return select(User).options(joinedload(User.role))
+
+
+async def get_user_by_email(db: AsyncSession, email: str):
+    return await _first(db, _user_query().where(User.email == email))
+
+async def get_user_by_phone(db: AsyncSession, phone: str):
+    return await _first(db, _user_query().where(User.phone == phone))
+
+async def create_user(db: AsyncSession, user: UserCreate, hashed_password: str = None):
+    role = await _first(db, select(Role).where(Role.name == user.role.lower()))
+    if not role:
+        raise ValueError(f"Role '{user.role}' Does not exist.")
+
+    if hashed_password is None:
+        hashed_password = await hash_password_async(user.password)
+
+    db_user = User(
+        id=uuid4(),
+        fullname=user.fullname.title(),
+        email=user.email.lower(),
+        phone=user.phone,
+        password=hashed_password,
+        role=role
+    )
+
+    if user.role == UserRole.HSA:
+        if not user.facility_id:
+            raise ValueError("facility_id is required for HSAs.")
+        db_user.facility_id = user.facility_id
+
+    db.add(db_user)
+    await db.commit()
+    return db_user
+
+
+async def _create_account(db: AsyncSession, data, role: str, otp: str, facility_id=None):
+    # Check if the user already exists by email
+    if await db.scalar(select(User.id).where(User.email == data.email)):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User with this email already exists")
+
+    new_user = User(
+        id=uuid4(),
+        fullname=data.fullname.title(),
+        email=data.email.lower(),
+        phone=data.phone if data.phone else "",
+        password=None,  # set when the account is claimed with the OTP
+        facility_id=facility_id,
+        role_id=await _role_id(db, role),
+        otp=otp,
+        otp_expires_at=datetime.now() + timedelta(minutes=100)
+    )
+    db.add(new_user)
+    await db.commit()
+    return new_user
+
+async def create_hsa_account(db: AsyncSession, hsa_data: HSACreateRequest, otp: str):
+    return await _create_account(db, hsa_data, "hsa", otp, facility_id=hsa_data.facility_id)
+
+async def create_instructor_account(db: AsyncSession, instructor_data: UserCreate, otp: str):
+    return await _create_account(db, instructor_data, "instructor", otp)
+
+async def create_admin_account(db: AsyncSession, admin_data: UserCreate, otp: str):
+    return await _create_account(db, admin_data, "admin", otp)
+
+
+async def create_chat_history(db: AsyncSession, chat_history: ChatHistoryCreate, section_id: UUID4, user_id: UUID4):
+    db_chat_history = ChatHistory(
+        id=uuid4(),
+        question=chat_history.question,
+        response=chat_history.response,
+        section_id=section_id,
+        user_id=user_id
+    )
+    db.add(db_chat_history)
+    await db.commit()
+    await db.refresh(db_chat_history)
+    return db_chat_history
+
+async def get_chat_histories(db: AsyncSession, section_id: UUID4):
+    # Columns only, as dicts: no ORM objects to build for large sections
+    rows = await db.execute(
+        select(
+            ChatHistory.id,
+            ChatHistory.question,
+            ChatHistory.response,
+            ChatHistory.timestamp,
+            ChatHistory.section_id,
+            ChatHistory.user_id
+        ).where(ChatHistory.section_id == section_id)
+    )
+    return [row._asdict() for row in rows]
+
+async def delete_chat_history(db: AsyncSession, chat_history_id: UUID4):
+    chat_history = await db.get(ChatHistory, chat_history_id)
+    if chat_history:
+        await db.delete(chat_history)
+        await db.commit()
+    return chat_history
+
+
+async def create_district(db: AsyncSession, district: DistrictCreate):
+    existing_district = await db.get(District, district.id)
+    if existing_district:
+        return existing_district
+
+    db_district = District(id=district.id, name=district.name)
+    db.add(db_district)
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise
+    return db_district
+
+async def create_facility(db: AsyncSession, facility: FacilityCreate):
+    db_facility = Facility(
+        id=facility.id,
+        name=facility.name,
+        facility_type=facility.facility_type,
+        managing_authority=facility.managing_authority,
+        urban_rural=facility.urban_rural,
+        district_id=facility.district_id
+    )
+    db.add(db_facility)
+    await db.commit()
+    return db_facility
+
+
+async def get_sections(db: AsyncSession):
+    return (await db.execute(select(Section))).scalars().all()
+
+async def get_section(db: AsyncSession, section_id: UUID4):
+    return await db.get(Section, section_id)
+
+async def create_section(db: AsyncSession, section: SectionCreate):
+    db_section = Section(name=section.name)
+    db.add(db_section)
+    await db.commit()
+    await db.refresh(db_section)
+    return db_section
+
+async def update_section(db: AsyncSession, section_id: UUID4, section: SectionCreate):
+    db_section = await db.get(Section, section_id)
+    if db_section:
+        db_section.name = section.name
+        await db.commit()
+    return db_section
+
+async def delete_section(db: AsyncSession, section_id: UUID4):
+    db_section = await db.get(Section, section_id)
+    if db_section:
+        await db.delete(db_section)
+        await db.commit()
+    return db_section
+
+
+async def get_faqs_by_district(db: AsyncSession, district_id: UUID4):
+    statement = select(FAQ).join(User, FAQ.hsa_id == User.id).join(Facility).where(Facility.district_id == district_id)
+    return (await db.execute(statement)).scalars().all()
+
+async def get_faqs_by_facility(db: AsyncSession, facility_id: UUID4):
+    statement = select(FAQ).where(FAQ.hsa_id == User.id, User.facility_id == facility_id)
+    return (await db.execute(statement)).scalars().all()
+
+
+async def get_users(db: AsyncSession):
+    return (await db.execute(_user_query())).scalars().all()
+
+async def get_user(db: AsyncSession, user_id: UUID4):
+    return await _first(db, _user_query().where(User.id == user_id))
+
+async def update_user(db: AsyncSession, user_id: UUID4, user_update: UserCreate):
+    user = await get_user(db, user_id)
+    if user:
+        user.fullname = user_update.fullname
+        user.email = user_update.email
+        user.phone = user_update.phone
+        user.role_id = await _role_id(db, user_update.role.lower())
+        user.facility_id = user_update.facility_id  # Update facility ID if applicable
+        await db.commit()
+        await db.refresh(user, ["role"])
+    return user
+
+async def delete_user(db: AsyncSession, user_id: UUID4):
+    user = await get_user(db, user_id)
+    if user:
+        await db.delete(user)
+        await db.commit()
+    return user
+
+async def update_user_password(db: AsyncSession, user_id: UUID4, new_password: str):
+    user = await get_user(db, user_id)
+    if user:
+        user.password = await hash_password_async(new_password)
+        await db.commit()
+    return user
+
+async def verify_and_update_user_password(db: AsyncSession, user_id: UUID4, old_password: str, new_password: str):
+    user = await get_user(db, user_id)
+    if not user:
+        return None
+
+    valid, _ = await verify_password_async(old_password, user.password)
+    if not valid:
+        return None
+
+    user.password = await hash_password_async(new_password)
+    await db.commit()
+    return user
+
+async def update_user_info_in_db(
+    db: AsyncSession, user_id: UUID4, fullname: str, email: str, phone: str
+) -> User:
+    user = await get_user(db, user_id)
+    if not user:
+        return None
+    user.fullname = fullname
+    user.email = email
+    user.phone = phone
+    await db.commit()
+    return user
+
+
+async def create_handout(db: AsyncSession, handout: HandoutCreate, user_id: UUID4):
+    new_handout = Handout(
+        title=handout.title,
+        content=handout.content,
+        created_by_id=user_id,
+        section_id=handout.section_id,
+        created_at=datetime.now()
+    )
+    db.add(new_handout)
+    await db.commit()
+    await db.refresh(new_handout)
+    return new_handout
+
+async def get_recent_handouts(db: AsyncSession, user_id: UUID4, limit: int = 5):
+    statement = select(Handout).where(Handout.created_by_id == user_id)\
+        .order_by(Handout.created_at.desc()).limit(limit)
+    return (await db.execute(statement)).scalars().all()
+
+async def delete_handout(db: AsyncSession, handout_id: UUID4, user_id: UUID4):
+    handout = await db.get(Handout, handout_id)
+
+    if handout is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Handout not found")
+
+    # Check if the user is authorized to delete the handout (instructor/admin)
+    if handout.created_by_id != user_id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to delete this handout")
+
+    await db.delete(handout)
+    await db.commit()
+
+    return {"detail": "Handout deleted successfully"}
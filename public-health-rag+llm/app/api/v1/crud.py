@@ -3,18 +3,16 @@ from fastapi import HTTPException, status
 # from grpc import Status
 from sqlalchemy.orm import Session
 from app.api.v1.models import (
-    Handout, User, Role, ChatHistory, FAQ, District, Facility, Section
+    Handout, User, Role, ChatHistory, FAQ, District, Facility, Section, UsedRefreshToken
 )
 from app.api.v1.schemas import (
     HSACreateRequest, HandoutCreate, SectionCreate, UserCreate, ChatCreate, ChatHistoryCreate, DistrictCreate,
     FacilityCreate, UserRole
 )
-from passlib.context import CryptContext
 from uuid import uuid4
 from pydantic import UUID4
 from sqlalchemy.exc import IntegrityError
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from app.security import hash_password, token_hash, verify_password
 
 
 
@@ -25,12 +23,28 @@ def get_user_by_email(db: Session, email: str):
 def get_user_by_phone(db: Session, phone: str):
     return db.query(User).filter(User.phone == phone).first()
 
-def create_user(db: Session, user: UserCreate):
+def use_refresh_token(db: Session, token: str, expires_at: datetime) -> bool:
+    """
+    Record a refresh token as exchanged. False if it already was: the
+    primary key makes concurrent uses of one token fail but one.
+    """
+    db.query(UsedRefreshToken).filter(UsedRefreshToken.expires_at < datetime.now()).delete()
+    db.add(UsedRefreshToken(token_hash=token_hash(token), expires_at=expires_at))
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return False
+    return True
+
+def create_user(db: Session, user: UserCreate, hashed_password: str = None):
     role = db.query(Role).filter(Role.name == user.role.lower()).first()
     if not role:
         raise ValueError(f"Role '{user.role}' Does not exist.")
 
-    hashed_password = pwd_context.hash(user.password)
+    # Callers on the event loop hash ahead of time with hash_password_async
+    if hashed_password is None:
+        hashed_password = hash_password(user.password)
 
     db_user = User(
         id=uuid4(),
@@ -170,7 +184,16 @@ def create_chat_history(db: Session, chat_history: ChatHistoryCreate, section_id
 #     return chat
 
 def get_chat_histories(db: Session, section_id: UUID4):
-    return db.query(ChatHistory).filter(ChatHistory.section_id == section_id).all()
+    # Columns only, as dicts: no ORM objects to build for large sections
+    rows = db.query(
+        ChatHistory.id,
+        ChatHistory.question,
+        ChatHistory.response,
+        ChatHistory.timestamp,
+        ChatHistory.section_id,
+        ChatHistory.user_id
+    ).filter(ChatHistory.section_id == section_id).all()
+    return [row._asdict() for row in rows]
 
 
 def delete_chat_history(db: Session, chat_history_id: UUID4):
@@ -307,7 +330,7 @@ def get_user(db: Session, user_id: UUID4):
 def update_user_password(db: Session, user_id: UUID4, new_password: str):
     user = db.query(User).filter(User.id == user_id).first()
     if user:
-        hashed_password = pwd_context.hash(new_password)
+        hashed_password = hash_password(new_password)
         user.password = hashed_password
         db.commit()
         db.refresh(user)
@@ -321,11 +344,12 @@ def verify_and_update_user_password(db: Session, user_id: UUID4, old_password: s
         return None
 
     # Verify old password
-    if not pwd_context.verify(old_password, user.password):
+    valid, _ = verify_password(old_password, user.password)
+    if not valid:
         return None
 
     # Hash the new password and update
-    user.password = pwd_context.hash(new_password)
+    user.password = hash_password(new_password)
     db.commit()
     db.refresh(user)
     return user
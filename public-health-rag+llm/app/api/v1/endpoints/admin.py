@@ -1,17 +1,25 @@
 from typing import List, Union
 from fastapi import APIRouter, Depends, HTTPException, status,Query
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, ORJSONResponse
 from pydantic import UUID4
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from app.api.v1.models import District, Facility, Role, User
-from app.database import get_db
-from app.api.v1.schemas import EmailSendRequest, HSACreateRequest, UserCreate, UserResponse, Users, ChatHistoryResponse
+from app.database import get_async_db, get_db
+from app.api.v1.schemas import EmailSendRequest, HSACreateRequest, UserCreate, UserResponse, Users, TokenClaims, ChatHistoryResponse
+from app.api.v1 import async_crud
 from app.api.v1.crud import (
     create_admin_account, create_hsa_account, create_instructor_account, get_users, get_user, update_user, delete_user, 
-    get_chat_histories, delete_chat_history
+    delete_chat_history
 )
-from app.api.v1.utils import check_is_admin, generate_otp, get_current_user, send_otp_to_email
+from app.api.v1.utils import check_is_admin, generate_otp, get_token_claims, send_otp_to_email
 from app.api.v1.schemas import UserRole
+from app.config import settings
+from app.llm_client import breaker_states
+from app.metrics import metrics
+from app.ratelimit import llm_scheduler
+from app.singleflight import ask_flights
 # import markdown
 
 router = APIRouter()
@@ -19,7 +27,7 @@ router = APIRouter()
 
 @router.get("/", response_class=HTMLResponse)
 def read_admin_documentation(
-    current_user: Users = Depends(get_current_user)
+    current_user: TokenClaims = Depends(get_token_claims)
     ):
     check_is_admin(current_user)
     with open("./docs/admin.md", "r") as file:
@@ -28,6 +36,22 @@ def read_admin_documentation(
     return HTMLResponse(content=readme_content)
 
 
+@router.get("/metrics")
+def read_metrics(
+    current_user: TokenClaims = Depends(get_token_claims)
+):
+    """Latency and throughput of the LLM backend (llm.<backend>.*), LLM queueing, failover and other in-process metrics."""
+    check_is_admin(current_user)
+    return {
+        "llm_backend": settings.LLM_BACKEND,
+        "llm_fallback_backend": settings.LLM_FALLBACK_BACKEND,
+        "llm_breakers": breaker_states(),
+        "llm_scheduler": llm_scheduler.snapshot(),
+        "ask_coalescing": ask_flights.snapshot(),
+        **metrics.snapshot()
+    }
+
+
 
 # @router.post("/create-hsa/", status_code=status.HTTP_201_CREATED)
 # def admin_create_hsa(hsa_data: HSACreateRequest, db: Session = Depends(get_db), current_user: Users = Depends(get_current_user)):
@@ -50,7 +74,7 @@ def read_admin_documentation(
 def admin_create_user(
     user_data: UserCreate,  # Use the flexible UserCreate schema
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: TokenClaims = Depends(get_token_claims)
 ):
     # Ensure admin role before allowing the operation
     check_is_admin(current_user)
@@ -95,89 +119,58 @@ def admin_create_user(
         )
 
 @router.get("/users", response_model=list[UserResponse])
-def list_users(
+async def list_users(
     role: str = Query(..., description="The role of the users to list (e.g., 'hsa' or 'instructor')"),
-    db: Session = Depends(get_db), 
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db), 
+    current_user: TokenClaims = Depends(get_token_claims)
 ):
     check_is_admin(current_user)
 
-    # Query users based on the provided role
-    users = db.query(User).join(Role).filter(Role.name == role.lower()).all()
+    role_name = role.lower()
+    if role_name == "hsa":
+        # Facility and district in the same query instead of two lookups per user
+        rows = (await db.execute(
+            select(User, Facility, District)
+            .join(Role, Role.id == User.role_id)
+            .outerjoin(Facility, Facility.id == User.facility_id)
+            .outerjoin(District, District.id == Facility.district_id)
+            .where(Role.name == role_name)
+        )).all()
+    else:
+        users = await db.scalars(select(User).join(Role, Role.id == User.role_id).where(Role.name == role_name))
+        rows = [(user, None, None) for user in users]
 
-    if not users:
+    if not rows:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"No users found for the role: {role}."
         )
 
-    # Iterate through the users to construct detailed user info
-    serialized_users = []
-    for user in users:
-        if role == "hsa":
-            facility = db.query(Facility).filter(Facility.id == user.facility_id).first()
-            district = db.query(District).filter(District.id == facility.district_id).first() if facility else None
-
-            serialized_users.append(
-                UserResponse(
-                    id=user.id,
-                    fullname=user.fullname,
-                    email=user.email,
-                    phone=user.phone if user.phone else "",
-                    role=user.role.name.upper(),
-                    is_active=user.is_active,
-                    managing_authority=facility.managing_authority if facility else None,
-                    urban_rural=facility.urban_rural if facility else None,
-                    facility_name=facility.name if facility else None,
-                    facility_id=facility.id if facility else None,
-                    facility_type=facility.facility_type if facility else None,
-                    district_name=district.name if district else None,
-                )
-            )
-        elif role == "instructor":
-            serialized_users.append(
-                UserResponse(
-                    id=user.id,
-                    fullname=user.fullname,
-                    email=user.email,
-                    phone=user.phone if user.phone else "",
-                    role=user.role.name.upper(),
-                    is_active=user.is_active,
-                    managing_authority=None,
-                    urban_rural=None,
-                    facility_name=None,
-                    facility_id=None,
-                    facility_type=None,
-                    district_name=None,
-                )
-            )
-            
-        elif role == 'admin':
-             serialized_users.append(
-                UserResponse(
-                    id=user.id,
-                    fullname=user.fullname,
-                    email=user.email,
-                    phone=user.phone if user.phone else "",
-                    role=user.role.name.upper(),
-                    is_active=user.is_active,
-                    managing_authority=None,
-                    urban_rural=None,
-                    facility_name=None,
-                    facility_id=None,
-                    facility_type=None,
-                    district_name=None,
-                )
-            )         
-
-    return serialized_users
+    # Plain dicts serialized by orjson; response_model only documents the shape
+    return ORJSONResponse([
+        {
+            "id": user.id,
+            "fullname": user.fullname,
+            "email": user.email,
+            "phone": user.phone if user.phone else "",
+            "role": role_name.upper(),
+            "is_active": bool(user.is_active),
+            "facility_name": facility.name if facility else None,
+            "facility_id": facility.id if facility else None,
+            "district_name": district.name if district else None,
+            "facility_type": facility.facility_type if facility else None,
+            "managing_authority": facility.managing_authority if facility else None,
+            "urban_rural": facility.urban_rural if facility else None,
+        }
+        for user, facility, district in rows
+    ])
 
 
 # Route to return all Admins
 @router.get("/users/admins", response_model=list[Users])
 def list_admins(
     db: Session = Depends(get_db),
-    current_user: Users = Depends(get_current_user)
+    current_user: TokenClaims = Depends(get_token_claims)
 ):
     check_is_admin(current_user)
     # Filter users by the role 'admin'
@@ -204,7 +197,7 @@ def list_admins(
 def get_user_detail(
     user_id: int, 
     db: Session = Depends(get_db), 
-    current_user: Users = Depends(get_current_user)
+    current_user: TokenClaims = Depends(get_token_claims)
 ):
     check_is_admin(current_user)
     user = get_user(db, user_id)
@@ -218,7 +211,7 @@ def update_user_detail(
     user_id: int, 
     user_update: UserCreate, 
     db: Session = Depends(get_db), 
-    current_user: Users = Depends(get_current_user)
+    current_user: TokenClaims = Depends(get_token_claims)
 ):
     check_is_admin(current_user)
     user = update_user(db, user_id, user_update)
@@ -231,7 +224,7 @@ def update_user_detail(
 def delete_user_detail(
     user_id: int, 
     db: Session = Depends(get_db), 
-    current_user: Users = Depends(get_current_user)
+    current_user: TokenClaims = Depends(get_token_claims)
 ):
     check_is_admin(current_user)
     user = delete_user(db, user_id)
@@ -241,18 +234,23 @@ def delete_user_detail(
 
 # Get all chat histories
 @router.get("/chats")
-def list_chat_histories(section_id: UUID4 = Query(None), db: Session = Depends(get_db)):
+async def list_chat_histories(
+    section_id: UUID4 = Query(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: TokenClaims = Depends(get_token_claims)
+):
+    check_is_admin(current_user)
     if not section_id:
         raise HTTPException(status_code=400, detail="Section ID is required")
     
-    return get_chat_histories(db, section_id)
+    return ORJSONResponse(await async_crud.get_chat_histories(db, section_id))
 
 # Delete chat history
 @router.delete("/chats/{chat_id}", response_model=ChatHistoryResponse)
 def delete_chat(
     chat_id: int, 
     db: Session = Depends(get_db), 
-    current_user: Users = Depends(get_current_user)
+    current_user: TokenClaims = Depends(get_token_claims)
 ):
     check_is_admin(current_user)
     chat = delete_chat_history(db, chat_id)
@@ -266,7 +264,7 @@ def delete_chat(
 def admin_deactivate_user(
     user_id: UUID4,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: TokenClaims = Depends(get_token_claims)
 ):
     # Ensure the requesting user is an admin
     check_is_admin(current_user)
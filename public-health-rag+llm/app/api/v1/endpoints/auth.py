@@ -1,15 +1,21 @@
+import logging
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from fastapi.responses import HTMLResponse
-from app.api.v1.schemas import ClaimAccountRequest, UserCreate, LoginRequest, TokenResponse, VerifyOTP
-from app.api.v1.crud import get_user_by_email, create_user, get_user_by_phone
+from app.api.v1.schemas import ClaimAccountRequest, RefreshTokenRequest, UserCreate, LoginRequest, TokenResponse, VerifyOTP
+from app.api.v1 import async_crud
+from app.api.v1.crud import get_user_by_email, use_refresh_token
 from app.api.v1.models import Facility, User
-from app.database import get_db
-from app.api.v1.utils import create_access_token, hash_password, pwd_context, send_account_verified_email, verify_otp
+from app.database import get_async_db, get_db
+from app.api.v1.utils import create_access_token, create_refresh_token, credentials_exception, send_account_verified_email, verify_otp
+from app.security import InvalidTokenError, decode_token, hash_password_async, verify_password_async
 from datetime import datetime, timedelta
 from app.config import settings
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 @router.get("/", response_class=HTMLResponse)
 def read_auth_documentation():
@@ -20,10 +26,10 @@ def read_auth_documentation():
 
 
 @router.post("/signup/", status_code=status.HTTP_201_CREATED, response_model=TokenResponse)
-def signup(user: UserCreate, db: Session = Depends(get_db)):
+async def signup(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
     # Check if email or phone is already registered
-    db_user = get_user_by_email(db, email=user.email)
-    db_phone = get_user_by_phone(db, phone=user.phone)
+    db_user = await async_crud.get_user_by_email(db, email=user.email)
+    db_phone = await async_crud.get_user_by_phone(db, phone=user.phone)
     if db_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -36,11 +42,12 @@ def signup(user: UserCreate, db: Session = Depends(get_db)):
         )
 
     try:
-        # Create new user and assign the facility (if applicable)
-        new_user = create_user(db, user)
+        # Hash off the event loop, then create new user and assign the facility (if applicable)
+        hashed_password = await hash_password_async(user.password)
+        new_user = await async_crud.create_user(db, user, hashed_password)
 
-        # Convert role to string if it's an object or enum
-        role_name = new_user.role.name if hasattr(new_user.role, 'name') else str(new_user.role)
+        # The role was loaded by create_user and stays loaded after its commit
+        role_name = new_user.role.name
 
         # Create a JWT token for the newly created user
         access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -52,10 +59,12 @@ def signup(user: UserCreate, db: Session = Depends(get_db)):
             },
             expires_delta=access_token_expires
         )
+        refresh_token = create_refresh_token(data={"sub": new_user.email, "user_id": str(new_user.id)})
 
         # Return the token, user_id, and role
         return {
             "access_token": access_token,
+            "refresh_token": refresh_token,
             "token_type": "bearer"
         }
     except Exception as e:
@@ -66,16 +75,20 @@ def signup(user: UserCreate, db: Session = Depends(get_db)):
 
 
 @router.post("/login/", status_code=status.HTTP_200_OK, response_model=TokenResponse)
-def login_for_access_token(login_request: LoginRequest, db: Session = Depends(get_db)):
-    user = get_user_by_email(db, email=login_request.email)
-    if not user or not pwd_context.verify(login_request.password, user.password):
+async def login_for_access_token(login_request: LoginRequest, db: AsyncSession = Depends(get_async_db)):
+    user = await async_crud.get_user_by_email(db, email=login_request.email)
+    if user:
+        valid, new_hash = await verify_password_async(login_request.password, user.password)
+    if not user or not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password"
         )
-    
+
+    role_name = user.role.name
+
     # Ensure HSA account is claimed before allowing login
-    if user.role.name == "hsa" and not user.is_active:
+    if role_name == "hsa" and not user.is_active:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Account not yet claimed. Please claim your account using the OTP sent to your email."
@@ -85,17 +98,22 @@ def login_for_access_token(login_request: LoginRequest, db: Session = Depends(ge
         access_token = create_access_token(
             data={
                 "sub": user.email,
-                "role": user.role.name if hasattr(user.role, 'name') else str(user.role),
+                "role": role_name,
                 "user_id": str(user.id)
             },
             expires_delta=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
         )
+        refresh_token = create_refresh_token(data={"sub": user.email, "user_id": str(user.id)})
+
+        # Upgrade the stored hash if the scheme or cost factor changed
+        if new_hash:
+            user.password = new_hash
         user.otp = None
         user.otp_expires_at = None
-        db.commit()
-        db.refresh(user)
+        await db.commit()
         return {
             "access_token": access_token,
+            "refresh_token": refresh_token,
             "token_type": "bearer"
         }
     except Exception as e:
@@ -105,6 +123,44 @@ def login_for_access_token(login_request: LoginRequest, db: Session = Depends(ge
         )
 
 
+@router.post("/refresh/", status_code=status.HTTP_200_OK, response_model=TokenResponse)
+def refresh_access_token(refresh_request: RefreshTokenRequest, db: Session = Depends(get_db)):
+    """
+    Exchange a refresh token for a new short-lived access token and a new
+    refresh token. Each refresh token can be exchanged once, and the
+    account is re-checked, so deactivated users cannot refresh.
+    """
+    try:
+        payload = decode_token(refresh_request.refresh_token, token_type="refresh")
+    except InvalidTokenError:
+        raise credentials_exception()
+
+    user = get_user_by_email(db, email=payload.get("sub"))
+    if not user or str(user.id) != payload.get("user_id") or user.password is None:
+        raise credentials_exception()
+    if user.role.name == "hsa" and not user.is_active:
+        raise credentials_exception()
+    if not use_refresh_token(db, refresh_request.refresh_token, datetime.fromtimestamp(payload["exp"])):
+        # Replayed, perhaps stolen: the client must log in again
+        logger.warning("Refresh token reused for user %s", user.id)
+        raise credentials_exception()
+
+    access_token = create_access_token(
+        data={
+            "sub": user.email,
+            "role": user.role.name,
+            "user_id": str(user.id)
+        },
+        expires_delta=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    refresh_token = create_refresh_token(data={"sub": user.email, "user_id": str(user.id)})
+    return {
+        "access_token": access_token,
+        "refresh_token": refresh_token,
+        "token_type": "bearer"
+    }
+
+
 
 # @router.post("/claim-account/", status_code=status.HTTP_200_OK,response_model=dict)
 # def claim_hsa_account(user:ClaimAccountRequest, db: Session = Depends(get_db)):
@@ -177,9 +233,9 @@ def login_for_access_token(login_request: LoginRequest, db: Session = Depends(ge
 
 
 @router.post("/claim-account/", status_code=status.HTTP_200_OK, response_model=dict)
-def claim_user_account(user: ClaimAccountRequest, db: Session = Depends(get_db)):
+async def claim_user_account(user: ClaimAccountRequest, db: Session = Depends(get_db)):
     # Fetch the user account using email
-    user_obj = get_user_by_email(db, email=user.email)
+    user_obj = await run_in_threadpool(get_user_by_email, db, email=user.email)
 
     if not user_obj:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
@@ -197,15 +253,15 @@ def claim_user_account(user: ClaimAccountRequest, db: Session = Depends(get_db))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Passwords do not match")
 
     # OTP is valid, update password and clear OTP fields
-    hashed_password = pwd_context.hash(user.new_password)
+    hashed_password = await hash_password_async(user.new_password)
     user_obj.password = hashed_password
     user_obj.otp = None
     user_obj.otp_expires_at = None
     user_obj.is_active = True
 
-    db.commit()
-    db.refresh(user_obj)
-    send_account_verified_email(user_obj.email, user_obj.fullname)
+    await run_in_threadpool(db.commit)
+    await run_in_threadpool(db.refresh, user_obj)
+    await run_in_threadpool(send_account_verified_email, user_obj.email, user_obj.fullname)
     return {"detail": "Account verified successfully. You can now log in with your new password."}
 
     
@@ -1,16 +1,26 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from sqlalchemy.sql.expression import func
+import random
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 from app.api.v1.utils import (
-    get_current_user, 
+    PROMPT_VERSION,
+    fallback_answer,
+    get_token_claims, 
+    normalize_question,
     retrieve_recent_chats, 
     setup_qa_chain, 
     validate_section
     )
-from app.database import get_db
+from app.database import get_async_db
+from app.chat_buffer import chat_buffer
+from app.ratelimit import Priority, RateLimited, check_llm_rate_limit, llm_scheduler, too_many_requests
+from app.singleflight import ask_flights
+from app.llm_client import LLMUnavailable
+from app.metrics import metrics
 from app.api.v1.models import ChatHistory
-from app.api.v1.schemas import Query, RandomQuestionsResponse, SectionRequest, Users
+from app.api.v1.schemas import Query, RandomQuestionsResponse, SectionRequest, TokenClaims, Users
 
 from dotenv import load_dotenv
 
@@ -19,74 +29,108 @@ load_dotenv()
 
 router = APIRouter()
 
+# Sample questions are drawn from this many of the section's latest questions
+SAMPLE_QUESTION_POOL = 100
+
+
+async def answer_question(section_id, question: str, user_id):
+    """Run the QA chain, waiting for an LLM slot; field questions go ahead of handout generation."""
+    qa = setup_qa_chain(section_id)
+    async with llm_scheduler.slot(user_id, Priority.FIELD_QUESTION):
+        return await run_in_threadpool(qa.invoke, question)
+
 # Main routes
 
 @router.post("/ask")
 async def ask_question(
     query: Query,
-    db: Session = Depends(get_db),
-    current_user: Users = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: TokenClaims = Depends(get_token_claims)
 ):
     # Validate section
-    section = validate_section(query.section_id, db)
+    section = await validate_section(query.section_id, db)
+    # Hand the connection back to the pool while the model answers
+    await db.close()
 
-    # Set up QA chain and get the answer
-    qa = setup_qa_chain(query.section_id)
-    response = qa.invoke(query.question)
-    answer = response['result']
+    # Get the answer; the same question asked in the same section while it
+    # is being answered shares that one retrieval and LLM call
+    key = (str(query.section_id), normalize_question(query.question), PROMPT_VERSION)
+    degraded = False
+    try:
+        check_llm_rate_limit(current_user.id, current_user.role.value, Priority.FIELD_QUESTION)
+        response = await ask_flights.do(
+            key, lambda: answer_question(query.section_id, query.question, current_user.id)
+        )
+        answer = response['result']
+    except RateLimited as e:
+        raise too_many_requests(e)
+    except LLMUnavailable:
+        # No model answered in time; reuse an earlier answer to the same question if there is one
+        answer = await fallback_answer(db, query.section_id, query.question)
+        if answer is None:
+            metrics.increment("hsa.ask.unanswered")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="The assistant is busy right now, please try again shortly.",
+                headers={"Retry-After": "30"}
+            )
+        metrics.increment("hsa.ask.degraded")
+        degraded = True
 
-    # Save chat history
-    chat_history = ChatHistory(
+    # Save chat history (written behind in batches)
+    chat_buffer.add(
         question=query.question,
         response=answer,
-        timestamp=datetime.now(),
         section_id=query.section_id,
         user_id=current_user.id
     )
-    db.add(chat_history)
-    db.commit()
 
     # Retrieve and return recent chats
-    recent_chats = retrieve_recent_chats(current_user.id, query.section_id, db)
+    recent_chats = await retrieve_recent_chats(current_user.id, query.section_id, db)
     return {
+        "degraded": degraded,
         "recent_chats": [
-            {"question": chat.question, "response": chat.response, "timestamp": chat.timestamp} for chat in recent_chats
+            {"question": chat["question"], "response": chat["response"], "timestamp": chat["timestamp"]} for chat in recent_chats
         ]
     }
 
 @router.post("/recent-chats")
 async def get_recent_chats(
     section_request: SectionRequest,
-    db: Session = Depends(get_db),
-    current_user: Users = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: TokenClaims = Depends(get_token_claims)
 ):
     # Validate section
-    validate_section(section_request.section_id, db)
+    await validate_section(section_request.section_id, db)
 
     # Retrieve and return recent chats
-    recent_chats = retrieve_recent_chats(current_user.id, section_request.section_id, db)
+    recent_chats = await retrieve_recent_chats(current_user.id, section_request.section_id, db)
     return {
         "recent_chats": [
-            {"question": chat.question, "response": chat.response, "timestamp": chat.timestamp} for chat in recent_chats
+            {"question": chat["question"], "response": chat["response"], "timestamp": chat["timestamp"]} for chat in recent_chats
         ]
     }
 
 @router.post("/sample-questions", response_model=RandomQuestionsResponse)
 async def get_sample_questions_by_section(
     section_request: SectionRequest,
-    db: Session = Depends(get_db),
-    current_user: Users = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: TokenClaims = Depends(get_token_claims)
 ):
     # Validate section
-    validate_section(section_request.section_id, db)
+    await validate_section(section_request.section_id, db)
 
-    # Query for random questions from the section
-    random_questions = db.query(ChatHistory).filter_by(section_id=section_request.section_id)\
-        .order_by(func.random()).limit(3).all()
+    # Random questions from the section's latest ones: an index range read,
+    # where ORDER BY random() would read and sort every chat in the section
+    recent_questions = (await db.scalars(
+        select(ChatHistory.question).filter_by(section_id=section_request.section_id)
+        .order_by(ChatHistory.timestamp.desc()).limit(SAMPLE_QUESTION_POOL)
+    )).all()
+    random_questions = random.sample(recent_questions, min(3, len(recent_questions)))
 
     # Return the random questions
     return RandomQuestionsResponse(
         sample_questions=[
-            {"question": chat.question} for chat in random_questions
+            {"question": question} for question in random_questions
         ]
     )
\ No newline at end of file
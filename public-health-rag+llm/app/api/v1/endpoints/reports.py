@@ -1,22 +1,62 @@
-from typing import List
-from sqlalchemy.orm import Session
-from fastapi import APIRouter, Depends
-from app.api.v1.models import Handout, Role, Section, User
-from app.api.v1.schemas import RoleUserCount, RoleUserCountResponse, SectionHandoutCountResponse, Users
-from app.api.v1.utils import check_is_admin, get_current_user
-from app.database import get_db
-from sqlalchemy import func
+from datetime import date, timedelta
+from typing import List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.concurrency import run_in_threadpool
+from pydantic import UUID4
+from app.api.v1.models import (
+    District, HandoutCountRollup, QuestionCountRollup, Role, Section, UserCountRollup
+)
+from app.api.v1.schemas import (
+    DistrictUserCountResponse, HandoutVolumeResponse, QuestionHeatmapResponse, QuestionHeatmapRow, QuestionTrendPoint,
+    QuestionTrendResponse, QuestionVolumeResponse, RoleUserCount, RoleUserCountResponse, SectionHandoutCountResponse,
+    TokenClaims, Users
+)
+from app.analytics import TOPICS, question_topics, week_of
+from app.api.v1.utils import check_is_admin, get_token_claims
+from app.database import get_async_db
+from sqlalchemy import func, select
+
+# Every report reads the rollup tables (app/rollups.py), one row per group,
+# or the question-topic dataset (app/analytics.py), never the users,
+# handouts or chat_histories tables themselves.
 
 router = APIRouter()
 
+MAX_REPORT_DAYS = 366
+MAX_TREND_WEEKS = 104
+
+
+def report_period(start: Optional[date], end: Optional[date]):
+    """Default to the last 30 days; refuse periods that are inverted or too long."""
+    end = end or date.today()
+    start = start or end - timedelta(days=29)
+    if start > end:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="start must not be after end")
+    if (end - start).days >= MAX_REPORT_DAYS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Periods are limited to {MAX_REPORT_DAYS} days")
+    return start, end
+
+
+def trend_period(start: Optional[date], end: Optional[date]):
+    """Whole weeks from the Monday of start to the Monday of end; the last 12 weeks by default."""
+    end = week_of(end or date.today())
+    start = week_of(start) if start else end - timedelta(weeks=11)
+    if start > end:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="start must not be after end")
+    if (end - start).days // 7 >= MAX_TREND_WEEKS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Trends are limited to {MAX_TREND_WEEKS} weeks")
+    return start, end
+
+
 @router.get("/user-count-by-role", response_model=RoleUserCountResponse)
-def get_user_count_by_role(db: Session = Depends(get_db),current_user:Users = Depends(get_current_user)):
+async def get_user_count_by_role(db: AsyncSession = Depends(get_async_db),current_user: TokenClaims = Depends(get_token_claims)):
     check_is_admin(current_user)
-    role_counts = (
-        db.query(Role.name, func.count(User.id))
-        .join(User, Role.id == User.role_id)
+    role_counts = await db.execute(
+        select(Role.name, func.sum(UserCountRollup.user_count))
+        .join(UserCountRollup, Role.id == UserCountRollup.role_id)
         .group_by(Role.name)
-        .all()
+        .having(func.sum(UserCountRollup.user_count) > 0)
     )
 
     response_data = [
@@ -26,18 +66,47 @@ def get_user_count_by_role(db: Session = Depends(get_db),current_user:Users = De
     return RoleUserCountResponse(roles=response_data)
 
 
+@router.get("/user-count-by-district", response_model=List[DistrictUserCountResponse])
+async def get_user_count_by_district(
+    role: Optional[str] = Query(None, description="Only this role, e.g. 'hsa'"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: TokenClaims = Depends(get_token_claims)
+):
+    """Users per district and role; users without a facility have no district."""
+    check_is_admin(current_user)
+    query = (
+        select(UserCountRollup.district_id, District.name, Role.name, func.sum(UserCountRollup.user_count).label("user_count"))
+        .join(Role, Role.id == UserCountRollup.role_id)
+        .outerjoin(District, District.id == UserCountRollup.district_id)
+        .group_by(UserCountRollup.district_id, District.name, Role.name)
+        .having(func.sum(UserCountRollup.user_count) > 0)
+        .order_by(District.name, Role.name)
+    )
+    if role:
+        query = query.where(Role.name == role.lower())
+
+    rows = await db.execute(query)
+    return [
+        DistrictUserCountResponse(district_id=district_id, district_name=district_name, role_name=role_name, user_count=user_count)
+        for district_id, district_name, role_name, user_count in rows
+    ]
+
+
 @router.get("/section-handout-count", response_model=List[SectionHandoutCountResponse], include_in_schema=True)
-async def get_section_handout_count(db: Session = Depends(get_db),current_user:Users = Depends(get_current_user)):
+async def get_section_handout_count(db: AsyncSession = Depends(get_async_db),current_user: TokenClaims = Depends(get_token_claims)):
     check_is_admin(current_user)
     """
     Retrieve the number of sections and the count of handouts in each section.
     """
-    # Query all sections and the handout count per section
-    section_handouts = (
-        db.query(Section.id, Section.name, func.count(Handout.id).label("handout_count"))
-        .join(Handout, Section.id == Handout.section_id, isouter=True)  # Left join to include sections with zero handouts
-        .group_by(Section.id, Section.name)
-        .all()
+    # Handouts per section from the daily rollup, then every section with its count
+    counts = (
+        select(HandoutCountRollup.section_id, func.sum(HandoutCountRollup.handout_count).label("handout_count"))
+        .group_by(HandoutCountRollup.section_id)
+        .subquery()
+    )
+    section_handouts = await db.execute(
+        select(Section.id, Section.name, func.coalesce(counts.c.handout_count, 0).label("handout_count"))
+        .outerjoin(counts, counts.c.section_id == Section.id)  # Left join to include sections with zero handouts
     )
 
     # Format the results as a list of SectionHandoutCountResponse objects
@@ -50,4 +119,128 @@ async def get_section_handout_count(db: Session = Depends(get_db),current_user:U
         for section in section_handouts
     ]
 
-    return response
\ No newline at end of file
+    return response
+
+
+@router.get("/handout-volume", response_model=List[HandoutVolumeResponse])
+async def get_handout_volume(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    section_id: Optional[UUID4] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: TokenClaims = Depends(get_token_claims)
+):
+    """Handouts created per day and section, last 30 days by default."""
+    check_is_admin(current_user)
+    start, end = report_period(start, end)
+    query = (
+        select(HandoutCountRollup.day, HandoutCountRollup.section_id, Section.name, HandoutCountRollup.handout_count)
+        .outerjoin(Section, Section.id == HandoutCountRollup.section_id)
+        .where(HandoutCountRollup.day.between(start, end), HandoutCountRollup.handout_count > 0)
+        .order_by(HandoutCountRollup.day, Section.name)
+    )
+    if section_id:
+        query = query.where(HandoutCountRollup.section_id == section_id)
+
+    rows = await db.execute(query)
+    return [
+        HandoutVolumeResponse(day=day, section_id=section, section_name=section_name, handout_count=handout_count)
+        for day, section, section_name, handout_count in rows
+    ]
+
+
+@router.get("/question-volume", response_model=List[QuestionVolumeResponse])
+async def get_question_volume(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    section_id: Optional[UUID4] = None,
+    district_id: Optional[UUID4] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: TokenClaims = Depends(get_token_claims)
+):
+    """Questions asked per day, section and district (of the asking HSA's facility), last 30 days by default."""
+    check_is_admin(current_user)
+    start, end = report_period(start, end)
+    query = (
+        select(
+            QuestionCountRollup.day,
+            QuestionCountRollup.section_id,
+            Section.name,
+            QuestionCountRollup.district_id,
+            District.name,
+            QuestionCountRollup.question_count
+        )
+        .outerjoin(Section, Section.id == QuestionCountRollup.section_id)
+        .outerjoin(District, District.id == QuestionCountRollup.district_id)
+        .where(QuestionCountRollup.day.between(start, end), QuestionCountRollup.question_count > 0)
+        .order_by(QuestionCountRollup.day, District.name, Section.name)
+    )
+    if section_id:
+        query = query.where(QuestionCountRollup.section_id == section_id)
+    if district_id:
+        query = query.where(QuestionCountRollup.district_id == district_id)
+
+    rows = await db.execute(query)
+    return [
+        QuestionVolumeResponse(
+            day=day,
+            section_id=section,
+            section_name=section_name,
+            district_id=district,
+            district_name=district_name,
+            question_count=question_count
+        )
+        for day, section, section_name, district, district_name, question_count in rows
+    ]
+
+
+@router.get("/question-trends", response_model=QuestionTrendResponse)
+async def get_question_trends(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    district_id: Optional[UUID4] = None,
+    section_id: Optional[UUID4] = None,
+    topic: Optional[str] = Query(None, description="Only this topic, e.g. 'cholera'"),
+    current_user: TokenClaims = Depends(get_token_claims)
+):
+    """Questions per week and topic, last 12 weeks by default; counted up to the last nightly run."""
+    check_is_admin(current_user)
+    start, end = trend_period(start, end)
+    if topic and topic not in TOPICS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown topic, expected one of: {', '.join(TOPICS)}")
+
+    points = await run_in_threadpool(question_topics.trends, start, end, district_id, section_id, topic)
+    return QuestionTrendResponse(
+        start=start,
+        end=end,
+        processed_through=question_topics.processed_through(),
+        points=[QuestionTrendPoint(week=week, topic=topic, question_count=count) for week, topic, count in points]
+    )
+
+
+@router.get("/question-heatmap", response_model=QuestionHeatmapResponse)
+async def get_question_heatmap(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    section_id: Optional[UUID4] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: TokenClaims = Depends(get_token_claims)
+):
+    """Questions per district and topic over a period, busiest districts first."""
+    check_is_admin(current_user)
+    start, end = trend_period(start, end)
+
+    topics, rows = await run_in_threadpool(question_topics.heatmap, start, end, section_id)
+    names = {str(district_id): name for district_id, name in await db.execute(select(District.id, District.name))}
+    districts = [
+        QuestionHeatmapRow(district_id=district, district_name=names.get(district), counts=counts, total=sum(counts))
+        for district, counts in rows
+    ]
+    districts.sort(key=lambda row: row.total, reverse=True)
+    return QuestionHeatmapResponse(
+        start=start,
+        end=end,
+        processed_through=question_topics.processed_through(),
+        topics=topics,
+        districts=districts
+    )
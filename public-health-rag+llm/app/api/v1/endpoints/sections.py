@@ -1,9 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from typing import List
-from app.api.v1.schemas import SectionIDRequest, SectionResponse, SectionUpdateRequest, Users
+from app.api.v1.schemas import SectionIDRequest, SectionResponse, SectionUpdateRequest, TokenClaims, Users
 from app.api.v1.crud import get_sections, get_section, update_section, delete_section
-from app.api.v1.utils import check_is_admin, get_current_user
+from app.api.v1.utils import check_is_admin, get_token_claims
 from app.database import get_db
 from pydantic import UUID4
 
@@ -13,7 +13,7 @@ router = APIRouter()
 @router.get("/", response_model=List[SectionResponse])
 def list_sections(
     db: Session = Depends(get_db), 
-    current_user: Users = Depends(get_current_user)  # Ensure user is authenticated
+    current_user: TokenClaims = Depends(get_token_claims)  # Ensure user is authenticated
 ):
     sections = get_sections(db)
     return sections
@@ -23,7 +23,7 @@ def list_sections(
 def read_section(
     section_request: SectionIDRequest,
     db: Session = Depends(get_db), 
-    current_user: Users = Depends(get_current_user)  # Ensure user is authenticated
+    current_user: TokenClaims = Depends(get_token_claims)  # Ensure user is authenticated
 ):
     section = get_section(db, section_request.section_id)
     if section is None:
@@ -35,7 +35,7 @@ def read_section(
 def update_existing_section(
     update_request: SectionUpdateRequest, 
     db: Session = Depends(get_db), 
-    current_user: Users = Depends(get_current_user)
+    current_user: TokenClaims = Depends(get_token_claims)
 ):
     # Check if the current user is an admin
     check_is_admin(current_user)
@@ -50,7 +50,7 @@ def update_existing_section(
 def remove_section(
     section_request: SectionIDRequest,
     db: Session = Depends(get_db), 
-    current_user: Users = Depends(get_current_user)
+    current_user: TokenClaims = Depends(get_token_claims)
 ):
     # Check if the current user is an admin
     check_is_admin(current_user)
@@ -1,22 +1,31 @@
 from math import ceil
-from typing import List, Optional
+from typing import List, Optional, Union
 from uuid import UUID
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy import or_
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session, joinedload
 from pydantic import UUID4
-from app.api.v1.crud import create_handout, delete_handout
-from app.api.v1.utils import check_is_instructor, generate_handout_title, get_current_user
-from app.database import get_db
-from app.api.v1.models import Handout, Section
-from app.api.v1.schemas import HandoutQuery, HandoutQueryParams, HandoutRequest, HandoutResponse, HandoutSortOrder, TotalPagesResponse, Users
+from app.api.v1 import async_crud
+from app.api.v1.utils import check_is_instructor, generate_handout_title, get_token_claims
+from app.database import SessionLocal, get_async_db, get_db
+from app.api.v1.models import Handout, Section, User, index_handout
+from app.api.v1.schemas import HandoutJobResponse, HandoutQuery, HandoutQueryParams, HandoutRequest, HandoutResponse, HandoutSlideResponse, HandoutSortOrder, HandoutTocResponse, TokenClaims, TotalPagesResponse, Users
 from langchain.chains import RetrievalQA
 from langchain.prompts import PromptTemplate
-from app.config import llm, vector_store
+from app.config import handout_llm, settings, vector_store
+from app.llm_client import LLMUnavailable
+from app.ratelimit import Priority, RateLimited, check_llm_rate_limit, llm_scheduler, too_many_requests
+from app.slides import handout_detail_etag
+from app.tasks import Job, JobLimitExceeded, JobStatus, handout_jobs
 from datetime import datetime
 
 router = APIRouter()
 
+# The full handout names its instructor and section, which can be renamed: revalidate it on every use
+HANDOUT_DETAIL_CACHE_CONTROL = "private, no-cache"
+
 
 handout_template = """
 You are a highly skilled trainer tasked with creating a well-structured and detailed teaching handout based on Malawian Technical Guidelines for Integrated Disease Surveliance and Response that are used to train Public Health Surveliance Assintants on the following Topic: {context}.
@@ -69,35 +78,24 @@ PROMPT = PromptTemplate(
 )
 
 
-from asyncio import sleep  # For demonstration purposes if needed to simulate wait time.
-
-@router.post("/generate-handout", response_model=HandoutResponse)
-async def generate_handout(
-    query: HandoutQuery,
-    db: Session = Depends(get_db),
-    current_user: Users = Depends(get_current_user)
-):
-    # Ensure user is an instructor
-    check_is_instructor(current_user)
-
-    # Fetch the section
-    section = db.query(Section).filter_by(id=query.section_id).first()
-    if not section:
-        raise HTTPException(status_code=404, detail="Section not found")
-
-    # Generate title asynchronously
-    title = generate_handout_title(query.topic)
-
-    # Generate handout content asynchronously
+def build_handout(db: Session, section_id: UUID4, topic: str, user_id: UUID4) -> Handout:
+    """Generate handout title and content with the LLM and save the handout."""
     qa = RetrievalQA.from_chain_type(
-        llm=llm,
+        llm=handout_llm,
         chain_type="stuff",
         retriever=vector_store.as_retriever(search_kwargs={'k': 5}),
         chain_type_kwargs={"prompt": PROMPT}
     )
-    response = qa.invoke(query.topic)
+    try:
+        # Generate title
+        title = generate_handout_title(topic)
+
+        # Generate handout content
+        response = qa.invoke(topic)
+    except LLMUnavailable:
+        raise HTTPException(status_code=503, detail="The model is unavailable, please try again later")
     handout_content = response.get('result')
-    
+
     if not handout_content:
         raise HTTPException(status_code=500, detail="Failed to generate handout content")
 
@@ -105,15 +103,32 @@ async def generate_handout(
     handout = Handout(
         title=title,
         content=handout_content,
-        created_by_id=current_user.id,
-        section_id=query.section_id,
+        created_by_id=user_id,
+        section_id=section_id,
         created_at=datetime.now()
     )
     db.add(handout)
     db.commit()
     db.refresh(handout)
+    return handout
 
-    # Return the newly created handout in the same format as the HandoutResponse model
+
+def build_handout_in_slot(db: Session, section_id: UUID4, topic: str, user_id: UUID4) -> UUID4:
+    """build_handout for a background job, waiting its turn behind field questions."""
+    with llm_scheduler.slot_sync(user_id, Priority.BULK):
+        return build_handout(db, section_id, topic, user_id).id
+
+
+def build_handout_in_session(section_id: UUID4, topic: str, user_id: UUID4) -> UUID4:
+    """build_handout on a session of its own, for the threadpool."""
+    db = SessionLocal()
+    try:
+        return build_handout(db, section_id, topic, user_id).id
+    finally:
+        db.close()
+
+
+def to_handout_response(handout: Handout) -> HandoutResponse:
     return HandoutResponse(
             id=handout.id,
             instructor_name=handout.created_by.fullname,  # Use fullname directly
@@ -125,6 +140,118 @@ async def generate_handout(
         )
 
 
+def load_job_handouts(db: Session, jobs: List[Job]) -> List[Handout]:
+    """One query for the handouts of all succeeded jobs."""
+    handout_ids = [job.result for job in jobs if job.status == JobStatus.SUCCEEDED]
+    if not handout_ids:
+        return []
+    return db.scalars(
+        select(Handout).options(joinedload(Handout.created_by), joinedload(Handout.section))
+        .where(Handout.id.in_(handout_ids))
+    ).all()
+
+
+def to_job_responses(jobs: List[Job], handouts: List[Handout]) -> List[HandoutJobResponse]:
+    handouts = {handout.id: handout for handout in handouts}
+    return [
+        HandoutJobResponse(
+            job_id=job.id,
+            status=job.status,
+            section_id=job.params["section_id"],
+            topic=job.params["topic"],
+            created_at=job.created_at,
+            finished_at=job.finished_at,
+            error=job.error,
+            handout=to_handout_response(handouts[job.result]) if job.result in handouts else None
+        )
+        for job in jobs
+    ]
+
+
+@router.post("/generate-handout", response_model=Union[HandoutResponse, HandoutJobResponse])
+async def generate_handout(
+    query: HandoutQuery,
+    response: Response,
+    background: bool = Query(False, description="Queue the handout and return a job to poll instead of waiting"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: TokenClaims = Depends(get_token_claims)
+):
+    # Ensure user is an instructor
+    check_is_instructor(current_user)
+
+    # Fetch the section
+    section = await db.get(Section, query.section_id)
+    if not section:
+        raise HTTPException(status_code=404, detail="Section not found")
+
+    try:
+        check_llm_rate_limit(current_user.id, current_user.role.value, Priority.BULK)
+    except RateLimited as e:
+        raise too_many_requests(e)
+
+    if background:
+        # An instructor's identical (section, topic) requests share a single in-flight job
+        key = (query.section_id, " ".join(query.topic.lower().split()))
+        user_id = current_user.id
+        try:
+            job, _ = handout_jobs.submit(
+                owner_id=user_id,
+                key=key,
+                fn=lambda job_db: build_handout_in_slot(job_db, query.section_id, query.topic, user_id),
+                params={"section_id": query.section_id, "topic": query.topic}
+            )
+        except JobLimitExceeded as e:
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e))
+
+        response.status_code = status.HTTP_202_ACCEPTED
+        handouts = await db.run_sync(load_job_handouts, [job])
+        return to_job_responses([job], handouts)[0]
+
+    # Give the connection back while the handout is generated on a session of its own
+    await db.close()
+    try:
+        async with llm_scheduler.slot(current_user.id, Priority.BULK):
+            handout_id = await run_in_threadpool(build_handout_in_session, query.section_id, query.topic, current_user.id)
+    except RateLimited as e:
+        raise too_many_requests(e)
+    handout = await db.get(Handout, handout_id, options=[joinedload(Handout.created_by), joinedload(Handout.section)])
+
+    # Return the newly created handout in the same format as the HandoutResponse model
+    return to_handout_response(handout)
+
+
+@router.get("/generate-handout/jobs", response_model=List[HandoutJobResponse])
+def list_handout_jobs(
+    db: Session = Depends(get_db),
+    current_user: TokenClaims = Depends(get_token_claims)
+):
+    """
+    List the handout generation jobs submitted by the current instructor.
+    """
+    check_is_instructor(current_user)
+    jobs = handout_jobs.list_for_owner(current_user.id)
+    return to_job_responses(jobs, load_job_handouts(db, jobs))
+
+
+@router.get("/generate-handout/jobs/{job_id}", response_model=HandoutJobResponse)
+def get_handout_job(
+    job_id: UUID4,
+    db: Session = Depends(get_db),
+    current_user: TokenClaims = Depends(get_token_claims)
+):
+    """
+    Poll the status of a handout generation job. The handout is included once the job has succeeded.
+    Only instructors who submitted the job can see it.
+    """
+    check_is_instructor(current_user)
+
+    job = handout_jobs.get(job_id, current_user.id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found.")
+
+    return to_job_responses([job], load_job_handouts(db, [job]))[0]
+
+
 @router.get("/handouts", response_model=List[HandoutResponse], include_in_schema=True)
 async def get_all_handouts(
     order: HandoutSortOrder = HandoutSortOrder.DESC,  # Sort asc or desc
@@ -133,30 +260,30 @@ async def get_all_handouts(
     limit: int = Query(5, ge=1),                     # Limit of handouts per page (5 in this case)
     offset: int = Query(0, ge=0),                    # Offset for pagination
     searchQuery: Optional[str] = None,               # Search query (optional)
-    db: Session = Depends(get_db),
-    current_user: Users = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: TokenClaims = Depends(get_token_claims)
 ):
     # Ensure the user is an instructor
     check_is_instructor(current_user)
 
     # Base query for handouts
-    query = db.query(Handout).options(
+    query = select(Handout).options(
         joinedload(Handout.created_by),  # Load the related Users (instructor) data
         joinedload(Handout.section)      # Load the related Section data
     )
 
     # Filter by section if section_id is provided
     if section_id:
-        query = query.filter(Handout.section_id == section_id)
+        query = query.where(Handout.section_id == section_id)
 
     # Filter by user ID if provided
     if user_id:
-        query = query.filter(Handout.created_by_id == user_id)
+        query = query.where(Handout.created_by_id == user_id)
 
     # Apply search filter if the search query is provided (excluding Users search)
     if searchQuery:
         search_term = f"%{searchQuery}%"
-        query = query.filter(
+        query = query.where(
             or_(
                 Handout.title.ilike(search_term),       # Search by title
                 Handout.content.ilike(search_term)      # Search by content
@@ -170,7 +297,7 @@ async def get_all_handouts(
         query = query.order_by(Handout.created_at.desc())
 
     # Apply pagination using limit and offset
-    handouts = query.offset(offset).limit(limit).all()
+    handouts = (await db.scalars(query.offset(offset).limit(limit))).all()
 
     if not handouts:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No handouts found.")
@@ -192,14 +319,14 @@ async def get_all_handouts(
 @router.get("/handouts/pages", response_model=TotalPagesResponse, include_in_schema=True)
 async def get_total_pages(
       # default to 5 handouts per page
-    db: Session = Depends(get_db),
-    current_user: Users = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: TokenClaims = Depends(get_token_claims)
     ):
     # Ensure the user is an instructor
     check_is_instructor(current_user)
     limit: int = 5
     # Count the total number of handouts in the database
-    total_handouts = db.query(Handout).count()
+    total_handouts = await db.scalar(select(func.count(Handout.id)))
 
     # Calculate the total number of pages (chunks)
     total_pages = ceil(total_handouts / limit)
@@ -207,42 +334,133 @@ async def get_total_pages(
     return TotalPagesResponse(total_handouts=total_handouts, total_pages=total_pages)
 
     
+async def load_handout_index(db: AsyncSession, handout_id: UUID4):
+    """ETag, slide index and title of a handout, without reading its content."""
+    row = (await db.execute(
+        select(Handout.etag, Handout.slide_index, Handout.title).where(Handout.id == handout_id)
+    )).first()
+    if row is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Handout not found.")
+    if row.etag is None:
+        # Saved before slides were indexed; index it once now
+        handout = await db.get(Handout, handout_id)
+        index_handout(None, None, handout)
+        await db.commit()
+        return handout.etag, handout.slide_index, handout.title
+    return row.etag, row.slide_index, row.title
+
+
+def not_modified(request: Request, response: Response, etag: str, cache_control: Optional[str] = None) -> bool:
+    """Set caching headers and tell whether the client's copy (If-None-Match) is current."""
+    response.headers["ETag"] = f'"{etag}"'
+    response.headers["Cache-Control"] = cache_control or settings.HANDOUT_CACHE_CONTROL
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or f'"{etag}"' in tags
+
+
+def not_modified_response(response: Response) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={
+        "ETag": response.headers["ETag"],
+        "Cache-Control": response.headers["Cache-Control"]
+    })
+
+
 @router.get("/handouts/{handout_id}", response_model=HandoutResponse,include_in_schema=True)
 async def get_handout_by_id(
     handout_id: UUID4,
-    db: Session = Depends(get_db),
-    current_user: Users = Depends(get_current_user)):
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: TokenClaims = Depends(get_token_claims)):
     
     # Ensure the user is an instructor
     check_is_instructor(current_user)
 
-    # Query the handout by ID, including relationships to created_by (Users) and section
-    handout = db.query(Handout).options(joinedload(Handout.created_by), joinedload(Handout.section)).filter_by(id=handout_id).first()
+    # The handout never changes but the names do; a client holding the current ETag needs nothing else
+    etag, _, _ = await load_handout_index(db, handout_id)
+    names = (await db.execute(
+        select(User.fullname, Section.name)
+        .select_from(Handout)
+        .outerjoin(User, User.id == Handout.created_by_id)
+        .outerjoin(Section, Section.id == Handout.section_id)
+        .where(Handout.id == handout_id)
+    )).one()
+    if not_modified(request, response, handout_detail_etag(etag, *names), HANDOUT_DETAIL_CACHE_CONTROL):
+        return not_modified_response(response)
 
-    # Raise a 404 error if handout is not found
-    if handout is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Handout not found.")
+    # Query the handout by ID, including relationships to created_by (Users) and section
+    handout = await db.get(Handout, handout_id, options=[joinedload(Handout.created_by), joinedload(Handout.section)])
 
     # Return the handout details
-    return HandoutResponse(
-            id=handout.id,
-            instructor_name=handout.created_by.fullname, 
-            instructor_id = handout.created_by.id,
-            title=handout.title,
-            content=handout.content,
-            section_name=handout.section.name,
-            created_at=handout.created_at
-        )
+    return to_handout_response(handout)
+
+
+@router.get("/handouts/{handout_id}/toc", response_model=HandoutTocResponse, include_in_schema=True)
+async def get_handout_toc(
+    handout_id: UUID4,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: TokenClaims = Depends(get_token_claims)):
+    """Slide titles of a handout, for navigating it slide by slide."""
+    check_is_instructor(current_user)
+
+    etag, slides, title = await load_handout_index(db, handout_id)
+    if not_modified(request, response, f"{etag}-toc"):
+        return not_modified_response(response)
+
+    return HandoutTocResponse(
+        id=handout_id,
+        title=title,
+        slide_count=len(slides),
+        slides=[{"number": number, "title": slide["title"]} for number, slide in enumerate(slides, 1)]
+    )
+
+
+@router.get("/handouts/{handout_id}/slides/{number}", response_model=HandoutSlideResponse, include_in_schema=True)
+async def get_handout_slide(
+    handout_id: UUID4,
+    request: Request,
+    response: Response,
+    number: int = Path(..., ge=1, description="Slide number, starting at 1"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: TokenClaims = Depends(get_token_claims)):
+    """A single slide of a handout."""
+    check_is_instructor(current_user)
+
+    etag, slides, _ = await load_handout_index(db, handout_id)
+    if number > len(slides):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Slide not found.")
+    if not_modified(request, response, f"{etag}-{number}"):
+        return not_modified_response(response)
+
+    # Read only this slide's characters from the database
+    slide = slides[number - 1]
+    content = await db.scalar(
+        select(func.substr(Handout.content, slide["start"] + 1, slide["end"] - slide["start"]))
+        .where(Handout.id == handout_id)
+    )
+
+    return HandoutSlideResponse(
+        handout_id=handout_id,
+        number=number,
+        slide_count=len(slides),
+        title=slide["title"],
+        content=content
+    )
 
 
 
 @router.delete("/delete/{handout_id}", status_code=status.HTTP_200_OK,include_in_schema=True)
 async def remove_handout(
     handout_id: UUID4,
-    db: Session = Depends(get_db),
-    current_user: Users = Depends(get_current_user)):
+    db: AsyncSession = Depends(get_async_db),
+    current_user: TokenClaims = Depends(get_token_claims)):
     """
     Delete a handout by ID. Only the instructor who created it or an admin can delete it.
     """
     check_is_instructor(current_user)
-    return delete_handout(db=db, handout_id=handout_id, user_id=current_user.id)
\ No newline at end of file
+    return await async_crud.delete_handout(db=db, handout_id=handout_id, user_id=current_user.id)
\ No newline at end of file
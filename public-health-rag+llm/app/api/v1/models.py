@@ -1,8 +1,9 @@
-from sqlalchemy import Column, String, Boolean, DateTime, ForeignKey, UUID, Text, Integer
+from sqlalchemy import Column, String, Boolean, Date, DateTime, ForeignKey, UUID, Text, Integer, Index, JSON, event, text
 from sqlalchemy.orm import relationship
 import uuid
 from datetime import datetime
 from app.database import Base
+from app.slides import build_slide_index, handout_etag
 
 class Role(Base):
     __tablename__ = "roles"
@@ -21,11 +22,11 @@ class User(Base):
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     fullname = Column(String, nullable=False)
     email = Column(String, unique=True, nullable=False)
-    phone = Column(String, nullable=True)
+    phone = Column(String, nullable=True, index=True)
     password = Column(String, nullable=True)
-    role_id = Column(UUID(as_uuid=True), ForeignKey('roles.id'))
+    role_id = Column(UUID(as_uuid=True), ForeignKey('roles.id'), index=True)
     is_active = Column(Boolean, default=False)
-    facility_id = Column(UUID(as_uuid=True), ForeignKey("facilities.id"), nullable=True)
+    facility_id = Column(UUID(as_uuid=True), ForeignKey("facilities.id"), nullable=True, index=True)
     otp = Column(String, nullable=True)
     otp_expires_at = Column(DateTime, nullable=True)
     
@@ -44,7 +45,7 @@ class Facility(Base):
     facility_type = Column(String, nullable=False)
     managing_authority = Column(String, nullable=False)
     urban_rural = Column(String, nullable=False)
-    district_id = Column(UUID(as_uuid=True), ForeignKey("districts.id"))
+    district_id = Column(UUID(as_uuid=True), ForeignKey("districts.id"), index=True)
 
     district = relationship("District", back_populates="facilities")
     users = relationship("User", back_populates="facility")
@@ -71,11 +72,19 @@ class Section(Base):
 
 class Handout(Base):
     __tablename__ = "handouts"
+    __table_args__ = (
+        # Serve the handout listings: newest first, optionally by instructor or section
+        Index("ix_handouts_created_by_id_created_at", "created_by_id", "created_at"),
+        Index("ix_handouts_section_id_created_at", "section_id", "created_at"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
     title = Column(String, nullable=False)
     content = Column(Text, nullable=False)
-    created_at = Column(DateTime, default=datetime.now)
+    created_at = Column(DateTime, default=datetime.now, index=True)
+    # Precomputed on save (see index_handout): slide offsets/titles and a strong ETag
+    slide_index = Column(JSON, nullable=True)
+    etag = Column(String(32), nullable=True)
 
     # Instructor relation
     created_by_id = Column(UUID(as_uuid=True), ForeignKey('users.id'))
@@ -87,8 +96,23 @@ class Handout(Base):
     created_by = relationship("User", back_populates="handouts")
 
 
+@event.listens_for(Handout, "before_insert")
+@event.listens_for(Handout, "before_update")
+def index_handout(mapper, connection, handout):
+    handout.slide_index = build_slide_index(handout.content)
+    handout.etag = handout_etag(handout.title, handout.content)
+
+
 class ChatHistory(Base):
     __tablename__ = "chat_histories"
+    __table_args__ = (
+        # Serves retrieve_recent_chats: latest chats of a user within a section
+        Index("ix_chat_histories_user_section_timestamp", "user_id", "section_id", "timestamp"),
+        # Serves the section-wide reads: sample questions, fallback answers
+        Index("ix_chat_histories_section_timestamp", "section_id", "timestamp"),
+        # Serves app/analytics.py: chats after a (timestamp, id) watermark
+        Index("ix_chat_histories_timestamp_id", "timestamp", "id"),
+    )
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     question = Column(String, nullable=False)
@@ -104,13 +128,66 @@ class ChatHistory(Base):
 
 class FAQ(Base):
     __tablename__ = "faqs"
+    __table_args__ = (
+        # Serves fallback_answer's match on the normalized question; a hash
+        # index on Postgres, as questions can be too long for a btree entry
+        Index("ix_faqs_question_normalized", text("lower(trim(question))"), postgresql_using="hash"),
+    )
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     question = Column(String, nullable=False)
     answer = Column(String, nullable=False)
     frequency = Column(Integer, default=0)
-    chat_history_id = Column(UUID(as_uuid=True), ForeignKey("chat_histories.id"))
-    hsa_id = Column(UUID(as_uuid=True), ForeignKey("users.id"))
+    chat_history_id = Column(UUID(as_uuid=True), ForeignKey("chat_histories.id"), index=True)
+    hsa_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), index=True)
 
     chat_history = relationship("ChatHistory")
     hsa = relationship("User", back_populates="faqs")
+
+
+# Refresh tokens already exchanged, by hash: each one may be used only once.
+# Rows are deleted once the token would have expired anyway.
+class UsedRefreshToken(Base):
+    __tablename__ = "used_refresh_tokens"
+
+    token_hash = Column(String(64), primary_key=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+# Rollups: report counts kept up to date on every write (see app/rollups.py),
+# so report queries read one row per group instead of scanning the base tables.
+# The id is derived from the group columns, which may be null.
+
+class UserCountRollup(Base):
+    __tablename__ = "rollup_user_counts"
+
+    id = Column(UUID(as_uuid=True), primary_key=True)
+    role_id = Column(UUID(as_uuid=True), nullable=True)
+    district_id = Column(UUID(as_uuid=True), nullable=True)
+    facility_id = Column(UUID(as_uuid=True), nullable=True)
+    user_count = Column(Integer, nullable=False, default=0)
+
+
+class HandoutCountRollup(Base):
+    __tablename__ = "rollup_handout_counts"
+    __table_args__ = (
+        Index("ix_rollup_handout_counts_day", "day"),
+    )
+
+    id = Column(UUID(as_uuid=True), primary_key=True)
+    section_id = Column(UUID(as_uuid=True), nullable=True)
+    day = Column(Date, nullable=False)
+    handout_count = Column(Integer, nullable=False, default=0)
+
+
+class QuestionCountRollup(Base):
+    __tablename__ = "rollup_question_counts"
+    __table_args__ = (
+        Index("ix_rollup_question_counts_day", "day"),
+    )
+
+    id = Column(UUID(as_uuid=True), primary_key=True)
+    section_id = Column(UUID(as_uuid=True), nullable=True)
+    district_id = Column(UUID(as_uuid=True), nullable=True)
+    day = Column(Date, nullable=False)
+    question_count = Column(Integer, nullable=False, default=0)
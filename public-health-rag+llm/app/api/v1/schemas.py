@@ -1,6 +1,6 @@
 from pydantic import BaseModel, UUID4, EmailStr, Field, constr, model_validator
 from enum import Enum
-from datetime import datetime
+from datetime import date, datetime
 from typing import List, Optional
 
 class UserRole(str, Enum):
@@ -12,10 +12,22 @@ class UserRole(str, Enum):
 class TokenResponse(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
     # user_id:str
     # role: UserRole
 
 
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str
+
+
+# Identity carried in an access token
+class TokenClaims(BaseModel):
+    id: UUID4
+    email: EmailStr
+    role: UserRole
+
+
 class UserCreate(BaseModel):
     fullname: str = constr(min_length=3)
     email: EmailStr
@@ -358,6 +370,47 @@ class HandoutRequest(BaseModel):
     handout_id: UUID4
 
 
+# Schemas for reading a handout one slide at a time
+class HandoutSlideTitle(BaseModel):
+    number: int
+    title: str
+
+
+class HandoutTocResponse(BaseModel):
+    id: UUID4
+    title: str
+    slide_count: int
+    slides: List[HandoutSlideTitle]
+
+
+class HandoutSlideResponse(BaseModel):
+    handout_id: UUID4
+    number: int
+    slide_count: int
+    title: str
+    content: str
+
+
+# Status of a background job (app.tasks)
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+# Schema for a queued handout generation job
+class HandoutJobResponse(BaseModel):
+    job_id: UUID4
+    status: JobStatus
+    section_id: UUID4
+    topic: str
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
+    handout: Optional[HandoutResponse] = None
+
+
 class HandoutSortOrder(str, Enum):
     ASC = "asc"
     DESC = "desc"
@@ -389,6 +442,57 @@ class SectionHandoutCountResponse(BaseModel):
     handout_count: int
 
 
+class DistrictUserCountResponse(BaseModel):
+    district_id: Optional[UUID4] = None  # None: users without a facility
+    district_name: Optional[str] = None
+    role_name: str
+    user_count: int
+
+
+class HandoutVolumeResponse(BaseModel):
+    day: date
+    section_id: Optional[UUID4] = None
+    section_name: Optional[str] = None
+    handout_count: int
+
+
+class QuestionVolumeResponse(BaseModel):
+    day: date
+    section_id: Optional[UUID4] = None
+    section_name: Optional[str] = None
+    district_id: Optional[UUID4] = None
+    district_name: Optional[str] = None
+    question_count: int
+
+
+class QuestionTrendPoint(BaseModel):
+    week: date  # Monday of the week
+    topic: str
+    question_count: int
+
+
+class QuestionTrendResponse(BaseModel):
+    start: date
+    end: date
+    processed_through: Optional[datetime] = None  # questions asked later are not counted yet
+    points: List[QuestionTrendPoint]
+
+
+class QuestionHeatmapRow(BaseModel):
+    district_id: Optional[UUID4] = None  # None: HSAs without a facility
+    district_name: Optional[str] = None
+    counts: List[int]  # one per topic, in the order of QuestionHeatmapResponse.topics
+    total: int
+
+
+class QuestionHeatmapResponse(BaseModel):
+    start: date
+    end: date
+    processed_through: Optional[datetime] = None
+    topics: List[str]
+    districts: List[QuestionHeatmapRow]
+
+
 
 class EmailReset(BaseModel):
     email:EmailStr
\ No newline at end of file
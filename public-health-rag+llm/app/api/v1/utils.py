@@ -1,29 +1,33 @@
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
+import hashlib
 import random
 import smtplib
 import string
+from typing import Optional
 from fastapi import Depends, HTTPException, status
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from fastapi.security import OAuth2PasswordBearer
 from app.api.v1.crud import get_user_by_email
-from passlib.context import CryptContext
 # import jwt
 # from jwt import 
 from datetime import timedelta, datetime
 from pydantic import UUID4
 import os
 from app.database import get_db
-from app.api.v1.models import ChatHistory, Section,User
-from app.api.v1.schemas import EmailSendRequest, Users
+from app.api.v1.models import FAQ, ChatHistory, Section,User
+from app.api.v1.schemas import EmailSendRequest, TokenClaims, Users
 from langchain_chroma import Chroma
 from langchain_openai import OpenAIEmbeddings, ChatOpenAI
 from langchain.chains import RetrievalQA
 from langchain.prompts import PromptTemplate
 from app.config import settings
 from app.config import embedding, llm, vector_store
+from app.chat_buffer import chat_buffer
+from app.security import InvalidTokenError, create_token, decode_token, hash_password
 from dotenv import load_dotenv
-from authlib.jose import jwt
 # Load environment variables
 load_dotenv()
 
@@ -35,50 +39,71 @@ SECRET_KEY = settings.JWT_SECRET_KEY
 ALGORITHM = settings.ALGORITHM
 ACCESS_TOKEN_EXPIRE_MINUTES = settings.ACCESS_TOKEN_EXPIRE_MINUTES
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-header = {'alg': ALGORITHM}
 
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
-    payload = data.copy()
-    if expires_delta:
-        expire = datetime.now() + expires_delta
-    else:
-        expire = datetime.now() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    payload.update({"exp": expire})
     try:
-        encoded_jwt = jwt.encode(header,payload,SECRET_KEY)
-        # print(f"Encoded JWT: {encoded_jwt}")  # Add this for debugging
+        encoded_jwt = create_token(
+            data,
+            expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES),
+            token_type="access"
+        )
     except Exception as e:
         print(f"Error encoding JWT: {e}")
         raise
     return encoded_jwt
 
 
-# Function to get the current user from the token
-def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
-    credentials_exception = HTTPException(
+def create_refresh_token(data: dict, expires_delta: timedelta = None):
+    return create_token(
+        data,
+        expires_delta or timedelta(minutes=settings.REFRESH_TOKEN_EXPIRE_MINUTES),
+        token_type="refresh"
+    )
+
+
+def credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+
+# Claims of the current token; no database access
+def get_token_claims(token: str = Depends(oauth2_scheme)) -> TokenClaims:
     try:
-        payload = jwt.decode(token, SECRET_KEY)
-        # print(f"Decoded JWT: {payload}")  # Add this for debugging
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-    except Exception as e:
-        raise credentials_exception
+        payload = decode_token(token)
+    except InvalidTokenError:
+        raise credentials_exception()
+    if not payload.get("sub") or not payload.get("user_id") or not payload.get("role"):
+        raise credentials_exception()
+    return TokenClaims(id=payload["user_id"], email=payload["sub"], role=payload["role"])
+
+
+# Function to get the current user from the token
+def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
+    try:
+        payload = decode_token(token)
+    except InvalidTokenError:
+        raise credentials_exception()
+    email: str = payload.get("sub")
+    if email is None:
+        raise credentials_exception()
     user = get_user_by_email(db, email=email)
     if user is None:
-        raise credentials_exception
+        raise credentials_exception()
     return user
 
 
+def role_name(user) -> str:
+    """Role of either a User row or TokenClaims."""
+    return user.role if isinstance(user.role, str) else user.role.name
+
+
 # Role-based access control
 def check_is_instructor(current_user: Users):
-    if current_user.role.name == 'hsa':
+    if role_name(current_user) == 'hsa':
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You do not have permission to access this resource."
@@ -86,7 +111,7 @@ def check_is_instructor(current_user: Users):
         
 
 def check_is_admin(user: Users):
-    if user.role.name != "admin":
+    if role_name(user) != "admin":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, 
             detail="You are not authorized to perform this action"
@@ -139,23 +164,54 @@ PROMPT = PromptTemplate(
     template=PROMPT_TEMPLATE, input_variables=["context", "question"]
 )
 
+# Changes whenever the QA prompt does, so answers from different prompts are never shared
+PROMPT_VERSION = hashlib.sha256(PROMPT_TEMPLATE.encode()).hexdigest()[:12]
+
+
+def normalize_question(question: str) -> str:
+    """Case, spacing and trailing punctuation do not change the question."""
+    return " ".join(question.lower().split()).rstrip("?.! ")
+
+
+async def fallback_answer(db: AsyncSession, section_id: UUID4, question: str) -> Optional[str]:
+    """
+    A previous answer to the same question in the section, for when no LLM
+    answers in time: the most frequent matching FAQ, else the latest chat.
+    """
+    normalized = normalize_question(question)
+    candidates = [normalized, normalized + "?"]
+
+    faq_answer = await db.scalar(
+        select(FAQ.answer)
+        .join(ChatHistory, FAQ.chat_history_id == ChatHistory.id)
+        .where(ChatHistory.section_id == section_id, func.lower(func.trim(FAQ.question)).in_(candidates))
+        .order_by(FAQ.frequency.desc())
+        .limit(1)
+    )
+    if faq_answer:
+        return faq_answer
+
+    return await db.scalar(
+        select(ChatHistory.response)
+        .where(ChatHistory.section_id == section_id, func.lower(func.trim(ChatHistory.question)).in_(candidates))
+        .order_by(ChatHistory.timestamp.desc())
+        .limit(1)
+    )
+
 
 
-def validate_section(section_id: UUID4, db: Session):
+async def validate_section(section_id: UUID4, db: AsyncSession):
     """Ensure the section ID is valid."""
-    section = db.query(Section).filter_by(id=section_id).first()
+    section = await db.get(Section, section_id)
     if section is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Section not found")
     return section
 
 
-def retrieve_recent_chats(user_id: UUID4, section_id: UUID4, db: Session, limit: int = 5):
+async def retrieve_recent_chats(user_id: UUID4, section_id: UUID4, db: AsyncSession, limit: int = 5):
     """Retrieve the most recent chat history for the user in ascending order."""
-    recent_chats = db.query(ChatHistory).filter_by(user_id=user_id, section_id=section_id)\
-        .order_by(ChatHistory.timestamp.desc()).limit(limit).all()
-
-  
-    return recent_chats[::-1]
+    # Served from the write-behind buffer so chats not yet flushed are included
+    return await chat_buffer.recent_async(user_id, section_id, db, limit=limit)
 
 
 def setup_qa_chain(section_id: UUID4):
@@ -184,10 +240,6 @@ def verify_otp(user, otp):
         return True
     return False
 
-def hash_password(password: str):
-    return pwd_context.hash(password)
-
-
 def send_reset_password_otp_to_email(email_data: EmailSendRequest, db: Session):
     # Fetch the user by email
     user = db.query(User).filter(User.email == email_data.email).first()
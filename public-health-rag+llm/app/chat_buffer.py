@@ -0,0 +1,248 @@
+import atexit
+import logging
+import threading
+from datetime import datetime, timedelta
+from uuid import uuid4
+from sqlalchemy import insert, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.database import SessionLocal
+from app.api.v1.models import ChatHistory
+from app.metrics import metrics
+from app.rollups import record_questions
+
+logger = logging.getLogger(__name__)
+
+
+class ChatHistoryBuffer:
+    """
+    Write-behind buffer for ChatHistory rows.
+
+    Rows are accepted immediately and inserted in batches by a background
+    thread, either when the batch size is reached or when the flush interval
+    elapses. Recent chats are the persisted tail read from the database
+    (which has every worker's flushed chats) merged with this worker's rows
+    not flushed yet.
+
+    A batch that fails to insert is retried a row at a time, so one bad row
+    (e.g. its user was deleted) cannot hold back the others; a row is dropped
+    after failing max_attempts flushes. While the database is unreachable
+    rows are kept without counting attempts, up to max_pending, beyond which
+    the oldest are dropped. A row not saved within max_age of its timestamp
+    is dropped as well: readers that have moved past that time (the
+    analytics watermark) would never see it.
+    """
+
+    def __init__(self, batch_size: int, flush_interval: float, recent_limit: int,
+                 max_attempts: int = 3, max_pending: int = 10000, max_age: float = 300):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.recent_limit = recent_limit
+        self.max_attempts = max_attempts
+        self.max_pending = max_pending
+        self.max_age = timedelta(seconds=max_age)
+        self._pending = []
+        self._flushing = []
+        self._attempts = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def add(self, question: str, response: str, section_id, user_id) -> dict:
+        """Queue a chat for insertion."""
+        row = {
+            "id": uuid4(),
+            "question": question,
+            "response": response,
+            "timestamp": datetime.now(),
+            "section_id": section_id,
+            "user_id": user_id,
+        }
+        with self._lock:
+            self._ensure_started()
+            self._pending.append(row)
+            should_flush = len(self._pending) >= self.batch_size
+            overflow = self._pending[:-self.max_pending] if len(self._pending) > self.max_pending else []
+            if overflow:
+                del self._pending[:len(overflow)]
+                self._forget(overflow)
+
+        if overflow:
+            metrics.increment("chat_buffer.dropped", len(overflow))
+            logger.error("Chat history buffer is full (%d rows); dropped the %d oldest unsaved chats",
+                         self.max_pending, len(overflow))
+        if should_flush:
+            self._wakeup.set()
+        return row
+
+    def _forget(self, rows):
+        # Caller must hold the lock
+        for row in rows:
+            self._attempts.pop(row["id"], None)
+
+    def _unflushed(self, user_id, section_id) -> list:
+        with self._lock:
+            return [
+                row for row in self._flushing + self._pending
+                if row["user_id"] == user_id and row["section_id"] == section_id
+            ]
+
+    def _persisted_query(self, user_id, section_id, limit: int):
+        return select(ChatHistory).filter_by(user_id=user_id, section_id=section_id)\
+            .order_by(ChatHistory.timestamp.desc()).limit(limit)
+
+    @staticmethod
+    def _merge(persisted, unflushed: list, limit: int) -> list:
+        """
+        The last limit chats of both, oldest first. unflushed was taken
+        before the read, so a row flushed in between is in one or both.
+        """
+        rows = {
+            chat.id: {
+                "id": chat.id,
+                "question": chat.question,
+                "response": chat.response,
+                "timestamp": chat.timestamp,
+                "section_id": chat.section_id,
+                "user_id": chat.user_id,
+            }
+            for chat in persisted
+        }
+        for row in unflushed:
+            rows.setdefault(row["id"], row)
+        return sorted(rows.values(), key=lambda row: row["timestamp"])[-limit:]
+
+    def recent(self, user_id, section_id, db: Session, limit: int = None) -> list:
+        """Return the most recent chats for the user in the section, oldest first."""
+        limit = limit or self.recent_limit
+        unflushed = self._unflushed(user_id, section_id)
+        persisted = db.execute(self._persisted_query(user_id, section_id, limit)).scalars().all()
+        return self._merge(persisted, unflushed, limit)
+
+    async def recent_async(self, user_id, section_id, db: AsyncSession, limit: int = None) -> list:
+        """recent() for async endpoints."""
+        limit = limit or self.recent_limit
+        unflushed = self._unflushed(user_id, section_id)
+        persisted = (await db.execute(self._persisted_query(user_id, section_id, limit))).scalars().all()
+        return self._merge(persisted, unflushed, limit)
+
+    def _insert(self, rows):
+        """Insert rows in one transaction; returns the error, or None when they were saved."""
+        db = SessionLocal()
+        try:
+            db.execute(insert(ChatHistory), rows)
+            # Bulk inserts skip the ORM events, so count the questions here
+            record_questions(db.connection(), rows)
+            db.commit()
+            return None
+        except Exception as e:
+            db.rollback()
+            return e
+        finally:
+            db.close()
+
+    def flush(self):
+        """Insert all pending rows, in a single transaction unless it fails."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch, self._pending = self._pending, []
+                self._flushing = batch
+
+            saved, failed, unreachable = [], [], []
+            error = self._insert(batch)
+            if error is None:
+                saved = batch
+            elif isinstance(error, OperationalError):
+                # The database is down, not the rows bad: keep them all for the next flush
+                logger.warning("Failed to flush %d chat histories: %s", len(batch), error)
+                unreachable = batch
+            else:
+                # One bad row must not hold back the rest of the batch
+                logger.warning("Failed to flush %d chat histories, retrying them one at a time: %s", len(batch), error)
+                for row in batch:
+                    error = self._insert([row])
+                    if error is None:
+                        saved.append(row)
+                    elif isinstance(error, OperationalError):
+                        unreachable.append(row)
+                    else:
+                        logger.error("Failed to save chat history %s: %s", row["id"], error)
+                        failed.append(row)
+
+            with self._lock:
+                retry, dropped = [], []
+                for row in failed:
+                    attempts = self._attempts.get(row["id"], 0) + 1
+                    if attempts < self.max_attempts:
+                        self._attempts[row["id"]] = attempts
+                        retry.append(row)
+                    else:
+                        dropped.append(row)
+                retry += unreachable
+                for row in saved:
+                    self._attempts.pop(row["id"], None)
+                # Too old to save: the analytics run may already have read past its timestamp
+                oldest = datetime.now() - self.max_age
+                expired = [row for row in retry if row["timestamp"] < oldest]
+                if expired:
+                    retry = [row for row in retry if row["timestamp"] >= oldest]
+                    dropped += expired
+                self._forget(dropped)
+                # Retried rows go back in front, ahead of newer chats, within the bound
+                self._pending = retry + self._pending
+                overflow = self._pending[:-self.max_pending] if len(self._pending) > self.max_pending else []
+                if overflow:
+                    del self._pending[:len(overflow)]
+                    self._forget(overflow)
+                dropped += overflow
+                self._flushing = []
+
+            if failed or unreachable:
+                metrics.increment("chat_buffer.flush_failures", len(failed) + len(unreachable))
+            if dropped:
+                metrics.increment("chat_buffer.dropped", len(dropped))
+                logger.error("Dropped %d chat histories that could not be saved (%d failed %d flushes or were "
+                             "unsaved for %s, %d over the %d-row buffer limit)", len(dropped),
+                             len(dropped) - len(overflow), self.max_attempts, self.max_age, len(overflow),
+                             self.max_pending)
+            return len(saved)
+
+    def stop(self):
+        """Stop the background thread and flush whatever is still pending."""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def _ensure_started(self):
+        # Caller must hold the lock
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="chat-history-flush", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+
+chat_buffer = ChatHistoryBuffer(
+    batch_size=settings.CHAT_FLUSH_BATCH_SIZE,
+    flush_interval=settings.CHAT_FLUSH_INTERVAL_SECONDS,
+    recent_limit=settings.CHAT_RECENT_LIMIT,
+    max_attempts=settings.CHAT_FLUSH_MAX_ATTEMPTS,
+    max_pending=settings.CHAT_PENDING_LIMIT,
+    # Saved well inside the analytics settle window, or not at all
+    max_age=settings.ANALYTICS_SETTLE_MINUTES * 60 / 2,
+)
+
+# Flush on interpreter exit as well, in case the app shutdown hook never runs
+atexit.register(chat_buffer.stop)
@@ -1,9 +1,13 @@
 import os
+from typing import Dict, Optional
 from dotenv import load_dotenv
 load_dotenv()
 from langchain_chroma import Chroma
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from pydantic_settings import BaseSettings
+from app.llm_backends import build_llm
+from app.llm_client import build_resilient_llm
+from app.stubs import LatencyModel, StubEmbeddings, StubVectorStore
 
 # Settings class to load environment variables
 class Settings(BaseSettings):
@@ -17,10 +21,71 @@ class Settings(BaseSettings):
     OPENAI_KEY: str = os.getenv("OPENAI_KEY")
     TVLY_API: str = os.getenv("TVLY_API")
     ALGORITHM: str = "HS256"
-    ACCESS_TOKEN_EXPIRE_MINUTES: int = 999999
+    ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    REFRESH_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 14
+    TOKEN_CACHE_SIZE: int = 10000
     PINECONE_API_KEY: str = os.getenv("PINECONE_API_KEY")
     GEMINI_API_KEY: str = os.getenv("GEMINI_API_KEY")
     GMAIL_PASSWORD: str = os.getenv("GMAIL_PASSWORD")
+    HANDOUT_JOB_WORKERS: int = 4
+    HANDOUT_JOBS_PER_INSTRUCTOR: int = 2
+    HANDOUT_JOB_RETENTION_MINUTES: int = 60
+    CHAT_FLUSH_BATCH_SIZE: int = 50
+    CHAT_FLUSH_INTERVAL_SECONDS: float = 2.0
+    CHAT_FLUSH_MAX_ATTEMPTS: int = 3  # a chat that fails this many flushes is dropped and logged
+    CHAT_PENDING_LIMIT: int = 10000  # unsaved chats kept before the oldest are dropped
+    CHAT_RECENT_LIMIT: int = 5
+    PASSWORD_SCHEMES: str = "bcrypt"  # e.g. "argon2,bcrypt" to migrate to argon2 on login
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 2
+    LLM_BACKEND: str = "openai"  # openai, local_http (vLLM/TGI OpenAI-compatible server) or local (in-process)
+    LLM_TEMPERATURE: float = 0.1
+    OPENAI_MODEL: str = "gpt-4o"
+    OPENAI_BASE_URL: Optional[str] = None  # e.g. a stand-in server (benchmarks/llm_standin.py)
+    LLM_FALLBACK_BACKEND: Optional[str] = None  # second backend for hedging and failover, e.g. local_http
+    LLM_DEADLINE_SECONDS: float = 20.0  # answer to /hsa/ask within this, whichever backend gives it
+    LLM_HANDOUT_DEADLINE_SECONDS: float = 180.0
+    LLM_MAX_RETRIES: int = 1  # client retries within a backend; failover covers the rest
+    LLM_HEDGE_DELAY_SECONDS: float = 3.0  # until enough latencies are seen for the quantile
+    LLM_HEDGE_QUANTILE: float = 0.95
+    LLM_HEDGE_MIN_DELAY_SECONDS: float = 0.5
+    LLM_BREAKER_FAILURES: int = 5
+    LLM_BREAKER_RESET_SECONDS: float = 30.0
+    LOCAL_LLM_MODEL: str = "Llama-2-7b-public-health-chat-merged"  # served model name, or a path for local
+    LOCAL_LLM_BASE_URL: str = "http://localhost:8001/v1"
+    LOCAL_LLM_API_KEY: str = "EMPTY"
+    LOCAL_LLM_MAX_NEW_TOKENS: int = 512  # answers to questions
+    LOCAL_LLM_HANDOUT_MAX_NEW_TOKENS: int = 3072  # a ten-slide handout
+    LOCAL_LLM_MAX_BATCH_SIZE: int = 8
+    LOCAL_LLM_BATCH_WAIT_MS: int = 10
+    LOCAL_LLM_DTYPE: str = "fp32"  # fp32, bf16, fp16 or int8
+    LOCAL_LLM_TIMEOUT_SECONDS: float = 120.0
+    COMPRESSION_MINIMUM_SIZE: int = 1024  # bytes; smaller responses are sent uncompressed
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 4  # 0-11; higher is smaller but slower
+    LLM_MAX_CONCURRENCY: int = 16  # LLM calls in progress at once, across all routes
+    LLM_MAX_CONCURRENCY_PER_USER: int = 2
+    LLM_BULK_SHARE: float = 0.5  # most of the slots handout generation may hold
+    LLM_QUEUE_TIMEOUT_SECONDS: float = 30.0
+    LLM_MAX_QUEUE: int = 200
+    LLM_RATE_PER_USER_PER_MINUTE: float = 20  # per user, separately for questions and handouts; 0 disables
+    LLM_RATE_BURST: int = 5
+    LLM_RATE_PER_ROLE_PER_MINUTE: Dict[str, float] = {"hsa": 600, "instructor": 60, "admin": 60}
+    LLM_RATE_GLOBAL_PER_MINUTE: float = 900  # keep under the OpenAI account limit
+    HANDOUT_CACHE_CONTROL: str = "private, max-age=31536000, immutable"  # handouts never change once saved
+    DATABASE_URL: Optional[str] = None  # overrides the Supabase database, e.g. sqlite:///./loadtest.db
+    DB_POOL_SIZE: int = 10  # connections per worker for each engine (sync and async)
+    DB_MAX_OVERFLOW: int = 10
+    DB_PREPARED_STATEMENTS: bool = False  # asyncpg statement cache; must stay off behind a transaction pooler (Supabase port 6543)
+    ANALYTICS_DIR: str = "data/analytics"  # question-topic dataset, written by python -m app.analytics and read by the API
+    ANALYTICS_BATCH_SIZE: int = 5000  # chats classified per batch
+    ANALYTICS_SETTLE_MINUTES: int = 10  # newer chats wait for the next run; the chat buffer drops chats unsaved after half of this
+    STUB_LLM_MEDIAN_MS: float = 800  # LLM_BACKEND=stub latency, log-normal
+    STUB_LLM_P95_MS: float = 2500
+    STUB_RETRIEVAL_MEDIAN_MS: float = 30
+    STUB_RETRIEVAL_P95_MS: float = 120
+    STUB_SEED: int = 0
+    STUB_RETRIEVAL: bool = False  # stub embeddings and retrieval with a real LLM backend
 
     class Config:
         env_file = ".env"
@@ -32,20 +97,41 @@ settings = Settings()
 class AIInitializer:
     def __init__(self, settings: Settings):
         # Set up the OpenAI API key
-        os.environ["OPENAI_API_KEY"] = settings.OPENAI_KEY
-        
+        if settings.OPENAI_KEY:
+            os.environ["OPENAI_API_KEY"] = settings.OPENAI_KEY
+
         # Initialize the embeddings and vector store
-        self.embedding = OpenAIEmbeddings(model="text-embedding-ada-002")
-        self.vector_store = Chroma(
-            collection_name="idsr",
-            embedding_function=self.embedding,
-            persist_directory="data/idsr_vectors"
-        )
+        if settings.LLM_BACKEND == "stub" or settings.STUB_RETRIEVAL:
+            # Offline stand-ins for load testing, no OpenAI or Chroma calls
+            latency = LatencyModel(settings.STUB_RETRIEVAL_MEDIAN_MS, settings.STUB_RETRIEVAL_P95_MS, settings.STUB_SEED)
+            self.embedding = StubEmbeddings()
+            self.vector_store = StubVectorStore(self.embedding, latency=latency)
+        else:
+            self.embedding = OpenAIEmbeddings(model="text-embedding-ada-002")
+            self.vector_store = Chroma(
+                collection_name="idsr",
+                embedding_function=self.embedding,
+                persist_directory="data/idsr_vectors"
+            )
 
-        # Initialize the language model
-        self.llm = ChatOpenAI(
-            model_name='gpt-4o',
-            temperature=0.1
+        # Initialize the language models for the configured backends. Questions
+        # get a short deadline and hedging, handouts a long deadline, a larger
+        # token budget on the local backends and failover only. Each model
+        # times out at its client's deadline
+        deadline = settings.LLM_DEADLINE_SECONDS
+        primary = build_llm(settings, timeout=deadline)
+        fallback = build_llm(
+            settings, backend=settings.LLM_FALLBACK_BACKEND, timeout=deadline
+        ) if settings.LLM_FALLBACK_BACKEND else None
+        self.llm = build_resilient_llm(settings, primary, fallback, deadline=deadline)
+        handout_tokens = settings.LOCAL_LLM_HANDOUT_MAX_NEW_TOKENS
+        handout_deadline = settings.LLM_HANDOUT_DEADLINE_SECONDS
+        handout_primary = build_llm(settings, max_new_tokens=handout_tokens, timeout=handout_deadline)
+        handout_fallback = build_llm(
+            settings, backend=settings.LLM_FALLBACK_BACKEND, max_new_tokens=handout_tokens, timeout=handout_deadline
+        ) if settings.LLM_FALLBACK_BACKEND else None
+        self.handout_llm = build_resilient_llm(
+            settings, handout_primary, handout_fallback, deadline=handout_deadline, hedge=False
         )
 
     def get_embedding(self):
@@ -60,10 +146,15 @@ class AIInitializer:
         """Returns the initialized LLM."""
         return self.llm
 
+    def get_handout_llm(self):
+        """Returns the LLM used for handout generation."""
+        return self.handout_llm
+
 
 ai_initializer = AIInitializer(settings)
 
 # Access the LLM and embedding
 llm = ai_initializer.get_llm()
+handout_llm = ai_initializer.get_handout_llm()
 embedding = ai_initializer.get_embedding()
 vector_store = ai_initializer.get_vector_store()
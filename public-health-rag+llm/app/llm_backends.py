@@ -0,0 +1,267 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import Generation, LLMResult
+from langchain_openai import ChatOpenAI
+from pydantic import PrivateAttr
+from app.metrics import metrics
+
+LLM_BACKENDS = ["openai", "local_http", "local", "stub"]
+
+
+class LLMMetricsCallback(BaseCallbackHandler):
+    """Records latency, errors and token throughput of every LLM call under llm.<backend>.*"""
+
+    def __init__(self, backend: str):
+        self.backend = backend
+        self._started: Dict[UUID, float] = {}
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs: Any):
+        self._started[run_id] = time.perf_counter()
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *, run_id: UUID, **kwargs: Any):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any):
+        started = self._started.pop(run_id, None)
+        if started is None:
+            return
+        latency = time.perf_counter() - started
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        completion_tokens = usage.get("completion_tokens", 0)
+
+        prefix = f"llm.{self.backend}"
+        metrics.increment(f"{prefix}.calls")
+        metrics.increment(f"{prefix}.prompt_tokens", usage.get("prompt_tokens", 0))
+        metrics.increment(f"{prefix}.completion_tokens", completion_tokens)
+        metrics.observe(f"{prefix}.latency_seconds", latency)
+        if completion_tokens:
+            metrics.observe(f"{prefix}.tokens_per_second", completion_tokens / latency)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._started.pop(run_id, None)
+        metrics.increment(f"llm.{self.backend}.errors")
+
+
+class BatchingEngine:
+    """
+    Runs a Hugging Face causal LM in-process and batches concurrent requests.
+
+    Requests arriving within `max_wait_ms` of each other (up to
+    `max_batch_size`) share one generate() call, so a burst of questions
+    costs roughly one forward pass per token instead of one per question.
+    Only requests with the same max_new_tokens share a batch, so questions
+    do not wait for a handout's longer generation. The model is loaded on
+    the worker thread on first use.
+    """
+
+    def __init__(self, model_path: str, max_batch_size: int = 8, max_wait_ms: int = 10, dtype: str = "fp32"):
+        self.model_path = model_path
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.dtype = dtype
+        self._requests: "queue.Queue[tuple]" = queue.Queue()
+        # Requests taken off the queue for another batch; worker thread only
+        self._deferred: deque = deque()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, prompt: str, max_new_tokens: int) -> Future:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="local-llm", daemon=True)
+                self._thread.start()
+        future = Future()
+        self._requests.put((prompt, future, max_new_tokens))
+        return future
+
+    def _load(self):
+        import torch
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(self.model_path)
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        tokenizer.padding_side = "left"
+
+        torch_dtype = {"bf16": torch.bfloat16, "fp16": torch.float16}.get(self.dtype, torch.float32)
+        model = AutoModelForCausalLM.from_pretrained(self.model_path, torch_dtype=torch_dtype)
+        if self.dtype == "int8":
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        model.eval()
+        return torch, tokenizer, model
+
+    def _next_batch(self) -> list:
+        batch = [self._deferred.popleft() if self._deferred else self._requests.get()]
+        max_new_tokens = batch[0][2]
+        for request in [request for request in self._deferred if request[2] == max_new_tokens]:
+            if len(batch) == self.max_batch_size:
+                break
+            self._deferred.remove(request)
+            batch.append(request)
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            (batch if request[2] == max_new_tokens else self._deferred).append(request)
+        return batch
+
+    def _run(self):
+        try:
+            torch, tokenizer, model = self._load()
+        except Exception as e:
+            # Fail every request rather than hanging them
+            while self._deferred:
+                self._deferred.popleft()[1].set_exception(e)
+            while True:
+                _, future, _ = self._requests.get()
+                future.set_exception(e)
+
+        while True:
+            batch = self._next_batch()
+            metrics.observe("llm.local.batch_size", len(batch))
+            try:
+                inputs = tokenizer([prompt for prompt, _, _ in batch], return_tensors="pt", padding=True).to(model.device)
+                with torch.inference_mode():
+                    outputs = model.generate(
+                        **inputs,
+                        max_new_tokens=batch[0][2],
+                        do_sample=False,
+                        pad_token_id=tokenizer.pad_token_id,
+                    )
+                generated = outputs[:, inputs["input_ids"].shape[1]:]
+                for row, (_, future, _) in enumerate(batch):
+                    future.set_result({
+                        "text": tokenizer.decode(generated[row], skip_special_tokens=True).strip(),
+                        "prompt_tokens": int(inputs["attention_mask"][row].sum()),
+                        "completion_tokens": int((generated[row] != tokenizer.pad_token_id).sum()),
+                    })
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+
+_engines: Dict[tuple, BatchingEngine] = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(model_path: str, max_batch_size: int, max_wait_ms: int, dtype: str) -> BatchingEngine:
+    # One engine (and one copy of the model) per model, shared by the question and handout clients
+    key = (model_path, max_batch_size, max_wait_ms, dtype)
+    with _engines_lock:
+        if key not in _engines:
+            _engines[key] = BatchingEngine(model_path, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms, dtype=dtype)
+        return _engines[key]
+
+
+class LocalLLM(LLM):
+    """LangChain LLM backed by an in-process BatchingEngine serving the merged fine-tuned model."""
+
+    model_path: str
+    max_batch_size: int = 8
+    max_wait_ms: int = 10
+    max_new_tokens: int = 512
+    dtype: str = "fp32"
+    request_timeout: float = 120.0
+    _engine: BatchingEngine = PrivateAttr()
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._engine = get_engine(self.model_path, self.max_batch_size, self.max_wait_ms, self.dtype)
+
+    @property
+    def _llm_type(self) -> str:
+        return "local-hf"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, **kwargs: Any) -> str:
+        return self._generate([prompt], stop=stop).generations[0][0].text
+
+    def _generate(self, prompts: List[str], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> LLMResult:
+        # The fine-tune was trained on Llama-2 chat prompts
+        futures = [self._engine.submit(f"[INST] {prompt.strip()} [/INST]", self.max_new_tokens) for prompt in prompts]
+        results = [future.result(timeout=self.request_timeout) for future in futures]
+
+        generations = []
+        for result in results:
+            text = result["text"]
+            for stop_sequence in stop or []:
+                text = text.split(stop_sequence)[0]
+            generations.append([Generation(text=text)])
+        return LLMResult(
+            generations=generations,
+            llm_output={"token_usage": {
+                "prompt_tokens": sum(result["prompt_tokens"] for result in results),
+                "completion_tokens": sum(result["completion_tokens"] for result in results),
+            }},
+        )
+
+
+def build_llm(settings, backend: Optional[str] = None, max_new_tokens: Optional[int] = None,
+              timeout: Optional[float] = None):
+    """
+    Create the LLM selected by backend, settings.LLM_BACKEND by default.
+    max_new_tokens caps the local backends' answers (LOCAL_LLM_MAX_NEW_TOKENS
+    by default; handouts need more). timeout bounds each request, the
+    caller's deadline (LLM_DEADLINE_SECONDS, or LOCAL_LLM_TIMEOUT_SECONDS on
+    the local backends, by default):
+
+    - openai: ChatOpenAI with settings.OPENAI_MODEL
+    - local_http: an OpenAI-compatible server (vLLM, TGI) serving the merged
+      fine-tune, which does the continuous batching itself
+    - local: the merged fine-tune loaded in this process (LocalLLM)
+    - stub: deterministic answers after a simulated delay, for load tests
+    """
+    backend = backend or settings.LLM_BACKEND
+    callbacks = [LLMMetricsCallback(backend)]
+
+    if backend == "openai":
+        return ChatOpenAI(
+            model_name=settings.OPENAI_MODEL,
+            base_url=settings.OPENAI_BASE_URL,
+            temperature=settings.LLM_TEMPERATURE,
+            timeout=timeout or settings.LLM_DEADLINE_SECONDS,
+            max_retries=settings.LLM_MAX_RETRIES,
+            callbacks=callbacks
+        )
+    if backend == "local_http":
+        return ChatOpenAI(
+            model_name=settings.LOCAL_LLM_MODEL,
+            base_url=settings.LOCAL_LLM_BASE_URL,
+            api_key=settings.LOCAL_LLM_API_KEY,
+            temperature=settings.LLM_TEMPERATURE,
+            max_tokens=max_new_tokens or settings.LOCAL_LLM_MAX_NEW_TOKENS,
+            timeout=timeout or settings.LOCAL_LLM_TIMEOUT_SECONDS,
+            max_retries=settings.LLM_MAX_RETRIES,
+            callbacks=callbacks
+        )
+    if backend == "local":
+        return LocalLLM(
+            model_path=settings.LOCAL_LLM_MODEL,
+            max_batch_size=settings.LOCAL_LLM_MAX_BATCH_SIZE,
+            max_wait_ms=settings.LOCAL_LLM_BATCH_WAIT_MS,
+            max_new_tokens=max_new_tokens or settings.LOCAL_LLM_MAX_NEW_TOKENS,
+            dtype=settings.LOCAL_LLM_DTYPE,
+            request_timeout=timeout or settings.LOCAL_LLM_TIMEOUT_SECONDS,
+            callbacks=callbacks
+        )
+    if backend == "stub":
+        from app.stubs import StubLLM
+        return StubLLM(
+            median_ms=settings.STUB_LLM_MEDIAN_MS,
+            p95_ms=settings.STUB_LLM_P95_MS,
+            seed=settings.STUB_SEED,
+            callbacks=callbacks
+        )
+    raise ValueError(f"Unknown LLM_BACKEND '{backend}', expected one of {LLM_BACKENDS}")
@@ -0,0 +1,240 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional
+from langchain_core.language_models.llms import LLM
+from pydantic import PrivateAttr
+from app.metrics import metrics
+
+
+class LLMUnavailable(Exception):
+    """No backend produced an answer before the deadline."""
+
+
+class CircuitBreaker:
+    """
+    Stops calling a backend after `failure_threshold` consecutive failures
+    (errors, or answers slower than the deadline). After `reset_seconds`
+    one trial call is let through (half open); its outcome closes or
+    re-opens the breaker.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_seconds: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_seconds:
+                return "half_open"
+            return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at >= self.reset_seconds and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record(self, success: bool):
+        with self._lock:
+            self._trial_in_flight = False
+            if success:
+                self._failures = 0
+                self._opened_at = None
+                return
+            self._failures += 1
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    metrics.increment(f"llm.client.{self.name}.breaker_opened")
+                self._opened_at = time.monotonic()
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str, failure_threshold: int, reset_seconds: float) -> CircuitBreaker:
+    # One breaker per backend, shared by every client that calls it
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name, failure_threshold, reset_seconds)
+        return _breakers[name]
+
+
+def breaker_states() -> Dict[str, str]:
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.state for breaker in breakers}
+
+
+class ResilientLLM(LLM):
+    """
+    Calls the primary LLM with a deadline, failing over to the fallback.
+
+    - Every call must finish within `deadline` seconds, else LLMUnavailable.
+    - If the primary has not answered after the hedge delay (the
+      `hedge_quantile` of its recent latencies, `hedge_delay` until there
+      are enough samples), the same prompt is also sent to the fallback and
+      the first answer wins. With hedge=False the fallback is only used
+      when the primary fails.
+    - Backends behind an open circuit breaker are skipped.
+
+    Calls run on a thread pool per backend, so calls abandoned on a hung
+    primary cannot take the workers a hedge or failover needs. A losing or
+    abandoned call is left to finish in the background, bounded by the
+    model's client timeout, which should equal the deadline.
+    """
+
+    primary: Any
+    fallback: Any = None
+    primary_name: str = "primary"
+    fallback_name: str = "fallback"
+    deadline: float = 20.0
+    hedge: bool = True
+    hedge_delay: float = 3.0
+    hedge_quantile: float = 0.95
+    min_hedge_delay: float = 0.5
+    breaker_failures: int = 5
+    breaker_reset_seconds: float = 30.0
+    max_workers: int = 64
+    _executors: Dict[str, ThreadPoolExecutor] = PrivateAttr()
+    _latencies: deque = PrivateAttr()
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._executors = {
+            name: ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"llm-{name}")
+            for name in (self.primary_name, self.fallback_name)
+        }
+        self._latencies = deque(maxlen=200)
+
+    @property
+    def _llm_type(self) -> str:
+        return "resilient"
+
+    def current_hedge_delay(self) -> float:
+        latencies = sorted(self._latencies)
+        if len(latencies) < 20:
+            return self.hedge_delay
+        quantile = latencies[min(len(latencies) - 1, int(len(latencies) * self.hedge_quantile))]
+        return max(self.min_hedge_delay, quantile)
+
+    def _submit(self, name: str, model, prompt: str, stop: Optional[List[str]]):
+        breaker = get_breaker(name, self.breaker_failures, self.breaker_reset_seconds)
+        started = time.monotonic()
+
+        def call():
+            result = model.invoke(prompt, stop=stop)
+            # Chat models return a message, plain LLMs a string
+            return getattr(result, "content", result)
+
+        def finished(future):
+            if getattr(future, "abandoned", False):
+                return  # already counted as a failure at the deadline
+            elapsed = time.monotonic() - started
+            success = future.exception() is None and elapsed <= self.deadline
+            breaker.record(success)
+            if success and name == self.primary_name:
+                self._latencies.append(elapsed)
+            if future.exception() is not None:
+                metrics.increment(f"llm.client.{name}.errors")
+
+        future = self._executors[name].submit(call)
+        future.add_done_callback(finished)
+        return future
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        start = time.monotonic()
+        deadline_at = start + self.deadline
+        primary_breaker = get_breaker(self.primary_name, self.breaker_failures, self.breaker_reset_seconds)
+        fallback_breaker = get_breaker(self.fallback_name, self.breaker_failures, self.breaker_reset_seconds)
+
+        running = {}
+        if primary_breaker.allow():
+            running[self._submit(self.primary_name, self.primary, prompt, stop)] = self.primary_name
+        fallback_started = False
+        if not running and self.fallback is not None and fallback_breaker.allow():
+            metrics.increment("llm.client.failovers")
+            running[self._submit(self.fallback_name, self.fallback, prompt, stop)] = self.fallback_name
+            fallback_started = True
+        if not running:
+            metrics.increment("llm.client.unavailable")
+            raise LLMUnavailable("All LLM backends are unavailable")
+
+        hedge_at = start + self.current_hedge_delay()
+        errors = []
+        while running:
+            now = time.monotonic()
+            timeout = deadline_at - now
+            can_hedge = self.hedge and self.fallback is not None and not fallback_started
+            if can_hedge:
+                timeout = min(timeout, hedge_at - now)
+            done, _ = wait(list(running), timeout=max(0.0, timeout), return_when=FIRST_COMPLETED)
+
+            for future in done:
+                name = running.pop(future)
+                if future.exception() is None:
+                    if name == self.fallback_name and self.primary_name in running.values():
+                        metrics.increment("llm.client.hedge_wins")
+                    metrics.observe("llm.client.latency_seconds", time.monotonic() - start)
+                    return future.result()
+                errors.append(f"{name}: {future.exception()!r}")
+                # Primary failed: go to the fallback now rather than at the hedge time
+                if name == self.primary_name and self.fallback is not None and not fallback_started and fallback_breaker.allow():
+                    metrics.increment("llm.client.failovers")
+                    running[self._submit(self.fallback_name, self.fallback, prompt, stop)] = self.fallback_name
+                    fallback_started = True
+
+            now = time.monotonic()
+            if now >= deadline_at:
+                break
+            if not done and can_hedge and now >= hedge_at:
+                fallback_started = True
+                if fallback_breaker.allow():
+                    metrics.increment("llm.client.hedges")
+                    running[self._submit(self.fallback_name, self.fallback, prompt, stop)] = self.fallback_name
+
+        if running:
+            # Count a hung backend against its breaker now, not when it finally returns
+            for future, name in running.items():
+                future.abandoned = True
+                get_breaker(name, self.breaker_failures, self.breaker_reset_seconds).record(False)
+            metrics.increment("llm.client.deadline_exceeded")
+            errors.append(f"no answer within {self.deadline:.0f}s")
+        metrics.increment("llm.client.unavailable")
+        raise LLMUnavailable("; ".join(errors))
+
+
+def build_resilient_llm(settings, primary, fallback=None, deadline: float = 20.0, hedge: bool = True) -> ResilientLLM:
+    """
+    Wrap the LLM_BACKEND model (primary) and the LLM_FALLBACK_BACKEND model
+    (fallback, optional) with deadlines, hedging and circuit breaking. Build
+    the models with the deadline as their timeout (build_llm), so an
+    abandoned call frees its worker soon after the deadline.
+    """
+    return ResilientLLM(
+        primary=primary,
+        primary_name=settings.LLM_BACKEND,
+        fallback=fallback,
+        fallback_name=settings.LLM_FALLBACK_BACKEND or "fallback",
+        deadline=deadline,
+        hedge=hedge,
+        hedge_delay=settings.LLM_HEDGE_DELAY_SECONDS,
+        hedge_quantile=settings.LLM_HEDGE_QUANTILE,
+        min_hedge_delay=settings.LLM_HEDGE_MIN_DELAY_SECONDS,
+        breaker_failures=settings.LLM_BREAKER_FAILURES,
+        breaker_reset_seconds=settings.LLM_BREAKER_RESET_SECONDS,
+        max_workers=settings.LLM_MAX_CONCURRENCY * 4,
+    )
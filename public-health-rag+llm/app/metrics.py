@@ -0,0 +1,60 @@
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Dict
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+class Metrics:
+    """
+    In-process counters and timings. Timings keep the last `window`
+    observations per name, so percentiles reflect recent traffic.
+    """
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._timings: Dict[str, deque] = defaultdict(lambda: deque(maxlen=self.window))
+        self._started = time.time()
+
+    def increment(self, name: str, amount: float = 1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def observe(self, name: str, value: float):
+        with self._lock:
+            self._timings[name].append(value)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            timings = {name: sorted(values) for name, values in self._timings.items()}
+        return {
+            "uptime_seconds": time.time() - self._started,
+            "counters": counters,
+            "timings": {
+                name: {
+                    "count": len(values),
+                    "mean": sum(values) / len(values),
+                    "p50": _percentile(values, 0.50),
+                    "p95": _percentile(values, 0.95),
+                    "p99": _percentile(values, 0.99),
+                }
+                for name, values in timings.items() if values
+            },
+        }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._timings.clear()
+            self._started = time.time()
+
+
+metrics = Metrics()
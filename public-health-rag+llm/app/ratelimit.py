@@ -0,0 +1,291 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from enum import IntEnum
+from math import ceil
+from typing import Dict, List, Optional, Tuple
+from fastapi import HTTPException, status
+from app.config import settings
+from app.metrics import metrics
+
+
+class Priority(IntEnum):
+    """LLM work classes; lower values are served first."""
+    FIELD_QUESTION = 0  # /hsa/ask
+    BULK = 1            # handout generation
+
+
+class RateLimited(Exception):
+    """Raised when a request is over its limits; retry_after is in seconds."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def too_many_requests(e: RateLimited) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=str(e),
+        headers={"Retry-After": str(max(1, ceil(e.retry_after)))}
+    )
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class RateLimiter:
+    """
+    Token buckets keyed by arbitrary hashable keys. A bucket refills at
+    `rate` tokens per second up to `burst`. Only the most recently used
+    max_keys buckets are kept; a forgotten bucket starts full again.
+    """
+
+    def __init__(self, max_keys: int = 10000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[object, _Bucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, limits: List[Tuple[object, float, float]]) -> float:
+        """
+        Take one token from each (key, rate, burst) bucket, or from none of
+        them. Returns 0 on success, otherwise the seconds until every bucket
+        would have a token. Limits with a rate of 0 are ignored.
+        """
+        now = time.monotonic()
+        with self._lock:
+            buckets = []
+            wait = 0.0
+            for key, rate, burst in limits:
+                if rate <= 0:
+                    continue
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    bucket = self._buckets[key] = _Bucket(burst, now)
+                    if len(self._buckets) > self.max_keys:
+                        self._buckets.popitem(last=False)
+                else:
+                    self._buckets.move_to_end(key)
+                    bucket.tokens = min(burst, bucket.tokens + (now - bucket.updated) * rate)
+                    bucket.updated = now
+                if bucket.tokens < 1:
+                    wait = max(wait, (1 - bucket.tokens) / rate)
+                buckets.append(bucket)
+            if wait:
+                return wait
+            for bucket in buckets:
+                bucket.tokens -= 1
+            return 0.0
+
+
+class _Waiter:
+    __slots__ = ("user_id", "priority", "wake", "granted")
+
+    def __init__(self, user_id, priority: Priority, wake):
+        self.user_id = user_id
+        self.priority = priority
+        self.wake = wake
+        self.granted = False
+
+
+class FairScheduler:
+    """
+    Bounds concurrent LLM calls and decides who goes next when a slot frees up.
+
+    - At most max_concurrency calls run at once, and at most
+      max_per_user for any one user.
+    - Waiting FIELD_QUESTION work is always served before BULK work, but
+      BULK work may hold at most bulk_share of the slots, so questions are
+      never stuck behind a wall of handouts.
+    - Within a priority, users take turns (round robin), so one user with
+      many queued requests does not delay everyone else.
+
+    Usable from the event loop (slot) and from worker threads (slot_sync).
+    Waiters give up after queue_timeout seconds; at most max_queue wait.
+    """
+
+    def __init__(self, max_concurrency: int, max_per_user: int, bulk_share: float,
+                 queue_timeout: float, max_queue: int):
+        self.max_concurrency = max_concurrency
+        self.max_per_user = max_per_user
+        self.bulk_slots = max(1, int(max_concurrency * bulk_share))
+        self.queue_timeout = queue_timeout
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._running = 0
+        self._running_by_priority: Dict[Priority, int] = {priority: 0 for priority in Priority}
+        self._running_by_user: Dict[object, int] = {}
+        # priority -> user -> waiters; OrderedDict order is the round-robin turn order
+        self._waiting: Dict[Priority, "OrderedDict[object, deque]"] = {priority: OrderedDict() for priority in Priority}
+        self._queued = 0
+
+    def _can_run(self, user_id, priority: Priority) -> bool:
+        # Caller must hold the lock
+        return (
+            self._running < self.max_concurrency
+            and self._running_by_user.get(user_id, 0) < self.max_per_user
+            and (priority == Priority.FIELD_QUESTION or self._running_by_priority[priority] < self.bulk_slots)
+        )
+
+    def _start(self, user_id, priority: Priority):
+        self._running += 1
+        self._running_by_priority[priority] += 1
+        self._running_by_user[user_id] = self._running_by_user.get(user_id, 0) + 1
+
+    def _dispatch(self):
+        # Caller must hold the lock. Grants slots to waiters in priority and turn order.
+        for priority in Priority:
+            queues = self._waiting[priority]
+            for user_id in list(queues):
+                if self._running >= self.max_concurrency:
+                    return
+                if not self._can_run(user_id, priority):
+                    continue
+                waiter = queues[user_id].popleft()
+                self._queued -= 1
+                if queues[user_id]:
+                    queues.move_to_end(user_id)  # this user's next request waits its turn
+                else:
+                    del queues[user_id]
+                waiter.granted = True
+                self._start(user_id, priority)
+                waiter.wake()
+
+    def _enqueue(self, user_id, priority: Priority, wake) -> Optional[_Waiter]:
+        """Start immediately (returns None) or leave a waiter in the queue."""
+        with self._lock:
+            waiter = _Waiter(user_id, priority, wake)
+            self._waiting[priority].setdefault(user_id, deque()).append(waiter)
+            self._queued += 1
+            # Goes ahead only if nobody it should wait behind is eligible first
+            self._dispatch()
+            if waiter.granted:
+                return None
+            if self._queued > self.max_queue:
+                self._remove(waiter)
+                metrics.increment(f"llm.queue.{priority.name.lower()}.rejected")
+                raise RateLimited("Too many requests are waiting for the model, try again shortly", self.queue_timeout)
+            return waiter
+
+    def _remove(self, waiter: _Waiter):
+        # Caller must hold the lock
+        queue = self._waiting[waiter.priority].get(waiter.user_id)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            self._queued -= 1
+            if not queue:
+                del self._waiting[waiter.priority][waiter.user_id]
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """Remove a waiter that gave up. Returns True if it had been granted a slot meanwhile."""
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._remove(waiter)
+            return False
+
+    def _release(self, user_id, priority: Priority):
+        with self._lock:
+            self._running -= 1
+            self._running_by_priority[priority] -= 1
+            self._running_by_user[user_id] -= 1
+            if not self._running_by_user[user_id]:
+                del self._running_by_user[user_id]
+            self._dispatch()
+
+    def _timed_out(self, waiter: _Waiter):
+        if self._abandon(waiter):
+            return False
+        metrics.increment(f"llm.queue.{waiter.priority.name.lower()}.timeouts")
+        return True
+
+    def _record_wait(self, priority: Priority, started: float):
+        metrics.observe(f"llm.queue.{priority.name.lower()}.wait_seconds", time.monotonic() - started)
+
+    @asynccontextmanager
+    async def slot(self, user_id, priority: Priority):
+        started = time.monotonic()
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(True))
+
+        waiter = self._enqueue(user_id, priority, wake)
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(granted), self.queue_timeout)
+            except asyncio.TimeoutError:
+                if self._timed_out(waiter):
+                    raise RateLimited("Timed out waiting for the model, try again shortly", self.queue_timeout)
+            except asyncio.CancelledError:
+                # Client went away; hand the slot on if we already got one
+                if self._abandon(waiter):
+                    self._release(user_id, priority)
+                raise
+        self._record_wait(priority, started)
+        try:
+            yield
+        finally:
+            self._release(user_id, priority)
+
+    @contextmanager
+    def slot_sync(self, user_id, priority: Priority):
+        started = time.monotonic()
+        granted = threading.Event()
+        waiter = self._enqueue(user_id, priority, granted.set)
+        if waiter is not None and not granted.wait(self.queue_timeout):
+            if self._timed_out(waiter):
+                raise RateLimited("Timed out waiting for the model", self.queue_timeout)
+        self._record_wait(priority, started)
+        try:
+            yield
+        finally:
+            self._release(user_id, priority)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "running": self._running,
+                "max_concurrency": self.max_concurrency,
+                "running_by_priority": {p.name.lower(): n for p, n in self._running_by_priority.items()},
+                "waiting_by_priority": {
+                    p.name.lower(): sum(len(queue) for queue in self._waiting[p].values()) for p in Priority
+                },
+            }
+
+
+rate_limiter = RateLimiter()
+
+llm_scheduler = FairScheduler(
+    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+    max_per_user=settings.LLM_MAX_CONCURRENCY_PER_USER,
+    bulk_share=settings.LLM_BULK_SHARE,
+    queue_timeout=settings.LLM_QUEUE_TIMEOUT_SECONDS,
+    max_queue=settings.LLM_MAX_QUEUE,
+)
+
+
+def check_llm_rate_limit(user_id, role: str, priority: Priority):
+    """
+    Charge one LLM request to the user's, the role's and the global token
+    bucket, or raise RateLimited with the time until all three allow it.
+    """
+    per_user = settings.LLM_RATE_PER_USER_PER_MINUTE / 60
+    per_role = settings.LLM_RATE_PER_ROLE_PER_MINUTE.get(role, 0) / 60
+    per_global = settings.LLM_RATE_GLOBAL_PER_MINUTE / 60
+    wait = rate_limiter.acquire([
+        (("user", user_id, priority), per_user, settings.LLM_RATE_BURST),
+        (("role", role), per_role, max(settings.LLM_RATE_BURST, per_role * 10)),
+        (("global",), per_global, max(settings.LLM_RATE_BURST, per_global * 10)),
+    ])
+    if wait:
+        metrics.increment(f"ratelimit.{priority.name.lower()}.rejected")
+        raise RateLimited("Rate limit exceeded, try again shortly", wait)
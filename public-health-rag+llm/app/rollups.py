@@ -0,0 +1,219 @@
+"""
+Report rollups: counts per group, kept up to date as rows are written.
+
+- rollup_user_counts: users per role, district and facility
+- rollup_handout_counts: handouts per section and day
+- rollup_question_counts: questions (chat histories) per section, district and day
+
+ORM inserts, deletes and user role/facility changes adjust the rollups in
+the same transaction (mapper events below); chat histories written in bulk
+by the chat buffer go through record_questions. Changes that bypass both,
+such as raw SQL or a facility moving district, are corrected by
+rebuild_rollups, which recomputes everything from the base tables (and
+counts past questions under the HSA's current district):
+
+    python -m app.rollups
+"""
+import argparse
+import uuid
+from collections import Counter
+from datetime import date, datetime
+from typing import Dict, Iterable, Optional
+from sqlalchemy import Date, delete, event, func, inspect, select, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+from app.api.v1.models import (
+    ChatHistory, Facility, Handout, HandoutCountRollup, QuestionCountRollup, User, UserCountRollup
+)
+
+_NAMESPACE = uuid.UUID("6f1c3a52-0d8e-4b7a-9a43-2f5e8c1d7b90")
+
+# model -> (group columns, count column)
+ROLLUPS = {
+    UserCountRollup: (("role_id", "district_id", "facility_id"), "user_count"),
+    HandoutCountRollup: (("section_id", "day"), "handout_count"),
+    QuestionCountRollup: (("section_id", "district_id", "day"), "question_count"),
+}
+
+
+def rollup_id(model, group: tuple) -> uuid.UUID:
+    """Primary key of a group's row; group columns can be null, so they cannot be the key."""
+    return uuid.uuid5(_NAMESPACE, "|".join([model.__tablename__] + ["" if value is None else str(value) for value in group]))
+
+
+def _insert(connection: Connection, table):
+    if connection.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif connection.dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"Rollups need INSERT ... ON CONFLICT, not available on {connection.dialect.name}")
+    return insert(table)
+
+
+def apply_increments(connection: Connection, model, increments: Dict[tuple, int]):
+    """Add each delta to its group's count, creating the row if needed."""
+    group_columns, count_column = ROLLUPS[model]
+    rows = [
+        {"id": rollup_id(model, group), **dict(zip(group_columns, group)), count_column: delta}
+        for group, delta in increments.items() if delta
+    ]
+    if not rows:
+        return
+    # Same lock order in every transaction, so concurrent writers cannot deadlock
+    rows.sort(key=lambda row: row["id"])
+    table = model.__table__
+    statement = _insert(connection, table)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.id],
+        set_={count_column: table.c[count_column] + statement.excluded[count_column]}
+    )
+    connection.execute(statement, rows)
+
+
+def _day(value: Optional[datetime]) -> date:
+    return (value or datetime.now()).date()
+
+
+def _facility_district(connection: Connection, facility_id) -> Optional[uuid.UUID]:
+    if facility_id is None:
+        return None
+    return connection.execute(select(Facility.district_id).where(Facility.id == facility_id)).scalar()
+
+
+def _user_districts(connection: Connection, user_ids: Iterable) -> dict:
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if not user_ids:
+        return {}
+    rows = connection.execute(
+        select(User.id, Facility.district_id)
+        .join(Facility, Facility.id == User.facility_id)
+        .where(User.id.in_(user_ids))
+    )
+    return dict(rows.all())
+
+
+def record_questions(connection: Connection, rows: list):
+    """Count chat histories inserted in bulk (dicts with section_id, user_id and timestamp)."""
+    districts = _user_districts(connection, (row["user_id"] for row in rows))
+    increments = Counter(
+        (row["section_id"], districts.get(row["user_id"]), _day(row["timestamp"])) for row in rows
+    )
+    apply_increments(connection, QuestionCountRollup, increments)
+
+
+# Incremental maintenance for ORM writes
+
+def _count_user(connection: Connection, role_id, facility_id, delta: int):
+    group = (role_id, _facility_district(connection, facility_id), facility_id)
+    apply_increments(connection, UserCountRollup, {group: delta})
+
+
+@event.listens_for(User, "after_insert")
+def _user_inserted(mapper, connection, user):
+    _count_user(connection, user.role_id, user.facility_id, 1)
+
+
+@event.listens_for(User, "after_delete")
+def _user_deleted(mapper, connection, user):
+    _count_user(connection, user.role_id, user.facility_id, -1)
+
+
+@event.listens_for(User, "before_update")
+def _user_updating(mapper, connection, user):
+    state = inspect(user)
+    if not state.attrs.role_id.history.has_changes() and not state.attrs.facility_id.history.has_changes():
+        return
+    # The old values may not be loaded (e.g. expired after a commit); the row still has them
+    old_role, old_facility = connection.execute(
+        select(User.role_id, User.facility_id).where(User.id == user.id)
+    ).one()
+    if (old_role, old_facility) == (user.role_id, user.facility_id):
+        return
+    _count_user(connection, old_role, old_facility, -1)
+    _count_user(connection, user.role_id, user.facility_id, 1)
+
+
+@event.listens_for(Handout, "after_insert")
+def _handout_inserted(mapper, connection, handout):
+    apply_increments(connection, HandoutCountRollup, {(handout.section_id, _day(handout.created_at)): 1})
+
+
+@event.listens_for(Handout, "after_delete")
+def _handout_deleted(mapper, connection, handout):
+    apply_increments(connection, HandoutCountRollup, {(handout.section_id, _day(handout.created_at)): -1})
+
+
+@event.listens_for(ChatHistory, "after_insert")
+def _chat_inserted(mapper, connection, chat):
+    district = _user_districts(connection, [chat.user_id]).get(chat.user_id)
+    apply_increments(connection, QuestionCountRollup, {(chat.section_id, district, _day(chat.timestamp)): 1})
+
+
+@event.listens_for(ChatHistory, "after_delete")
+def _chat_deleted(mapper, connection, chat):
+    district = _user_districts(connection, [chat.user_id]).get(chat.user_id)
+    apply_increments(connection, QuestionCountRollup, {(chat.section_id, district, _day(chat.timestamp)): -1})
+
+
+# Full rebuild
+
+def _grouped_counts(connection: Connection):
+    users = connection.execute(
+        select(User.role_id, Facility.district_id, User.facility_id, func.count(User.id))
+        .outerjoin(Facility, Facility.id == User.facility_id)
+        .group_by(User.role_id, Facility.district_id, User.facility_id)
+    ).all()
+    handout_day = func.date(Handout.created_at, type_=Date)
+    handouts = connection.execute(
+        select(Handout.section_id, handout_day, func.count(Handout.id))
+        .group_by(Handout.section_id, handout_day)
+    ).all()
+    chat_day = func.date(ChatHistory.timestamp, type_=Date)
+    questions = connection.execute(
+        select(ChatHistory.section_id, Facility.district_id, chat_day, func.count(ChatHistory.id))
+        .outerjoin(User, User.id == ChatHistory.user_id)
+        .outerjoin(Facility, Facility.id == User.facility_id)
+        .group_by(ChatHistory.section_id, Facility.district_id, chat_day)
+    ).all()
+    return {UserCountRollup: users, HandoutCountRollup: handouts, QuestionCountRollup: questions}
+
+
+def rebuild_rollups(db: Session) -> Dict[str, int]:
+    """
+    Recompute every rollup from the base tables in one transaction. Writers
+    wait for it on Postgres, so no increment is lost or counted twice.
+    Returns the number of groups per rollup table.
+    """
+    connection = db.connection()
+    if connection.dialect.name == "postgresql":
+        tables = ", ".join(model.__tablename__ for model in ROLLUPS)
+        connection.execute(text(f"LOCK TABLE {tables} IN EXCLUSIVE MODE"))
+
+    groups = {}
+    for model, rows in _grouped_counts(connection).items():
+        counts = {tuple(row)[:-1]: row[-1] for row in rows}
+        connection.execute(delete(model))
+        apply_increments(connection, model, counts)
+        groups[model.__tablename__] = len(counts)
+    db.commit()
+    return groups
+
+
+def main():
+    from app.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Rebuild the report rollup tables from the base tables")
+    parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        groups = rebuild_rollups(db)
+    finally:
+        db.close()
+    for table, count in groups.items():
+        print(f"{table}: {count} groups")
+
+
+if __name__ == "__main__":
+    main()
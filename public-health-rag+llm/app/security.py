@@ -0,0 +1,155 @@
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Optional, Tuple
+from authlib.jose import jwt
+from passlib.context import CryptContext
+from app.config import settings
+
+# The first scheme is used for new hashes; hashes in the other schemes are
+# verified as usual and upgraded on the next successful login.
+pwd_context = CryptContext(
+    schemes=[scheme.strip() for scheme in settings.PASSWORD_SCHEMES.split(",")],
+    deprecated="auto",
+    bcrypt__rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+)
+
+# Hashing is CPU bound, so it runs on its own small pool rather than on the
+# request threads or the event loop. bcrypt and argon2 release the GIL.
+_hash_executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    thread_name_prefix="password-hash"
+)
+
+
+def _verify_and_update(password: str, hashed: Optional[str]) -> Tuple[bool, Optional[str]]:
+    if not hashed:
+        return False, None
+    return pwd_context.verify_and_update(password, hashed)
+
+
+def hash_password(password: str) -> str:
+    """Hash a password on the hashing pool, blocking the calling thread."""
+    return _hash_executor.submit(pwd_context.hash, password).result()
+
+
+def verify_password(password: str, hashed: Optional[str]) -> Tuple[bool, Optional[str]]:
+    """
+    Verify a password on the hashing pool, blocking the calling thread.
+    Returns (valid, new_hash); new_hash is set when the stored hash should be replaced.
+    """
+    return _hash_executor.submit(_verify_and_update, password, hashed).result()
+
+
+async def hash_password_async(password: str) -> str:
+    """Hash a password on the hashing pool without blocking the event loop."""
+    return await asyncio.wrap_future(_hash_executor.submit(pwd_context.hash, password))
+
+
+async def verify_password_async(password: str, hashed: Optional[str]) -> Tuple[bool, Optional[str]]:
+    """Async variant of verify_password."""
+    return await asyncio.wrap_future(_hash_executor.submit(_verify_and_update, password, hashed))
+
+
+class InvalidTokenError(Exception):
+    """Raised when a token is malformed, expired, or of the wrong type."""
+
+
+class TokenCache:
+    """
+    Bounded LRU cache of validated token claims.
+
+    Entries are dropped once the token expires, so a cached token is never
+    accepted for longer than the token itself is valid.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            claims, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return claims
+
+    def put(self, token: str, claims: dict, expires_at: float):
+        with self._lock:
+            self._entries[token] = (claims, expires_at)
+            self._entries.move_to_end(token)
+            if len(self._entries) > self.max_size:
+                self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _evict(self):
+        # Caller must hold the lock. Expired tokens go first, then the least recently used.
+        now = time.time()
+        expired = [token for token, (_, expires_at) in self._entries.items() if expires_at <= now]
+        for token in expired:
+            del self._entries[token]
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+token_cache = TokenCache(max_size=settings.TOKEN_CACHE_SIZE)
+
+
+def create_token(data: dict, expires_delta: timedelta, token_type: str = "access") -> str:
+    """Sign a JWT carrying data plus iat/exp (epoch seconds) and a type claim."""
+    now = int(time.time())
+    payload = data.copy()
+    payload.update({
+        "type": token_type,
+        "iat": now,
+        "exp": now + int(expires_delta.total_seconds()),
+    })
+    encoded = jwt.encode({"alg": settings.ALGORITHM}, payload, settings.JWT_SECRET_KEY)
+    return encoded.decode() if isinstance(encoded, bytes) else encoded
+
+
+def token_hash(token: str) -> str:
+    """Hex SHA-256 of a token, for storing it without the token itself."""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def decode_token(token: str, token_type: str = "access") -> dict:
+    """
+    Return the validated claims of a token, decoding it only on a cache miss.
+    Raises InvalidTokenError if the signature, expiry or type is not valid,
+    or the token lacks the type and iat claims every current token carries.
+    """
+    claims = token_cache.get(token)
+    if claims is None:
+        try:
+            decoded = jwt.decode(token, settings.JWT_SECRET_KEY)
+            decoded.validate()
+        except Exception as e:
+            raise InvalidTokenError(str(e))
+
+        if decoded.get("exp") is None:
+            raise InvalidTokenError("Token has no expiry")
+        if decoded.get("type") is None or decoded.get("iat") is None:
+            # Issued before tokens were typed; a refresh token could pass as an access token
+            raise InvalidTokenError("Token has no type or issue time")
+
+        claims = dict(decoded)
+        token_cache.put(token, claims, float(claims["exp"]))
+
+    if claims["type"] != token_type:
+        raise InvalidTokenError(f"Expected a {token_type} token")
+    return claims
@@ -0,0 +1,51 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller (the
+    leader) starts fn, callers arriving while it is in flight await the same
+    result or exception. Nothing is cached; once the call finishes the next
+    caller starts a new one.
+
+    fn runs in its own task, so a caller that disconnects does not cancel
+    the call for everyone sharing it. Keys are per event loop, i.e. per
+    worker process.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.upstream_calls = 0
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self.calls += 1
+        task = self._in_flight.get(key)
+        if task is None:
+            self.upstream_calls += 1
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        return await asyncio.shield(task)
+
+    def _finished(self, key: Hashable, task: asyncio.Task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            task.exception()  # retrieved here in case every caller went away
+
+    def snapshot(self) -> dict:
+        coalesced = self.calls - self.upstream_calls
+        return {
+            "calls": self.calls,
+            "upstream_calls": self.upstream_calls,
+            "coalesced": coalesced,
+            "coalescing_ratio": coalesced / self.calls if self.calls else 0.0,
+            "in_flight": len(self._in_flight),
+        }
+
+
+# Identical questions asked in the same section at the same time
+ask_flights = SingleFlight("hsa.ask")
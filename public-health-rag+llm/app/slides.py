@@ -0,0 +1,51 @@
+import hashlib
+import re
+from typing import List
+
+# Generated handouts separate slides with a "---" line (see handout_template)
+SLIDE_SEPARATOR = re.compile(r"^[ \t]*-{3,}[ \t]*$", re.MULTILINE)
+HEADING = re.compile(r"^[ \t]*#{1,6}[ \t]+(.+?)[ \t#]*$", re.MULTILINE)
+MAX_TITLE_LENGTH = 120
+
+
+def slide_title(text: str) -> str:
+    """First markdown heading of a slide, else its first non-empty line."""
+    match = HEADING.search(text)
+    if match:
+        title = match.group(1)
+    else:
+        title = next((line for line in text.splitlines() if line.strip()), "")
+    return re.sub(r"[*_`#]+", "", title).strip()[:MAX_TITLE_LENGTH]
+
+
+def build_slide_index(content: str) -> List[dict]:
+    """
+    Character offsets [start, end) and title of every non-empty slide in
+    content, so a single slide can be read without the rest of the handout.
+    """
+    slides = []
+    start = 0
+    for separator in list(SLIDE_SEPARATOR.finditer(content)) + [None]:
+        end = separator.start() if separator else len(content)
+        text = content[start:end]
+        if text.strip():
+            # Trim surrounding whitespace so offsets cover the slide text only
+            left = len(text) - len(text.lstrip())
+            right = len(text.rstrip())
+            slides.append({"start": start + left, "end": start + right, "title": slide_title(text)})
+        if separator:
+            start = separator.end()
+    return slides
+
+
+def handout_etag(title: str, content: str) -> str:
+    """Strong validator for a handout; handouts are not edited once saved."""
+    return hashlib.sha256(f"{title}\0{content}".encode()).hexdigest()[:32]
+
+
+def handout_detail_etag(etag: str, instructor_name: str, section_name: str) -> str:
+    """
+    Validator for the full handout response, which also carries the
+    instructor's and section's current names; those can be renamed.
+    """
+    return hashlib.sha256(f"{etag}\0{instructor_name}\0{section_name}".encode()).hexdigest()[:32]
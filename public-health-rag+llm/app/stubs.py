@@ -0,0 +1,135 @@
+import hashlib
+import math
+import random
+import threading
+import time
+from typing import Any, Iterable, List, Optional, Tuple
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import Generation, LLMResult
+from langchain_core.vectorstores import VectorStore
+from pydantic import PrivateAttr
+
+# Deterministic stand-ins for the LLM, embeddings and vector store, selected
+# with LLM_BACKEND=stub. They make no network calls, so the API can be load
+# tested offline (see loadtest/); only their latency is modelled.
+
+
+class LatencyModel:
+    """Log-normal latency with the given median and 95th percentile, in milliseconds."""
+
+    def __init__(self, median_ms: float, p95_ms: float, seed: int = 0):
+        self.mu = math.log(max(median_ms, 1e-3) / 1000)
+        self.sigma = math.log(max(p95_ms, median_ms) / max(median_ms, 1e-3)) / 1.645
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self) -> float:
+        with self._lock:
+            return self._random.lognormvariate(self.mu, self.sigma)
+
+    def sleep(self):
+        time.sleep(self.sample())
+
+
+def _digest(text: str) -> bytes:
+    return hashlib.sha256(text.encode()).digest()
+
+
+def stub_answer(prompt: str) -> str:
+    """Same prompt, same answer. Handout prompts get a multi-slide handout of realistic size."""
+    key = _digest(prompt).hex()[:8]
+    if "handout" in prompt.lower():
+        slides = [
+            f"## Slide {n}\n\n" + " ".join(f"Point {n}.{i} of stub handout {key} on surveillance and response." for i in range(1, 9))
+            for n in range(1, 11)
+        ]
+        return "\n\n---\n\n".join(slides)
+    if "title" in prompt.lower():
+        return f"Stub Handout Title {key}"
+    return f"Stub answer {key}: report suspected cases to the district health office within 24 hours and follow the IDSR case definitions."
+
+
+class StubLLM(LLM):
+    median_ms: float = 800
+    p95_ms: float = 2500
+    seed: int = 0
+    _latency: LatencyModel = PrivateAttr()
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._latency = LatencyModel(self.median_ms, self.p95_ms, self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, **kwargs: Any) -> str:
+        return self._generate([prompt], stop=stop).generations[0][0].text
+
+    def _generate(self, prompts: List[str], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> LLMResult:
+        self._latency.sleep()
+        texts = [stub_answer(prompt) for prompt in prompts]
+        return LLMResult(
+            generations=[[Generation(text=text)] for text in texts],
+            llm_output={"token_usage": {
+                "prompt_tokens": sum(len(prompt.split()) for prompt in prompts),
+                "completion_tokens": sum(len(text.split()) for text in texts),
+            }},
+        )
+
+
+class StubEmbeddings(Embeddings):
+    """Hash-based vectors; identical texts get identical embeddings."""
+
+    def __init__(self, dimensions: int = 16, latency: Optional[LatencyModel] = None):
+        self.dimensions = dimensions
+        self.latency = latency
+
+    def _embed(self, text: str) -> List[float]:
+        digest = _digest(text)
+        return [(digest[i % len(digest)] - 127.5) / 127.5 for i in range(self.dimensions)]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency:
+            self.latency.sleep()
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class StubVectorStore(VectorStore):
+    """Returns k synthetic IDSR passages for any query, after a retrieval delay."""
+
+    def __init__(self, embedding: Embeddings, latency: Optional[LatencyModel] = None):
+        self._embedding = embedding
+        self.latency = latency
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, **kwargs: Any) -> List[str]:
+        return [_digest(text).hex()[:16] for text in texts]
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None, **kwargs: Any):
+        return cls(embedding)
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        self._embedding.embed_query(query)
+        if self.latency:
+            self.latency.sleep()
+        key = _digest(query).hex()[:8]
+        return [
+            (Document(page_content=f"IDSR guideline passage {n} for {key}: " + "surveillance " * 60), 0.9)
+            for n in range(k)
+        ]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [document for document, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def _similarity_search_with_relevance_scores(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score(query, k, **kwargs)
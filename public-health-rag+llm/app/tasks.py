@@ -1,50 +1,123 @@
-# @router.post("/generate-handout", response_model=HandoutResponse)
-# async def generate_handout(
-#     query: HandoutQuery,
-#     db: Session = Depends(get_db),
-#     current_user: Users = Depends(get_current_user)
-# ):
-#     # Ensure user is an instructor
-#     check_is_instructor(current_user)
-
-#     # Fetch the section
-#     section = db.query(Section).filter_by(id=query.section_id).first()
-#     if not section:
-#         raise HTTPException(status_code=404, detail="Section not found")
-
-#     # Generate handout content using LLM and vector store
-#     qa = RetrievalQA.from_chain_type(
-#         llm=llm,
-#         chain_type="stuff",
-#         retriever=vector_store.as_retriever(search_kwargs={'k': 5}),
-#         chain_type_kwargs={"prompt": PROMPT}
-#     )
-
-#     # Invoke LLM to get handout content
-#     response = qa.invoke(query.topic)
-#     handout_content = response.get('result')
-    
-#     if not handout_content:
-#         raise HTTPException(status_code=500, detail="Failed to generate handout content")
-
-#     # Create and save new handout in the database
-#     new_handout = Handout(
-#         title=query.topic,
-#         content=handout_content,
-#         created_by_id=current_user.id,
-#         section_id=query.section_id,
-#         created_at=datetime.now()
-#     )
-#     db.add(new_handout)
-#     db.commit()
-#     db.refresh(new_handout)
-
-#     # Return the newly created handout in the same format as the HandoutResponse model
-#     return HandoutResponse(
-#         id=new_handout.id,
-#         instructor_name=current_user.fullname,
-#         title=new_handout.title,
-#         content=new_handout.content,
-#         section_name=section.name,
-#         created_at=new_handout.created_at
-#     )
\ No newline at end of file
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from app.api.v1.schemas import JobStatus
+from app.config import settings
+from app.database import SessionLocal
+
+
+class JobLimitExceeded(Exception):
+    """Raised when an owner already has the maximum number of jobs in flight."""
+
+
+class Job:
+    def __init__(self, owner_id, key, params=None):
+        self.id = uuid.uuid4()
+        self.owner_id = owner_id
+        self.key = key
+        # What the owner submitted, as they sent it; the key may be normalized
+        self.params = params or {}
+        self.status = JobStatus.QUEUED
+        self.result = None
+        self.error = None
+        self.created_at = datetime.now()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def in_flight(self):
+        return self.status in (JobStatus.QUEUED, JobStatus.RUNNING)
+
+
+class JobQueue:
+    """
+    In-process background job queue backed by a bounded thread pool.
+
+    Jobs an owner submits with the same key while one of them is still in
+    flight are deduplicated: the owner gets the existing job back instead of
+    a new one. Jobs of different owners are never shared, since a job's
+    result (e.g. a saved handout) belongs to its owner.
+    Each job function receives its own database session, which is committed
+    by the job itself and closed by the queue.
+    """
+
+    def __init__(self, max_workers: int, max_jobs_per_owner: int, retention_minutes: int):
+        self.max_jobs_per_owner = max_jobs_per_owner
+        self.retention = timedelta(minutes=retention_minutes)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def submit(self, owner_id, key, fn, params=None):
+        """Enqueue fn(db) and return (job, created)."""
+        with self._lock:
+            self._prune()
+
+            existing_id = self._in_flight.get((owner_id, key))
+            if existing_id is not None:
+                return self._jobs[existing_id], False
+
+            owner_jobs = sum(1 for job in self._jobs.values() if job.owner_id == owner_id and job.in_flight)
+            if owner_jobs >= self.max_jobs_per_owner:
+                raise JobLimitExceeded(
+                    f"Only {self.max_jobs_per_owner} jobs may be in progress at a time"
+                )
+
+            job = Job(owner_id=owner_id, key=key, params=params)
+            self._jobs[job.id] = job
+            self._in_flight[(owner_id, key)] = job.id
+
+        self._executor.submit(self._run, job, fn)
+        return job, True
+
+    def get(self, job_id, owner_id):
+        """The job, or None if it does not exist or belongs to someone else."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        return job if job is not None and job.owner_id == owner_id else None
+
+    def list_for_owner(self, owner_id):
+        with self._lock:
+            jobs = [job for job in self._jobs.values() if job.owner_id == owner_id]
+        return sorted(jobs, key=lambda job: job.created_at, reverse=True)
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, job, fn):
+        job.status = JobStatus.RUNNING
+        job.started_at = datetime.now()
+        db = SessionLocal()
+        try:
+            job.result = fn(db)
+            job.status = JobStatus.SUCCEEDED
+        except Exception as e:
+            db.rollback()
+            job.error = getattr(e, "detail", None) or str(e) or e.__class__.__name__
+            job.status = JobStatus.FAILED
+        finally:
+            db.close()
+            job.finished_at = datetime.now()
+            with self._lock:
+                if self._in_flight.get((job.owner_id, job.key)) == job.id:
+                    del self._in_flight[(job.owner_id, job.key)]
+
+    def _prune(self):
+        # Caller must hold the lock
+        cutoff = datetime.now() - self.retention
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if not job.in_flight and job.finished_at and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+# Queue used for handout generation
+handout_jobs = JobQueue(
+    max_workers=settings.HANDOUT_JOB_WORKERS,
+    max_jobs_per_owner=settings.HANDOUT_JOBS_PER_INSTRUCTOR,
+    retention_minutes=settings.HANDOUT_JOB_RETENTION_MINUTES,
+)
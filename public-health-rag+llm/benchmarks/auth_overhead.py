@@ -0,0 +1,57 @@
+"""
+Per-request authentication overhead.
+
+Measures the cost of turning a bearer token into the caller's identity:
+decoding and validating the JWT on every request versus the claims cache
+in app.security.
+
+Run from the project root:
+    python -m benchmarks.auth_overhead --requests 20000
+"""
+import argparse
+import time
+import uuid
+from datetime import timedelta
+from authlib.jose import jwt
+from app.config import settings
+from app.security import create_token, decode_token, token_cache
+
+
+def per_request_us(fn, requests: int) -> float:
+    start = time.perf_counter()
+    for _ in range(requests):
+        fn()
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark token verification overhead")
+    parser.add_argument("--requests", type=int, default=20000, help="Requests to simulate per case")
+    parser.add_argument("--users", type=int, default=500, help="Distinct tokens in rotation")
+    args = parser.parse_args()
+
+    tokens = [
+        create_token(
+            {"sub": f"user{i}@example.com", "role": "hsa", "user_id": str(uuid.uuid4())},
+            timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+        )
+        for i in range(args.users)
+    ]
+
+    counter = iter(range(10 ** 12))
+
+    def uncached():
+        claims = jwt.decode(tokens[next(counter) % len(tokens)], settings.JWT_SECRET_KEY)
+        claims.validate()
+
+    def cached():
+        decode_token(tokens[next(counter) % len(tokens)])
+
+    token_cache.clear()
+    print(f"decode every request : {per_request_us(uncached, args.requests):8.1f} us/request")
+    print(f"claims cache (cold)  : {per_request_us(cached, len(tokens)):8.1f} us/request")
+    print(f"claims cache (warm)  : {per_request_us(cached, args.requests):8.1f} us/request")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Stand-in for an OpenAI-compatible model server, for failover testing.
+
+Serves POST /v1/chat/completions with canned answers (the same ones as the
+stub backend) after a lognormal delay, and can be made to misbehave:
+
+- --error-rate: fraction of requests answered with HTTP 500
+- --stall-rate: fraction of requests held for --stall-seconds before
+  answering, like a provider that accepts the request and then hangs
+
+Point LLM_BACKEND=openai (OPENAI_BASE_URL) or LLM_FALLBACK_BACKEND=local_http
+(LOCAL_LLM_BASE_URL) at it; see benchmarks.load_test for a full example.
+
+Run from the project root:
+    python -m benchmarks.llm_standin --port 8101 --median-ms 900 --p95-ms 6000 --error-rate 0.05
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from app.stubs import LatencyModel, stub_answer
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    latency: LatencyModel = None
+    error_rate = 0.0
+    stall_rate = 0.0
+    stall_seconds = 120.0
+    rng = random.Random(0)
+    rng_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass  # one line per request drowns the load test output
+
+    def _send_json(self, status: int, body: dict):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        with self.rng_lock:
+            roll = self.rng.random()
+        if roll < self.stall_rate:
+            time.sleep(self.stall_seconds)
+        else:
+            self.latency.sleep()
+        if self.stall_rate <= roll < self.stall_rate + self.error_rate:
+            self._send_json(500, {"error": {"message": "Simulated upstream error", "type": "server_error"}})
+            return
+
+        prompt = "\n".join(str(message.get("content", "")) for message in request.get("messages", []))
+        answer = stub_answer(prompt)
+        self._send_json(200, {
+            "id": f"chatcmpl-standin-{int(time.time() * 1000)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "standin"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": answer},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": len(prompt.split()),
+                "completion_tokens": len(answer.split()),
+                "total_tokens": len(prompt.split()) + len(answer.split()),
+            },
+        })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stand-in server with injectable slowness and errors")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8101)
+    parser.add_argument("--median-ms", type=float, default=800)
+    parser.add_argument("--p95-ms", type=float, default=2500)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that get HTTP 500")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="Fraction of requests that hang")
+    parser.add_argument("--stall-seconds", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    StandinHandler.latency = LatencyModel(args.median_ms, args.p95_ms, seed=args.seed)
+    StandinHandler.error_rate = args.error_rate
+    StandinHandler.stall_rate = args.stall_rate
+    StandinHandler.stall_seconds = args.stall_seconds
+    StandinHandler.rng = random.Random(args.seed + 1)
+
+    server = ThreadingHTTPServer((args.host, args.port), StandinHandler)
+    server.daemon_threads = True
+    print(f"LLM stand-in on http://{args.host}:{args.port}/v1 "
+          f"(median {args.median_ms:.0f} ms, p95 {args.p95_ms:.0f} ms, "
+          f"errors {args.error_rate:.0%}, stalls {args.stall_rate:.0%})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Seed a throwaway database for load testing.
+
+Migrates the schema to the latest revision and fills it with the real
+roles, sections, districts and facilities plus synthetic users, handouts,
+chat histories and FAQs. Every
+seeded account uses the password "loadtest"; emails are
+hsa<n>@loadtest.example.com, instructor<n>@loadtest.example.com and
+admin<n>@loadtest.example.com. After seeding, the first HSA is checked to be
+able to log in: its email passes the login schema and the password verifies.
+
+Refuses to run unless DATABASE_URL is set, so it can never write to the
+production database. Run from the project root:
+    DATABASE_URL=sqlite:///./loadtest.db python -m benchmarks.seed_loadtest --reset
+"""
+import argparse
+import json
+import random
+import sys
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import insert, text
+from app.config import settings
+from app.database import Base, SessionLocal, engine
+from app.api.v1.models import FAQ, ChatHistory, District, Facility, Handout, Role, Section, User
+from app.api.v1.schemas import LoginRequest
+from app.rollups import rebuild_rollups
+from app.security import hash_password, verify_password
+from migrations import upgrade
+from sections import populate_sections
+
+PASSWORD = "loadtest"
+FACILITIES_FILE = "data/health_facilities/districts_facilities_data.json"
+
+
+def email(role: str, n: int) -> str:
+    return f"{role}{n}@loadtest.example.com"
+
+
+def seed(db, hsas: int, instructors: int, admins: int, handouts: int, chats: int, faqs: int = 0, seed: int = 0):
+    rng = random.Random(seed)
+    # One hash for everyone: hashing thousands of passwords would dominate seeding
+    hashed = hash_password(PASSWORD)
+
+    roles = {name: Role(id=uuid.uuid4(), name=name) for name in ("admin", "instructor", "hsa")}
+    db.add_all(roles.values())
+
+    with open(FACILITIES_FILE) as f:
+        data = json.load(f)
+    db.add_all(District(id=uuid.UUID(d["id"]), name=d["name"]) for d in data["districts"])
+    facilities = [
+        Facility(
+            id=uuid.UUID(f["id"]),
+            name=f["name"],
+            facility_type=f["facility_type"],
+            managing_authority=f["managing_authority"],
+            urban_rural=f["urban_rural"],
+            district_id=uuid.UUID(f["district_id"])
+        )
+        for f in data["facilities"]
+    ]
+    db.add_all(facilities)
+    db.commit()
+
+    populate_sections(db)
+    section_ids = [section.id for section in db.query(Section).all()]
+
+    def users(role, count, **kwargs):
+        return [
+            User(
+                id=uuid.uuid4(),
+                fullname=f"Load Test {role.title()} {n}",
+                email=email(role, n),
+                phone=f"+26599{n:07d}",
+                password=hashed,
+                role_id=roles[role].id,
+                is_active=True,
+                **kwargs
+            )
+            for n in range(count)
+        ]
+
+    hsa_users = users("hsa", hsas)
+    for user in hsa_users:
+        user.facility_id = rng.choice(facilities).id
+    instructor_users = users("instructor", instructors)
+    db.add_all(hsa_users + instructor_users + users("admin", admins))
+    db.commit()
+
+    now = datetime.now()
+    body = "\n\n---\n\n".join(f"## Slide {n}\n\n" + "Key point on surveillance and response. " * 40 for n in range(1, 11))
+    db.add_all(
+        Handout(
+            title=f"Load Test Handout {n}",
+            content=body,
+            created_at=now - timedelta(minutes=n),
+            created_by_id=rng.choice(instructor_users).id,
+            section_id=rng.choice(section_ids)
+        )
+        for n in range(handouts if instructor_users else 0)
+    )
+    # Chats in bulk, skipping the per-row rollup events; the rebuild below counts them
+    chat_histories = [
+        {
+            "id": uuid.uuid4(),
+            "question": f"What is the case definition for priority disease {n % 50}?",
+            "response": "Report suspected cases to the district health office within 24 hours. " * 3,
+            "timestamp": now - timedelta(seconds=n * 30),
+            "section_id": rng.choice(section_ids),
+            "user_id": rng.choice(hsa_users).id,
+        }
+        for n in range(chats if hsa_users else 0)
+    ]
+    if chat_histories:
+        db.execute(insert(ChatHistory), chat_histories)
+    db.add_all(
+        FAQ(
+            question=chat["question"],
+            answer=chat["response"],
+            frequency=rng.randint(1, 20),
+            chat_history_id=chat["id"],
+            hsa_id=chat["user_id"]
+        )
+        for chat in rng.sample(chat_histories, min(faqs, len(chat_histories)))
+    )
+    db.commit()
+    rebuild_rollups(db)
+
+
+def smoke_check(db):
+    """Fail unless the first seeded HSA could log in: /auth/login validates the email before any lookup."""
+    login = LoginRequest(email=email("hsa", 0), password=PASSWORD)
+    user = db.query(User).filter(User.email == login.email).first()
+    if user is None or not user.is_active or not verify_password(login.password, user.password)[0]:
+        sys.exit(f"Smoke check failed: {login.email} cannot log in with the seeded password")
+
+
+def reset_schema():
+    """Drop every table, then migrate the empty database to the latest revision."""
+    Base.metadata.drop_all(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(text("DROP TABLE IF EXISTS alembic_version"))
+    upgrade()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed a database for load testing")
+    parser.add_argument("--reset", action="store_true", help="Drop and recreate all tables first")
+    parser.add_argument("--hsas", type=int, default=200)
+    parser.add_argument("--instructors", type=int, default=20)
+    parser.add_argument("--admins", type=int, default=2)
+    parser.add_argument("--handouts", type=int, default=500)
+    parser.add_argument("--chats", type=int, default=5000)
+    parser.add_argument("--faqs", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if not settings.DATABASE_URL:
+        sys.exit("DATABASE_URL is not set; refusing to seed the default database")
+
+    if args.reset:
+        reset_schema()
+    else:
+        upgrade()
+
+    db = SessionLocal()
+    try:
+        if db.query(User).filter(User.email == email("hsa", 0)).first():
+            print("Database already seeded, use --reset to start over")
+            return
+        seed(db, args.hsas, args.instructors, args.admins, args.handouts, args.chats, args.faqs, args.seed)
+        if args.hsas:
+            smoke_check(db)
+    finally:
+        db.close()
+    print(f"Seeded {args.hsas} HSAs, {args.instructors} instructors, {args.admins} admins, "
+          f"{args.handouts} handouts, {args.chats} chats and {args.faqs} FAQs (password '{PASSWORD}')")
+
+
+if __name__ == "__main__":
+    main()
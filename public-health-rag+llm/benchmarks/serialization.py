@@ -0,0 +1,130 @@
+"""
+Response serialization and compression benchmark.
+
+Serves synthetic payloads shaped like the heaviest endpoints (handout list
+and detail with full multi-slide content, /admin/users?role=hsa and
+/admin/chats) from a minimal FastAPI app in two ways:
+
+- before: JSONResponse with Pydantic models built one object at a time
+- after: dicts returned through ORJSONResponse (the app default)
+
+and reports server time per response plus bytes on the wire uncompressed,
+gzip (level 6) and brotli (quality 4, when installed), as the compression
+middleware in app.middleware would send them.
+
+Run from the project root:
+    python -m benchmarks.serialization --users 2000 --chats 5000 --requests 50
+"""
+import argparse
+import gzip
+import time
+import uuid
+from datetime import datetime, timedelta
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.testclient import TestClient
+from app.api.v1.schemas import ChatHistoryResponse, HandoutResponse, UserResponse
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def make_payloads(users: int, chats: int, handouts: int):
+    now = datetime.now()
+    content = "\n\n---\n\n".join(
+        f"## Slide {n}\n\n" + "- Report suspected cases to the district health office within 24 hours.\n" * 12
+        for n in range(1, 11)
+    )
+    handout_rows = [
+        {
+            "id": uuid.uuid4(), "instructor_name": f"Instructor {n % 20}", "instructor_id": uuid.uuid4(),
+            "title": f"Handout {n}", "content": content, "section_name": "Analyse Data",
+            "created_at": now - timedelta(minutes=n),
+        }
+        for n in range(handouts)
+    ]
+    user_rows = [
+        {
+            "id": uuid.uuid4(), "fullname": f"HSA {n}", "email": f"hsa{n}@example.org", "phone": f"+26599{n:07d}",
+            "role": "HSA", "is_active": True, "facility_name": f"Health Centre {n % 567}", "facility_id": uuid.uuid4(),
+            "district_name": f"District {n % 30}", "facility_type": "Health Centre",
+            "managing_authority": "Government", "urban_rural": "Rural",
+        }
+        for n in range(users)
+    ]
+    chat_rows = [
+        {
+            "id": uuid.uuid4(), "question": f"What is the case definition for priority disease {n % 50}?",
+            "response": "Report suspected cases to the district health office within 24 hours. " * 3,
+            "timestamp": now - timedelta(seconds=30 * n), "section_id": uuid.uuid4(), "user_id": uuid.uuid4(),
+        }
+        for n in range(chats)
+    ]
+    return {
+        "handouts (list of 5)": (HandoutResponse, handout_rows[:5]),
+        "handouts (list of 50)": (HandoutResponse, handout_rows),
+        "handout detail": (HandoutResponse, handout_rows[0]),
+        f"admin users ({users})": (UserResponse, user_rows),
+        f"admin chats ({chats})": (ChatHistoryResponse, chat_rows),
+    }
+
+
+def build_app(payloads):
+    app = FastAPI()
+    for n, (schema, rows) in enumerate(payloads.values()):
+        many = isinstance(rows, list)
+        model = list[schema] if many else schema
+
+        def before(schema=schema, rows=rows, many=many):
+            return [schema(**row) for row in rows] if many else schema(**rows)
+
+        def after(rows=rows):
+            return ORJSONResponse(rows)
+
+        app.add_api_route(f"/before/{n}", before, response_model=model, response_class=JSONResponse)
+        app.add_api_route(f"/after/{n}", after, response_model=model)
+    return app
+
+
+def timed(client, path, requests):
+    client.get(path)  # warm up
+    start = time.perf_counter()
+    for _ in range(requests):
+        response = client.get(path)
+    return (time.perf_counter() - start) / requests * 1000, response.content
+
+
+def compressed_sizes(body: bytes):
+    sizes = {"raw": len(body), "gzip": len(gzip.compress(body, compresslevel=6))}
+    if brotli is not None:
+        sizes["br"] = len(brotli.compress(body, quality=4))
+    return sizes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark JSON serialization and compression of large responses")
+    parser.add_argument("--users", type=int, default=2000, help="HSAs in the /admin/users payload")
+    parser.add_argument("--chats", type=int, default=5000, help="Chats in the /admin/chats payload")
+    parser.add_argument("--handouts", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=50, help="Requests timed per case")
+    args = parser.parse_args()
+
+    payloads = make_payloads(args.users, args.chats, args.handouts)
+    client = TestClient(build_app(payloads))
+
+    print(f"{'payload':24} {'before ms':>10} {'after ms':>10} {'speedup':>8} {'raw KB':>9} {'gzip KB':>9} {'br KB':>9}")
+    for n, name in enumerate(payloads):
+        before_ms, _ = timed(client, f"/before/{n}", args.requests)
+        after_ms, body = timed(client, f"/after/{n}", args.requests)
+        sizes = compressed_sizes(body)
+        br = f"{sizes['br'] / 1024:9.1f}" if "br" in sizes else "        -"
+        print(f"{name:24} {before_ms:10.2f} {after_ms:10.2f} {before_ms / after_ms:7.1f}x "
+              f"{sizes['raw'] / 1024:9.1f} {sizes['gzip'] / 1024:9.1f} {br}")
+    if brotli is None:
+        print("brotli is not installed (pip install Brotli); only gzip sizes shown")
+
+
+if __name__ == "__main__":
+    main()
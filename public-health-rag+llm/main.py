@@ -1,5 +1,5 @@
 from fastapi import FastAPI, APIRouter
-from fastapi.responses import RedirectResponse
+from fastapi.responses import ORJSONResponse, RedirectResponse
 from app.api.v1.endpoints import (
     auth,
     chat, 
@@ -11,11 +11,33 @@ from app.api.v1.endpoints import (
     location,
     user
     )
-from app.middleware import add_cors_middleware
+from app.middleware import add_compression_middleware, add_cors_middleware
+from app.tasks import handout_jobs
+from app.chat_buffer import chat_buffer
+from app.database import async_engine
 
 
-app = FastAPI(title="IDSR", version="1.0.0")
+app = FastAPI(title="IDSR", version="1.0.0", default_response_class=ORJSONResponse)
 add_cors_middleware(app)
+add_compression_middleware(app)
+
+
+@app.on_event("shutdown")
+def shutdown_background_jobs():
+    # Let queued handout jobs finish and persist before the worker exits
+    handout_jobs.shutdown(wait=True)
+
+
+@app.on_event("shutdown")
+def flush_chat_histories():
+    # Persist chat histories still waiting in the write-behind buffer
+    chat_buffer.stop()
+
+
+@app.on_event("shutdown")
+async def close_async_connections():
+    await async_engine.dispose()
+
 
 router = APIRouter()
 @router.get("/",include_in_schema=False)
@@ -0,0 +1,37 @@
+"""
+Versioned schema migrations (Alembic), configured in code: no alembic.ini,
+the database is the one app.database connects to (DATABASE_URL or Supabase).
+
+    python -m migrations upgrade            # to the latest revision
+    python -m migrations current
+    python -m migrations revision -m "add x" --autogenerate
+"""
+from pathlib import Path
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import inspect
+
+# The schema before migrations existed, as create_all made it
+BASELINE = "0001"
+
+
+def alembic_config() -> Config:
+    config = Config()
+    config.set_main_option("script_location", str(Path(__file__).parent))
+    return config
+
+
+def upgrade(revision: str = "head"):
+    """
+    Upgrade to the revision. A database created by create_all before
+    migrations existed is first stamped at the baseline, so only the
+    later revisions run against it.
+    """
+    from app.database import engine
+
+    config = alembic_config()
+    tables = inspect(engine).get_table_names()
+    if "alembic_version" not in tables and "users" in tables:
+        print(f"Existing schema without migration history, stamping it at {BASELINE}")
+        command.stamp(config, BASELINE)
+    command.upgrade(config, revision)
@@ -0,0 +1,35 @@
+import argparse
+from alembic import command
+from migrations import alembic_config, upgrade
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m migrations", description="Database schema migrations")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("upgrade", help="upgrade to a revision (default: the latest)").add_argument("revision", nargs="?", default="head")
+    commands.add_parser("downgrade", help="downgrade to a revision, e.g. -1").add_argument("revision")
+    commands.add_parser("stamp", help="record a revision without running it").add_argument("revision")
+    commands.add_parser("current", help="show the database's revision")
+    commands.add_parser("history", help="list the revisions")
+    revision = commands.add_parser("revision", help="create a revision file")
+    revision.add_argument("-m", "--message", required=True)
+    revision.add_argument("--autogenerate", action="store_true", help="diff the models against the database")
+    args = parser.parse_args()
+
+    config = alembic_config()
+    if args.command == "upgrade":
+        upgrade(args.revision)
+    elif args.command == "downgrade":
+        command.downgrade(config, args.revision)
+    elif args.command == "stamp":
+        command.stamp(config, args.revision)
+    elif args.command == "current":
+        command.current(config, verbose=True)
+    elif args.command == "history":
+        command.history(config)
+    else:
+        command.revision(config, message=args.message, autogenerate=args.autogenerate)
+
+
+if __name__ == "__main__":
+    main()
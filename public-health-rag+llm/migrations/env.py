@@ -0,0 +1,35 @@
+from alembic import context
+from app.database import Base, engine
+import app.api.v1.models  # noqa: F401 registers the tables on Base.metadata
+
+target_metadata = Base.metadata
+
+
+def run_migrations_offline():
+    # SQL script output (upgrade --sql), without connecting
+    context.configure(
+        url=engine.url.render_as_string(hide_password=False),
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    with engine.connect() as connection:
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            # SQLite (load tests) can only alter tables by copying them
+            render_as_batch=connection.dialect.name == "sqlite",
+        )
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,114 @@
+"""Baseline: the schema as create_all made it before migrations
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "roles",
+        sa.Column("id", sa.UUID(), nullable=False),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("name"),
+    )
+    op.create_index("ix_roles_id", "roles", ["id"])
+    op.create_table(
+        "districts",
+        sa.Column("id", sa.UUID(), nullable=False),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_table(
+        "sections",
+        sa.Column("id", sa.UUID(), nullable=False),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_table(
+        "facilities",
+        sa.Column("id", sa.UUID(), nullable=False),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("facility_type", sa.String(), nullable=False),
+        sa.Column("managing_authority", sa.String(), nullable=False),
+        sa.Column("urban_rural", sa.String(), nullable=False),
+        sa.Column("district_id", sa.UUID(), nullable=True),
+        sa.ForeignKeyConstraint(["district_id"], ["districts.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_table(
+        "users",
+        sa.Column("id", sa.UUID(), nullable=False),
+        sa.Column("fullname", sa.String(), nullable=False),
+        sa.Column("email", sa.String(), nullable=False),
+        sa.Column("phone", sa.String(), nullable=True),
+        sa.Column("password", sa.String(), nullable=True),
+        sa.Column("role_id", sa.UUID(), nullable=True),
+        sa.Column("is_active", sa.Boolean(), nullable=True),
+        sa.Column("facility_id", sa.UUID(), nullable=True),
+        sa.Column("otp", sa.String(), nullable=True),
+        sa.Column("otp_expires_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["facility_id"], ["facilities.id"]),
+        sa.ForeignKeyConstraint(["role_id"], ["roles.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("email"),
+    )
+    op.create_table(
+        "handouts",
+        sa.Column("id", sa.UUID(), nullable=False),
+        sa.Column("title", sa.String(), nullable=False),
+        sa.Column("content", sa.Text(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("created_by_id", sa.UUID(), nullable=True),
+        sa.Column("section_id", sa.UUID(), nullable=True),
+        sa.ForeignKeyConstraint(["created_by_id"], ["users.id"]),
+        sa.ForeignKeyConstraint(["section_id"], ["sections.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_handouts_id", "handouts", ["id"])
+    op.create_table(
+        "chat_histories",
+        sa.Column("id", sa.UUID(), nullable=False),
+        sa.Column("question", sa.String(), nullable=False),
+        sa.Column("response", sa.String(), nullable=False),
+        sa.Column("timestamp", sa.DateTime(), nullable=True),
+        sa.Column("section_id", sa.UUID(), nullable=True),
+        sa.Column("user_id", sa.UUID(), nullable=True),
+        sa.ForeignKeyConstraint(["section_id"], ["sections.id"]),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_table(
+        "faqs",
+        sa.Column("id", sa.UUID(), nullable=False),
+        sa.Column("question", sa.String(), nullable=False),
+        sa.Column("answer", sa.String(), nullable=False),
+        sa.Column("frequency", sa.Integer(), nullable=True),
+        sa.Column("chat_history_id", sa.UUID(), nullable=True),
+        sa.Column("hsa_id", sa.UUID(), nullable=True),
+        sa.ForeignKeyConstraint(["chat_history_id"], ["chat_histories.id"]),
+        sa.ForeignKeyConstraint(["hsa_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+
+
+def downgrade():
+    op.drop_table("faqs")
+    op.drop_table("chat_histories")
+    op.drop_index("ix_handouts_id", table_name="handouts")
+    op.drop_table("handouts")
+    op.drop_table("users")
+    op.drop_table("facilities")
+    op.drop_table("sections")
+    op.drop_table("districts")
+    op.drop_index("ix_roles_id", table_name="roles")
+    op.drop_table("roles")
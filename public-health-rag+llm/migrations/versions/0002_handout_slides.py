@@ -0,0 +1,31 @@
+"""Handout slide index and ETag columns
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+
+Databases stamped at the baseline may already have them, added by hand or
+by create_all; only what is missing is added.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    columns = {column["name"] for column in sa.inspect(op.get_bind()).get_columns("handouts")}
+    with op.batch_alter_table("handouts") as batch:
+        if "slide_index" not in columns:
+            batch.add_column(sa.Column("slide_index", sa.JSON(), nullable=True))
+        if "etag" not in columns:
+            batch.add_column(sa.Column("etag", sa.String(length=32), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table("handouts") as batch:
+        batch.drop_column("etag")
+        batch.drop_column("slide_index")
@@ -0,0 +1,63 @@
+"""Report rollup tables, filled from the base tables
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19
+
+Writes keep the rollups up to date from this revision on, so they are
+filled here, in the same transaction that creates them. Tables already
+made by create_all are kept and refilled.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+ROLLUP_TABLES = {
+    "rollup_user_counts": [
+        sa.Column("role_id", sa.UUID(), nullable=True),
+        sa.Column("district_id", sa.UUID(), nullable=True),
+        sa.Column("facility_id", sa.UUID(), nullable=True),
+        sa.Column("user_count", sa.Integer(), nullable=False),
+    ],
+    "rollup_handout_counts": [
+        sa.Column("section_id", sa.UUID(), nullable=True),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("handout_count", sa.Integer(), nullable=False),
+    ],
+    "rollup_question_counts": [
+        sa.Column("section_id", sa.UUID(), nullable=True),
+        sa.Column("district_id", sa.UUID(), nullable=True),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("question_count", sa.Integer(), nullable=False),
+    ],
+}
+DAY_INDEXES = {
+    "ix_rollup_handout_counts_day": "rollup_handout_counts",
+    "ix_rollup_question_counts_day": "rollup_question_counts",
+}
+
+
+def upgrade():
+    from app.rollups import rebuild_rollups
+
+    tables = set(sa.inspect(op.get_bind()).get_table_names())
+    for table, columns in ROLLUP_TABLES.items():
+        if table not in tables:
+            op.create_table(table, sa.Column("id", sa.UUID(), nullable=False), *columns, sa.PrimaryKeyConstraint("id"))
+    for index, table in DAY_INDEXES.items():
+        op.create_index(index, table, ["day"], if_not_exists=True)
+
+    # The session joins the migration's transaction, so its commit does not end it
+    rebuild_rollups(Session(bind=op.get_bind()))
+
+
+def downgrade():
+    for index, table in DAY_INDEXES.items():
+        op.drop_index(index, table_name=table)
+    for table in ROLLUP_TABLES:
+        op.drop_table(table)
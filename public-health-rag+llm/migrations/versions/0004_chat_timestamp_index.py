@@ -0,0 +1,28 @@
+"""Index on chat_histories (timestamp, id) for the analytics batches
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19
+
+app.analytics reads chats in (timestamp, id) order after a watermark. On
+Postgres the index is built CONCURRENTLY, so chats keep being written.
+"""
+from alembic import op
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    with op.get_context().autocommit_block():
+        op.create_index("ix_chat_histories_timestamp_id", "chat_histories", ["timestamp", "id"],
+                        if_not_exists=True, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_chat_histories_timestamp_id", table_name="chat_histories", if_exists=True,
+                      postgresql_concurrently=True)
@@ -0,0 +1,47 @@
+"""Secondary indexes for the hot queries
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19
+
+benchmarks/query_plans.py checks that the queries they serve use them. On
+Postgres they are built CONCURRENTLY, so writes to the tables carry on while
+they build; indexes that already exist (created by hand) are left alone.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+# name -> (table, columns, options)
+INDEXES = {
+    "ix_users_role_id": ("users", ["role_id"], {}),
+    "ix_users_phone": ("users", ["phone"], {}),
+    "ix_users_facility_id": ("users", ["facility_id"], {}),
+    "ix_facilities_district_id": ("facilities", ["district_id"], {}),
+    "ix_handouts_created_at": ("handouts", ["created_at"], {}),
+    "ix_handouts_created_by_id_created_at": ("handouts", ["created_by_id", "created_at"], {}),
+    "ix_handouts_section_id_created_at": ("handouts", ["section_id", "created_at"], {}),
+    "ix_chat_histories_user_section_timestamp": ("chat_histories", ["user_id", "section_id", "timestamp"], {}),
+    "ix_chat_histories_section_timestamp": ("chat_histories", ["section_id", "timestamp"], {}),
+    "ix_faqs_hsa_id": ("faqs", ["hsa_id"], {}),
+    "ix_faqs_chat_history_id": ("faqs", ["chat_history_id"], {}),
+    # fallback_answer matches the normalized question; hash, as questions can outgrow a btree entry
+    "ix_faqs_question_normalized": ("faqs", [sa.text("lower(trim(question))")], {"postgresql_using": "hash"}),
+}
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    with op.get_context().autocommit_block():
+        for name, (table, columns, options) in INDEXES.items():
+            op.create_index(name, table, columns, if_not_exists=True, postgresql_concurrently=True, **options)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, (table, columns, options) in INDEXES.items():
+            op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=True)
@@ -0,0 +1,32 @@
+"""Refresh tokens already exchanged
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19
+
+/auth/refresh/ rotates refresh tokens; the hashes of used ones are kept
+until they expire, so each can be exchanged only once.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if "used_refresh_tokens" not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table(
+            "used_refresh_tokens",
+            sa.Column("token_hash", sa.String(length=64), nullable=False),
+            sa.Column("expires_at", sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint("token_hash"),
+        )
+    op.create_index("ix_used_refresh_tokens_expires_at", "used_refresh_tokens", ["expires_at"], if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index("ix_used_refresh_tokens_expires_at", table_name="used_refresh_tokens", if_exists=True)
+    op.drop_table("used_refresh_tokens")